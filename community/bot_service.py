@@ -16,3 +16,18 @@ class BotService:
              reply_text += "Ref: " + ", ".join([s['title'] for s in answer_data['sources']])
         
         return reply_text
+
+    @staticmethod
+    def reuse_reply(original, similarity):
+        """
+        Reply to a duplicate question with the bot answer of an earlier thread.
+
+        Returns:
+            The reply text, or None if the original has no bot comment
+        """
+        answer = original.comments.filter(is_bot=True).order_by('created_at').values_list('content', flat=True).first()
+        if answer is None:
+            return None
+        reply_text = f"🤖 **(Auto-Bot)**: This looks like a question that was already answered in "
+        reply_text += f"\"{original.title}\" (post #{original.pk}, {similarity:.0%} similar). Here is the answer from that thread:\n\n"
+        return reply_text + answer
@@ -0,0 +1,89 @@
+"""
+Community feed queries.
+
+The feed shows posts newest first, each with its most recent comments (at
+most COMMUNITY_COMMENTS_PER_POST, fetched for the whole page in one
+prefetch query) and the total comment count (an annotation, not a query
+per post).
+
+Clients keep a ``since`` token of the form ``<last post id>-<last comment
+id>`` and ask ``updates_since`` for what was added after it, so the page
+picks up new posts and bot replies without reloading.
+"""
+
+from django.conf import settings
+from django.db.models import Count, Max, Prefetch
+
+from .models import Comment, Post
+
+MAX_UPDATES = 100  # beyond this, clients are told to reload instead
+
+
+def comments_per_post():
+    return getattr(settings, 'COMMUNITY_COMMENTS_PER_POST', 5)
+
+
+def feed_queryset():
+    """Posts with ``comment_count`` and their latest comments in ``recent_comments``."""
+    recent = Comment.objects.order_by('-created_at', '-id')[:comments_per_post()]
+    return (
+        Post.objects.select_related('duplicate_of')
+        .annotate(comment_count=Count('comments'))
+        .prefetch_related(Prefetch('comments', queryset=recent, to_attr='recent_comments'))
+    )
+
+
+def since_token():
+    """Token describing the newest post and comment right now."""
+    latest = Post.objects.aggregate(post=Max('id'))['post'] or 0
+    latest_comment = Comment.objects.aggregate(comment=Max('id'))['comment'] or 0
+    return f"{latest}-{latest_comment}"
+
+
+def parse_since(token):
+    """(post id, comment id) from a since token; raises ValueError if malformed."""
+    post_id, comment_id = (int(part) for part in token.split('-'))
+    if post_id < 0 or comment_id < 0:
+        raise ValueError(token)
+    return post_id, comment_id
+
+
+def updates_since(token):
+    """
+    Posts and comments added after ``token``.
+
+    Returns:
+        Dict with 'posts' (new posts, oldest first, annotated like the feed),
+        'comments' (new comments on older posts, oldest first), 'counts'
+        ({post id: comment count} for the posts those comments belong to),
+        'since' (the token to use next) and 'reset' (True when there is
+        too much to send and the client should reload)
+    """
+    post_id, comment_id = parse_since(token)
+    posts = list(feed_queryset().filter(id__gt=post_id).order_by('id')[:MAX_UPDATES + 1])
+    comments = list(
+        Comment.objects.filter(id__gt=comment_id, post_id__lte=post_id).order_by('id')[:MAX_UPDATES + 1]
+    )
+    if len(posts) > MAX_UPDATES or len(comments) > MAX_UPDATES:
+        return {'posts': [], 'comments': [], 'counts': {}, 'since': since_token(), 'reset': True}
+
+    counts = {}
+    if comments:
+        counts = dict(
+            Comment.objects.filter(post_id__in={c.post_id for c in comments})
+            .values('post_id').annotate(count=Count('id')).values_list('post_id', 'count')
+        )
+
+    next_post = posts[-1].id if posts else post_id
+    next_comment = max(
+        [comment_id]
+        + [c.id for c in comments]
+        + [c.id for post in posts for c in post.recent_comments]
+    )
+    return {
+        'posts': posts,
+        'comments': comments,
+        'counts': counts,
+        'since': f"{next_post}-{next_comment}",
+        'reset': False,
+    }
@@ -0,0 +1,42 @@
+"""
+Django management command to (re)build the community post embedding index.
+Usage: python manage.py index_posts [--clear]
+
+New posts are indexed when they are created; run this once to backfill
+existing posts.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from community.models import Post
+from community.post_index import get_post_store, post_text
+
+
+class Command(BaseCommand):
+    help = 'Index community posts for duplicate-question detection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Clear the posts index first')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        store = get_post_store()
+        if store is None:
+            raise CommandError('Vector store not available. Install chromadb and sentence-transformers.')
+        if options['clear']:
+            store.clear_collection()
+
+        documents = []
+        count = 0
+        for post in Post.objects.filter(duplicate_of__isnull=True).iterator(chunk_size=500):
+            documents.append({'id': post.pk, 'text': post_text(post), 'metadata': {'answered': post.has_bot_reply}})
+            if len(documents) >= options['batch_size']:
+                store.collection.delete(ids=[str(doc['id']) for doc in documents])
+                store.add_documents_batch(documents)
+                count += len(documents)
+                documents = []
+        if documents:
+            store.collection.delete(ids=[str(doc['id']) for doc in documents])
+            store.add_documents_batch(documents)
+            count += len(documents)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexed {count} posts'))
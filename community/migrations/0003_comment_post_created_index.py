@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('community', '0002_post_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at'], name='community_c_post_id_bea033_idx'),
+        ),
+    ]
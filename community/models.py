@@ -9,6 +9,8 @@ class Post(models.Model):
     
     # For bot trigger status
     has_bot_reply = models.BooleanField(default=False)
+    # Set when the bot answered by pointing to an earlier, already answered question
+    duplicate_of = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='duplicates')
 
     def __str__(self):
         return self.title
@@ -20,5 +22,10 @@ class Comment(models.Model):
     is_bot = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at']),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author_name} on {self.post.title}"
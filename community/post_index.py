@@ -0,0 +1,91 @@
+"""
+Embedding index over community posts, used to spot questions that were
+already asked and answered.
+
+Posts live in their own Chroma collection (``community_posts``, cosine
+distance) next to the course materials; each entry carries an ``answered``
+flag so lookups only consider threads the bot has replied to.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+
+from courses.vector_store import AVAILABLE as VECTOR_STORE_AVAILABLE
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'community_posts'
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_post_store():
+    """Shared VectorStoreService over the posts collection, or None if unavailable."""
+    global _store
+    if not VECTOR_STORE_AVAILABLE:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from courses.vector_store import VectorStoreService
+
+                store = VectorStoreService(COLLECTION_NAME)
+                if store.collection is None or store.embedding_model is None:
+                    return None
+                _store = store
+    return _store
+
+
+def post_text(post):
+    return f"{post.title}\n\n{post.content}"
+
+
+def index_post(post):
+    """Add or refresh a post in the index (duplicates are not indexed; their original is)."""
+    store = get_post_store()
+    if store is None or post.duplicate_of_id:
+        return
+    try:
+        store.update_document(post.pk, post_text(post), {'answered': post.has_bot_reply})
+    except Exception as e:
+        logger.error(f"Failed to index post {post.pk}: {e}")
+
+
+def remove_post(post_id):
+    store = get_post_store()
+    if store is None:
+        return
+    try:
+        store.delete_document(post_id)
+    except Exception as e:
+        logger.error(f"Failed to remove post {post_id} from the index: {e}")
+
+
+def find_answered_duplicate(post, threshold=None):
+    """
+    The most similar earlier post that already has a bot reply, if it is close enough.
+
+    Returns:
+        (Post, similarity) or None
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'COMMUNITY_DUPLICATE_THRESHOLD', 0.85)
+    store = get_post_store()
+    if store is None:
+        return None
+
+    results = store.search(post_text(post), n_results=3, filter_metadata={'answered': True}, include_text=False)
+    for result in results:
+        post_id = int(result['id'])
+        similarity = 1.0 - result['distance']
+        if post_id == post.pk or similarity < threshold:
+            continue
+        original = Post.objects.filter(pk=post_id, has_bot_reply=True).first()
+        if original is not None:
+            return original, similarity
+    return None
@@ -7,8 +7,25 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 class PostSerializer(serializers.ModelSerializer):
-    comments = CommentSerializer(many=True, read_only=True)
+    """
+    Feed querysets (community.feed) carry ``recent_comments`` and
+    ``comment_count``; otherwise all comments are serialized.
+    """
+    comments = serializers.SerializerMethodField()
+    comment_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
         fields = '__all__'
+        read_only_fields = ['duplicate_of']
+
+    def get_comments(self, obj):
+        recent = getattr(obj, 'recent_comments', None)
+        if recent is None:
+            return CommentSerializer(obj.comments.all(), many=True).data
+        # Prefetched newest first; show them in reading order
+        return CommentSerializer(reversed(recent), many=True).data
+
+    def get_comment_count(self, obj):
+        count = getattr(obj, 'comment_count', None)
+        return obj.comments.count() if count is None else count
@@ -1,3 +1,68 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from . import feed
+from .feed import since_token, updates_since
+from .models import Comment, Post
+
+
+class UpdatesSinceTests(TestCase):
+    def setUp(self):
+        self.old_post = Post.objects.create(title='Old', content='old post')
+        self.old_comment = Comment.objects.create(post=self.old_post, content='first')
+        self.token = since_token()
+
+    def test_nothing_new_keeps_the_token(self):
+        updates = updates_since(self.token)
+        self.assertEqual((updates['posts'], updates['comments'], updates['reset']), ([], [], False))
+        self.assertEqual(updates['since'], self.token)
+
+    def test_new_posts_and_comments_on_older_posts(self):
+        reply = Comment.objects.create(post=self.old_post, content='reply', is_bot=True)
+        new_post = Post.objects.create(title='New', content='new post')
+        Comment.objects.create(post=new_post, content='on the new post')
+        last = Comment.objects.create(post=new_post, content='another')
+
+        updates = updates_since(self.token)
+        self.assertEqual(updates['posts'], [new_post])
+        self.assertEqual(updates['posts'][0].comment_count, 2)
+        # Comments on new posts arrive with the post, not again as comments
+        self.assertEqual(updates['comments'], [reply])
+        self.assertEqual(updates['counts'], {self.old_post.id: 2})
+        # The cursor moves past the new post's comments, so the next call is empty
+        self.assertEqual(updates['since'], f"{new_post.id}-{last.id}")
+        self.assertEqual(updates_since(updates['since'])['posts'], [])
+        self.assertEqual(updates_since(updates['since'])['comments'], [])
+
+    def test_too_many_updates_asks_for_a_reload(self):
+        with mock.patch.object(feed, 'MAX_UPDATES', 2):
+            for i in range(3):
+                Comment.objects.create(post=self.old_post, content=f"reply {i}")
+            updates = updates_since(self.token)
+        self.assertTrue(updates['reset'])
+        self.assertEqual((updates['posts'], updates['comments']), ([], []))
+        self.assertEqual(updates['since'], since_token())
+
+    def test_malformed_tokens_are_rejected(self):
+        for token in ('', '12', '12-x', '-1-4', '1-2-3'):
+            with self.assertRaises(ValueError):
+                updates_since(token)
+
+
+class UpdatesEndpointTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create(username='student'))
+
+    def test_malformed_since_is_a_bad_request(self):
+        response = self.client.get('/community/api/posts/updates/', {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+    def test_returns_posts_after_the_token(self):
+        token = since_token()
+        post = Post.objects.create(title='Question?', content='How do heaps work?')
+        data = self.client.get('/community/api/posts/updates/', {'since': token}).json()
+        self.assertEqual([row['id'] for row in data['posts']], [post.id])
+        self.assertEqual(data['since'], f"{post.id}-0")
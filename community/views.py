@@ -1,13 +1,46 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
+from django.db.models import Count
 from django.views.generic import TemplateView
 from .models import Post, Comment
 from .serializers import PostSerializer, CommentSerializer
 from .bot_service import BotService
+from .feed import feed_queryset, since_token, updates_since
+from .pagination import PostCursorPagination
+from .post_index import find_answered_duplicate, index_post, remove_post
 
 class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().order_by('-created_at')
+    """
+    The list is cursor-paginated with each post's latest comments and a
+    comment count; ``updates/?since=<token>`` returns only what was added
+    after a token from a previous response or the rendered feed.
+    """
+    queryset = Post.objects.all()
     serializer_class = PostSerializer
+    pagination_class = PostCursorPagination
+
+    def get_queryset(self):
+        if self.action == 'list':
+            return feed_queryset()
+        return Post.objects.select_related('duplicate_of').annotate(
+            comment_count=Count('comments')
+        ).prefetch_related('comments')
+
+    @action(detail=False)
+    def updates(self, request):
+        try:
+            updates = updates_since(request.query_params.get('since', ''))
+        except ValueError:
+            return Response({'error': 'since must be a token like "12-40"'}, status=400)
+        return Response({
+            'posts': PostSerializer(updates['posts'], many=True).data,
+            'comments': CommentSerializer(updates['comments'], many=True).data,
+            'counts': updates['counts'],
+            'since': updates['since'],
+            'reset': updates['reset'],
+        })
 
     def perform_create(self, serializer):
         post = serializer.save()
@@ -15,7 +48,17 @@ class PostViewSet(viewsets.ModelViewSet):
         # Trigger Bot (Bonus Task: Bot Support)
         # In a real app, this would be a celery task. Here we do it inline for simplicity.
         if "?" in post.title or "?" in post.content:
-            reply_content = BotService.generate_reply(post.content)
+            # Reuse the answer of a near-identical, already answered question before calling the LLM
+            reply_content = None
+            match = find_answered_duplicate(post)
+            if match:
+                original, similarity = match
+                original = original.duplicate_of or original
+                reply_content = BotService.reuse_reply(original, similarity)
+                if reply_content:
+                    post.duplicate_of = original
+            if reply_content is None:
+                reply_content = BotService.generate_reply(post.content)
             Comment.objects.create(
                 post=post,
                 author_name="EduBot",
@@ -25,6 +68,13 @@ class PostViewSet(viewsets.ModelViewSet):
             post.has_bot_reply = True
             post.save()
 
+        index_post(post)
+
+    def perform_destroy(self, instance):
+        post_id = instance.pk
+        super().perform_destroy(instance)
+        remove_post(post_id)
+
 class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
@@ -34,5 +84,24 @@ class CommunityUIView(TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['posts'] = Post.objects.all().order_by('-created_at')
+        page_size = getattr(settings, 'COMMUNITY_FEED_PAGE_SIZE', 20)
+        # Taken before the page is read: anything added meanwhile shows up in the first poll
+        context['since'] = since_token()
+        posts = feed_queryset().order_by('-id')
+        before = self.request.GET.get('before', '')
+        if before.isdigit():
+            posts = posts.filter(id__lt=int(before))
+        posts = list(posts[:page_size + 1])
+
+        # Keyset "older posts" link: one extra row tells whether there is a next page
+        context['next_before'] = posts[page_size - 1].id if len(posts) > page_size else None
+        context['posts'] = [self.with_comments_in_order(post) for post in posts[:page_size]]
+        context['is_first_page'] = not before
+        context['poll_interval'] = getattr(settings, 'COMMUNITY_FEED_POLL_INTERVAL', 15)
         return context
+
+    @staticmethod
+    def with_comments_in_order(post):
+        post.recent_comments = post.recent_comments[::-1]
+        post.hidden_comments = post.comment_count - len(post.recent_comments)
+        return post
@@ -55,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "allauth.account.middleware.AccountMiddleware",
+    'courses.middleware.TracingMiddleware',
+    'courses.middleware.ProfilingMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -106,10 +108,65 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
-DATABASES = {
+# DB_ENGINE=postgres for production (several workers plus background writers).
+# SQLite stays the dev default, tuned so concurrent writers wait instead of
+# failing with "database is locked".
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    # Pooling needs psycopg 3 with the pool extra; otherwise each worker
+    # thread keeps one persistent connection (CONN_MAX_AGE)
+    DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'buet_learning'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Pooled connections are returned to the pool, so they must not persist
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),  # seconds to wait for a free connection
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db_v2.sqlite3'),
+            'OPTIONS': {
+                # Seconds a writer waits for the lock (SQLite busy_timeout)
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+                # Take the write lock at BEGIN so the busy timeout applies instead
+                # of failing immediately on a read-to-write lock upgrade
+                'transaction_mode': 'IMMEDIATE',
+                # WAL lets readers run alongside the writer; NORMAL sync is safe with WAL
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))};"
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+
+# Cache (graph payload, dashboard stats, ...). Point CACHE_BACKEND at a shared
+# backend such as Redis in production so invalidation reaches every worker.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db_v2.sqlite3',
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'buet-learning-platform'),
     }
 }
 
@@ -147,3 +204,112 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # API Keys
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+# AI generation cache (quizzes, flashcards, video scripts)
+GENERATION_CACHE_ENABLED = os.getenv('GENERATION_CACHE_ENABLED', 'True') == 'True'
+GENERATION_CACHE_TTL = int(os.getenv('GENERATION_CACHE_TTL', 7 * 24 * 3600))  # seconds before an entry is revalidated
+GENERATION_CACHE_STALE_WHILE_REVALIDATE = os.getenv('GENERATION_CACHE_STALE_WHILE_REVALIDATE', 'True') == 'True'
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv('GENERATION_CACHE_MAX_ENTRIES', 2000))
+GENERATION_CACHE_MAX_BYTES = int(os.getenv('GENERATION_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+
+# Worker threads for in-process background tasks
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 4))
+
+# Handwritten note digitization
+DIGITIZATION_MAX_DIMENSION = int(os.getenv('DIGITIZATION_MAX_DIMENSION', 1600))  # longest side in px sent to Gemini
+DIGITIZATION_JPEG_QUALITY = int(os.getenv('DIGITIZATION_JPEG_QUALITY', 80))
+DIGITIZATION_MAX_PAGES = int(os.getenv('DIGITIZATION_MAX_PAGES', 20))
+DIGITIZATION_STALE_SECONDS = int(os.getenv('DIGITIZATION_STALE_SECONDS', 600))  # unfinished jobs are requeued/failed after this
+
+# Knowledge graph
+GRAPH_SIMILARITY_LINKS = int(os.getenv('GRAPH_SIMILARITY_LINKS', 2))  # similarity edges per material
+GRAPH_SIMILARITY_MIN_SCORE = float(os.getenv('GRAPH_SIMILARITY_MIN_SCORE', 0.5))
+GRAPH_CACHE_TIMEOUT = int(os.getenv('GRAPH_CACHE_TIMEOUT', 24 * 3600))
+
+# Vector store: keep a copy of each document's text in Chroma. Off by default;
+# passages are resolved from CourseMaterial in one batched query instead.
+VECTOR_STORE_DOCUMENTS = os.getenv('VECTOR_STORE_DOCUMENTS', 'False') == 'True'
+
+# Compact vector index built by `manage.py build_vector_index` (float16/int8,
+# optional PCA); used for unfiltered semantic search when present
+VECTOR_INDEX_ENABLED = os.getenv('VECTOR_INDEX_ENABLED', 'True') == 'True'
+VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', str(BASE_DIR / 'vector_index'))
+VECTOR_INDEX_RESCORE_FACTOR = int(os.getenv('VECTOR_INDEX_RESCORE_FACTOR', 4))  # candidates per result rescored in full precision
+
+# Semantic related materials (precomputed by compute_related_materials, then updated on save)
+RELATED_MATERIALS_TOP_K = int(os.getenv('RELATED_MATERIALS_TOP_K', 5))
+RELATED_MATERIALS_MIN_SCORE = float(os.getenv('RELATED_MATERIALS_MIN_SCORE', 0.0))
+RELATED_MATERIALS_CANDIDATES = int(os.getenv('RELATED_MATERIALS_CANDIDATES', 50))  # nearest documents checked on each save
+RELATED_MATERIALS_AUTO_UPDATE = os.getenv('RELATED_MATERIALS_AUTO_UPDATE', 'True') == 'True'
+
+# Near-duplicate materials (MinHash estimate of Jaccard similarity of word shingles)
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.8))
+
+# Community posts: reuse the bot reply of an answered question at least this similar (cosine)
+COMMUNITY_DUPLICATE_THRESHOLD = float(os.getenv('COMMUNITY_DUPLICATE_THRESHOLD', 0.85))
+
+# Community feed
+COMMUNITY_FEED_PAGE_SIZE = int(os.getenv('COMMUNITY_FEED_PAGE_SIZE', 20))
+COMMUNITY_COMMENTS_PER_POST = int(os.getenv('COMMUNITY_COMMENTS_PER_POST', 5))  # latest comments shown per post
+COMMUNITY_FEED_POLL_INTERVAL = int(os.getenv('COMMUNITY_FEED_POLL_INTERVAL', 15))  # seconds between update checks
+
+# Chat sessions: prompt size is fixed regardless of conversation length (tokens estimated at ~4 chars each)
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv('CHAT_PROMPT_TOKEN_BUDGET', 3000))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv('CHAT_HISTORY_TOKEN_BUDGET', 800))  # summary + recent turns, part of the above
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv('CHAT_SUMMARY_MAX_TOKENS', 250))
+CHAT_TURN_MAX_TOKENS = int(os.getenv('CHAT_TURN_MAX_TOKENS', 200))  # per previous answer quoted in the prompt
+CHAT_RECENT_TURNS = int(os.getenv('CHAT_RECENT_TURNS', 3))
+CHAT_QUERY_MAX_TOKENS = int(os.getenv('CHAT_QUERY_MAX_TOKENS', 500))
+CHAT_RETRIEVAL_CACHE_TIMEOUT = int(os.getenv('CHAT_RETRIEVAL_CACHE_TIMEOUT', 3600))
+
+# Offline encyclopedic context (manage.py ingest_references); live Wikipedia is only asked if enabled
+REFERENCE_STORE_PATH = os.getenv('REFERENCE_STORE_PATH', str(BASE_DIR / 'reference_store'))
+REFERENCE_MIN_SIMILARITY = float(os.getenv('REFERENCE_MIN_SIMILARITY', 0.5))  # cosine, for the embedding fallback
+WIKIPEDIA_LIVE_FALLBACK = os.getenv('WIKIPEDIA_LIVE_FALLBACK', 'False') == 'True'
+
+# Circuit breakers for Chroma, the embedder, Gemini and Wikipedia (per process, see /healthz)
+CIRCUIT_BREAKER_WINDOW = int(os.getenv('CIRCUIT_BREAKER_WINDOW', 60))  # seconds of call outcomes considered
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', 5))
+CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv('CIRCUIT_BREAKER_FAILURE_RATE', 0.5))
+CIRCUIT_BREAKER_OPEN_SECONDS = int(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', 30))  # before a probe call
+
+# Grounding check of generated answers and notes (courses.validation)
+GROUNDING_SUPPORT_THRESHOLD = float(os.getenv('GROUNDING_SUPPORT_THRESHOLD', 0.55))  # cosine similarity to a source window
+GROUNDING_LEXICAL_THRESHOLD = float(os.getenv('GROUNDING_LEXICAL_THRESHOLD', 0.5))  # share of words found, without an embedder
+GROUNDING_MIN_SUPPORTED = float(os.getenv('GROUNDING_MIN_SUPPORTED', 0.7))  # supported sentences for "grounded"
+GROUNDING_MAX_WINDOWS = int(os.getenv('GROUNDING_MAX_WINDOWS', 64))
+GROUNDING_NLI_MODEL = os.getenv('GROUNDING_NLI_MODEL', '')  # e.g. cross-encoder/nli-deberta-v3-xsmall; empty disables
+GROUNDING_NLI_ENTAILMENT_INDEX = int(os.getenv('GROUNDING_NLI_ENTAILMENT_INDEX', 1))
+GROUNDING_BORDERLINE_MARGIN = float(os.getenv('GROUNDING_BORDERLINE_MARGIN', 0.1))
+
+# LLM usage metering (events are buffered and batch-inserted in the background)
+USAGE_METERING_ENABLED = os.getenv('USAGE_METERING_ENABLED', 'True') == 'True'
+USAGE_METER_BATCH_SIZE = int(os.getenv('USAGE_METER_BATCH_SIZE', 50))
+USAGE_METER_FLUSH_INTERVAL = int(os.getenv('USAGE_METER_FLUSH_INTERVAL', 10))  # seconds
+
+# Homepage dashboard counters (invalidated by signals; the timeout is only a safety net)
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 3600))
+DASHBOARD_AI_USAGE_TIMEOUT = int(os.getenv('DASHBOARD_AI_USAGE_TIMEOUT', 60))  # seconds; other workers' usage shows up after this
+
+# Stage tracing and the Prometheus /metrics endpoint
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'True') == 'True'
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', 0.1))  # fraction of requests timed
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # if set, /metrics requires "Authorization: Bearer <token>"; else staff only (or DEBUG)
+
+# Request profiler (off unless PROFILER_ENABLED=True)
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'False') == 'True'
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 0.0))  # fraction of requests profiled
+PROFILER_PATHS = [p for p in os.getenv('PROFILER_PATHS', '').split(',') if p]  # path prefixes always profiled
+PROFILER_MODE = os.getenv('PROFILER_MODE', 'sampling')  # sampling or cprofile
+PROFILER_FORMAT = os.getenv('PROFILER_FORMAT', 'speedscope')  # speedscope or collapsed (sampling mode)
+PROFILER_INTERVAL = float(os.getenv('PROFILER_INTERVAL', 0.005))  # seconds between samples
+PROFILER_OUTPUT_DIR = os.getenv('PROFILER_OUTPUT_DIR', str(BASE_DIR / 'profiles'))
+PROFILER_MAX_FILES = int(os.getenv('PROFILER_MAX_FILES', 50))
+
+# Cold-start budget checked by `manage.py check_import_time`
+IMPORT_TIME_BUDGET_MS = int(os.getenv('IMPORT_TIME_BUDGET_MS', 500))
+
+# Search suggestions (/api/suggest/)
+SUGGEST_MIN_QUERY_COUNT = int(os.getenv('SUGGEST_MIN_QUERY_COUNT', 2))  # times a question must be asked before it is suggested
+SUGGEST_MAX_QUERIES = int(os.getenv('SUGGEST_MAX_QUERIES', 5000))
+SUGGEST_REBUILD_INTERVAL = int(os.getenv('SUGGEST_REBUILD_INTERVAL', 300))  # seconds; picks up changes from other workers
@@ -1,13 +1,64 @@
 from django.contrib import admin
-from .models import CourseMaterial, Topic
+from .models import CourseMaterial, Topic, GeneratedContent, PregeneratedContent, DigitizationJob, RelatedMaterial, LLMUsageEvent, UsageCounter, Tag, PopularQuery
+from .generation_cache import GenerationCache
 
 @admin.register(CourseMaterial)
 class CourseMaterialAdmin(admin.ModelAdmin):
     list_display = ('title', 'category', 'file_type', 'week', 'topic', 'created_at')
     list_filter = ('category', 'file_type', 'week', 'topic')
-    search_fields = ('title', 'description', 'tags')
+    search_fields = ('title', 'description', '=normalized_tags__name')
 
 @admin.register(Topic)
 class TopicAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
     search_fields = ('name',)
+
+@admin.register(GeneratedContent)
+class GeneratedContentAdmin(admin.ModelAdmin):
+    list_display = ('query', 'generator', 'prompt_version', 'hits', 'misses', 'size_bytes', 'refreshed_at', 'last_accessed_at')
+    list_filter = ('generator', 'prompt_version')
+    search_fields = ('query',)
+    readonly_fields = ('cache_key', 'source_ids', 'source_hash', 'hits', 'misses', 'size_bytes', 'created_at', 'refreshed_at', 'last_accessed_at')
+    change_list_template = "admin/courses/generatedcontent/change_list.html"
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['cache_stats'] = GenerationCache.stats()
+        return super().changelist_view(request, extra_context=extra_context)
+
+@admin.register(PregeneratedContent)
+class PregeneratedContentAdmin(admin.ModelAdmin):
+    list_display = ('topic', 'generator', 'variant', 'prompt_version', 'created_at')
+    list_filter = ('generator', 'topic')
+
+@admin.register(DigitizationJob)
+class DigitizationJobAdmin(admin.ModelAdmin):
+    list_display = ('batch_id', 'page', 'user', 'status', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('batch_id', 'image_hash')
+    readonly_fields = ('image_hash', 'created_at', 'updated_at')
+
+@admin.register(RelatedMaterial)
+class RelatedMaterialAdmin(admin.ModelAdmin):
+    list_display = ('material', 'related', 'score', 'rank')
+    list_select_related = ('material', 'related')
+
+@admin.register(LLMUsageEvent)
+class LLMUsageEventAdmin(admin.ModelAdmin):
+    list_display = ('endpoint', 'model_name', 'latency_ms', 'prompt_tokens', 'completion_tokens', 'cache_hit', 'rate_limited', 'success', 'created_at')
+    list_filter = ('endpoint', 'cache_hit', 'rate_limited', 'success')
+    date_hierarchy = 'created_at'
+
+@admin.register(UsageCounter)
+class UsageCounterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'value')
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+@admin.register(PopularQuery)
+class PopularQueryAdmin(admin.ModelAdmin):
+    list_display = ('text', 'count', 'last_seen_at')
+    search_fields = ('query',)
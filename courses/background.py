@@ -0,0 +1,61 @@
+"""
+Lightweight in-process background task runner.
+
+In a real deployment this would be a Celery queue. For now work that should
+not block the request thread (cache revalidation, etc.) is handed to a small
+shared thread pool.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 4),
+                    thread_name_prefix='courses-bg',
+                )
+    return _executor
+
+
+def submit(fn, *args, key=None, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` on the background pool.
+
+    If ``key`` is given, a task with the same key that is still queued or
+    running is not submitted twice. Returns the Future, or None if skipped.
+    """
+    if key is not None:
+        with _inflight_lock:
+            if key in _inflight:
+                return None
+            _inflight.add(key)
+
+    def run():
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.exception(f"Background task {getattr(fn, '__name__', fn)} failed: {e}")
+        finally:
+            if key is not None:
+                with _inflight_lock:
+                    _inflight.discard(key)
+            close_old_connections()
+
+    return _get_executor().submit(run)
@@ -0,0 +1,261 @@
+"""
+Chat sessions with bounded prompts.
+
+Every question is stored as a ChatTurn of a ChatSession. The prompt for a
+new turn contains:
+
+- the session's rolling summary, capped at CHAT_SUMMARY_MAX_TOKENS, which
+  folds in older turns in the background after the response is sent;
+- the last CHAT_RECENT_TURNS turns verbatim, each answer shortened, within
+  CHAT_HISTORY_TOKEN_BUDGET;
+- retrieved context, trimmed by RAGService.generate_answer to whatever is
+  left of CHAT_PROMPT_TOKEN_BUDGET.
+
+So the prompt size does not grow with the length of the conversation.
+
+Follow-ups like "and its time complexity?" are rewritten into a standalone
+search query with a local heuristic (no LLM call): if the question looks
+like a follow-up, the key terms of the previous search query are prepended.
+Search results are cached per session and rewritten query.
+"""
+
+import hashlib
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from . import background
+from .gemini import get_model
+from .metering import track_llm_call
+from .models import ChatSession, ChatTurn, CourseMaterial
+from .tokens import truncate_to_tokens
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'so', 'also', 'then', 'of', 'in', 'on', 'for', 'to', 'from', 'with',
+    'by', 'at', 'as', 'is', 'are', 'was', 'were', 'be', 'been', 'do', 'does', 'did', 'can', 'could', 'would',
+    'should', 'will', 'what', 'which', 'who', 'whom', 'why', 'how', 'when', 'where', 'about', 'me', 'my', 'i',
+    'you', 'your', 'we', 'our', 'please', 'tell', 'explain', 'describe', 'show', 'give', 'mean', 'means',
+    'work', 'works', 'simply', 'more', 'again', 'than', 'there', 'here', 'some', 'any', 'example',
+}
+PRONOUNS = {'it', 'its', "it's", 'this', 'that', 'these', 'those', 'they', 'them', 'their', 'one', 'same'}
+FOLLOW_UP_PREFIXES = ('and ', 'what about ', 'how about ', 'also ', 'then ', 'so ', 'why ', 'but ')
+SUBSTITUTION_PREFIXES = ('what about ', 'how about ')  # same question, different subject
+MAX_QUERY_TERMS = 6
+TURN_INSERT_ATTEMPTS = 5  # concurrent questions in one session race for the next turn index
+_WORD_RE = re.compile(r"[\w+#']+")
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def content_terms(text):
+    """Distinct non-stop-word terms of ``text``, in order."""
+    terms = []
+    seen = set()
+    for word in _WORD_RE.findall(text or ''):
+        lower = word.lower()
+        if lower in STOP_WORDS or lower in PRONOUNS or len(word) < 2 or lower in seen:
+            continue
+        seen.add(lower)
+        terms.append(word)
+    return terms
+
+
+def is_follow_up(query):
+    words = [word.lower() for word in _WORD_RE.findall(query)]
+    if not words:
+        return False
+    if query.lower().lstrip().startswith(FOLLOW_UP_PREFIXES) or PRONOUNS.intersection(words):
+        return True
+    # Very short questions with little content of their own ("complexity?")
+    return len(words) <= 3 and len(content_terms(query)) <= 1
+
+
+def rewrite_query(query, previous_search_query):
+    """
+    Make a follow-up question self-contained for retrieval using the previous turn.
+
+    "and its complexity?" after "How does BFS work?" becomes "BFS complexity";
+    "what about DFS?" after "BFS complexity" replaces the subject: "DFS complexity".
+    """
+    if not previous_search_query or not is_follow_up(query):
+        return query
+    previous = content_terms(previous_search_query)
+    own = content_terms(query)
+    if own and query.lower().lstrip().startswith(SUBSTITUTION_PREFIXES):
+        previous = previous[1:]
+    seen = {term.lower() for term in own}
+    previous = [term for term in previous if term.lower() not in seen]
+    if query.lower().lstrip().startswith(SUBSTITUTION_PREFIXES):
+        terms = own + previous
+    else:
+        terms = previous + own
+    # Keep the subject and the newest terms so chains of follow-ups do not snowball
+    if len(terms) > MAX_QUERY_TERMS:
+        terms = terms[:1] + terms[1 - MAX_QUERY_TERMS:]
+    return " ".join(terms) or query
+
+
+def get_session(user, session_id=None):
+    """The user's session with ``session_id``, or a new one if it is missing or not theirs."""
+    if session_id:
+        try:
+            return ChatSession.objects.get(pk=session_id, user=user)
+        except (ChatSession.DoesNotExist, ValidationError, ValueError):
+            pass
+    return ChatSession.objects.create(user=user)
+
+
+def cached_search(session, rag, search_query, n_results=10):
+    """RAGService.search, cached per session so repeated or revisited questions skip retrieval."""
+    digest = hashlib.sha256(" ".join(search_query.lower().split()).encode('utf-8')).hexdigest()[:32]
+    key = f"chat:{session.pk}:search:{digest}"
+    material_ids = cache.get(key)
+    if material_ids is not None:
+        with span('chat.retrieval_cache_hit'):
+            materials = CourseMaterial.objects.in_bulk(material_ids)
+        return [materials[material_id] for material_id in material_ids if material_id in materials]
+
+    results = rag.search(search_query, n_results=n_results)
+    cache.set(key, [material.id for material in results], _setting('CHAT_RETRIEVAL_CACHE_TIMEOUT', 3600))
+    return results
+
+
+def format_turn(turn, answer_tokens):
+    return f"Student: {turn.query}\nEduBot: {truncate_to_tokens(turn.answer, answer_tokens)}"
+
+
+def build_conversation(session, recent_turns):
+    """Summary plus the most recent turns that fit into CHAT_HISTORY_TOKEN_BUDGET."""
+    budget = _setting('CHAT_HISTORY_TOKEN_BUDGET', 800)
+    parts = []
+    if session.summary:
+        summary = truncate_to_tokens(session.summary, min(budget, _setting('CHAT_SUMMARY_MAX_TOKENS', 250)), keep='end')
+        parts.append(f"Summary of earlier discussion: {summary}")
+        budget -= len(parts[0]) // 4 + 1
+
+    # Newest first, so the turns dropped for space are the oldest ones
+    turns = []
+    for turn in reversed(recent_turns):
+        if turn.index < session.summarized_through:
+            break
+        text = format_turn(turn, _setting('CHAT_TURN_MAX_TOKENS', 200))
+        cost = len(text) // 4 + 1
+        if cost > budget:
+            break
+        turns.append(text)
+        budget -= cost
+    parts.extend(reversed(turns))
+    return "\n\n".join(parts)
+
+
+def answer(user, query, session_id=None, bangla=False):
+    """
+    Answer ``query`` within a chat session.
+
+    Returns:
+        The RAGService response dict plus 'session_id' and 'search_query'
+    """
+    from .rag_service import RAGService
+
+    session = get_session(user, session_id)
+    recent_turns = list(session.turns.order_by('-index')[:_setting('CHAT_RECENT_TURNS', 3)])[::-1]
+    previous = recent_turns[-1].search_query if recent_turns else None
+    search_query = rewrite_query(query, previous)
+
+    rag = RAGService()
+    if bangla:
+        response = {"answer": rag.provide_bangla_explanation(search_query)}
+    else:
+        results = cached_search(session, rag, search_query)
+        response = rag.generate_answer(
+            query, results=results, conversation=build_conversation(session, recent_turns),
+            token_budget=_setting('CHAT_PROMPT_TOKEN_BUDGET', 3000), search_query=search_query,
+        )
+
+    index = recent_turns[-1].index + 1 if recent_turns else 0
+    turn_fields = {
+        'query': query,
+        'search_query': search_query,
+        'answer': response.get('answer') or '',
+        'source_ids': [source['id'] for source in response.get('sources', [])],
+    }
+    for attempt in range(TURN_INSERT_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                ChatTurn.objects.create(session=session, index=index, **turn_fields)
+            break
+        except IntegrityError:
+            # A concurrent request in the same session took this index
+            if attempt == TURN_INSERT_ATTEMPTS - 1:
+                raise
+            latest = session.turns.order_by('-index').values_list('index', flat=True).first()
+            index = 0 if latest is None else latest + 1
+    session.save(update_fields=['updated_at'])
+
+    if index + 1 - session.summarized_through > _setting('CHAT_RECENT_TURNS', 3):
+        session_pk = session.pk
+        transaction.on_commit(lambda: background.submit(
+            update_summary, session_pk, key=f"chat-summary:{session_pk}"
+        ))
+
+    response['session_id'] = str(session.pk)
+    response['search_query'] = search_query
+    return response
+
+
+def update_summary(session_id):
+    """
+    Fold turns that dropped out of the recent window into the session summary.
+
+    Uses Gemini when configured and falls back to an extractive summary
+    (each question with the first sentence of its answer).
+    """
+    session = ChatSession.objects.filter(pk=session_id).first()
+    if session is None:
+        return
+    recent = _setting('CHAT_RECENT_TURNS', 3)
+    turns = list(session.turns.filter(index__gte=session.summarized_through).order_by('index'))
+    to_fold = turns[:-recent] if len(turns) > recent else []
+    if not to_fold:
+        return
+
+    max_tokens = _setting('CHAT_SUMMARY_MAX_TOKENS', 250)
+    answer_tokens = _setting('CHAT_TURN_MAX_TOKENS', 200)
+    summary = None
+    model = get_model()
+    if model:
+        transcript = "\n\n".join(format_turn(turn, answer_tokens) for turn in to_fold)
+        prompt = (
+            f"Update the running summary of a tutoring conversation with the new turns below. "
+            f"Keep the topics, key facts and open questions; at most {max_tokens * 3 // 4} words.\n\n"
+            f"Current summary:\n{session.summary or '(empty)'}\n\nNew turns:\n{transcript}\n\n"
+            f"Return only the updated summary."
+        )
+        try:
+            with track_llm_call('chat.summary') as call:
+                call.response = model.generate_content(prompt)
+            summary = call.response.text.strip()
+        except Exception as e:
+            logger.warning(f"Chat summary generation failed, using extractive summary: {e}")
+
+    if not summary:
+        lines = [session.summary] if session.summary else []
+        for turn in to_fold:
+            first_sentence = re.split(r'(?<=[.!?])\s', turn.answer.strip(), maxsplit=1)[0]
+            lines.append(f"- {turn.search_query}: {truncate_to_tokens(first_sentence, 40)}")
+        summary = "\n".join(lines)
+
+    # Conditional update: a concurrent run that already folded these turns wins
+    ChatSession.objects.filter(pk=session.pk, summarized_through=session.summarized_through).update(
+        summary=truncate_to_tokens(summary, max_tokens, keep='end'),
+        summarized_through=to_fold[-1].index + 1,
+    )
@@ -0,0 +1,175 @@
+"""
+Circuit breakers for external dependencies.
+
+Each dependency (Chroma, the embedding model, Gemini, Wikipedia) has one
+breaker per process. A breaker records the outcome of calls over a sliding
+CIRCUIT_BREAKER_WINDOW; once at least CIRCUIT_BREAKER_MIN_CALLS calls were
+made and CIRCUIT_BREAKER_FAILURE_RATE of them failed, it opens and calls fail
+immediately with CircuitOpenError, so callers take their fallback in
+microseconds instead of waiting for a timeout. After
+CIRCUIT_BREAKER_OPEN_SECONDS one probe call is let through (half-open): its
+success closes the breaker, its failure opens it again.
+
+    with get_breaker('chroma'):
+        results = collection.query(...)
+
+Like the tracing histograms, state is per process; ``/healthz`` reports the
+breakers of the worker that serves it.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEPENDENCIES = ('chroma', 'embedder', 'gemini', 'wikipedia')
+
+
+class CircuitOpenError(Exception):
+    """The dependency's breaker is open; the call was not attempted."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=60.0, min_calls=5, failure_rate=0.5, open_seconds=30.0, clock=time.monotonic):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = None
+        self._outcomes = deque()  # (timestamp, failed)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self._outcomes.clear()
+        logger.warning(f"Circuit breaker {self.name} opened")
+
+    @property
+    def is_open(self):
+        """True while calls would be rejected (open and not yet due for a probe)."""
+        with self._lock:
+            if self.state == OPEN:
+                return self.clock() - self.opened_at < self.open_seconds
+            return self.state == HALF_OPEN and self._probing
+
+    def before_call(self):
+        """Reserve a call or raise CircuitOpenError."""
+        with self._lock:
+            if self.state == OPEN:
+                elapsed = self.clock() - self.opened_at
+                if elapsed < self.open_seconds:
+                    raise CircuitOpenError(self.name, self.open_seconds - elapsed)
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(self.name, 0)
+                self._probing = True
+
+    def record(self, failed):
+        with self._lock:
+            now = self.clock()
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self.opened_at = None
+                    self._outcomes.clear()
+                    logger.info(f"Circuit breaker {self.name} closed")
+                return
+            if self.state == OPEN:
+                # A call started before the breaker opened
+                return
+            self._outcomes.append((now, failed))
+            self._prune(now)
+            if failed and len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, f in self._outcomes if f)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now)
+
+    def release(self):
+        """Give back a reserved call without a verdict (e.g. a stream closed by the client)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def __enter__(self):
+        self.before_call()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.record(failed=False)
+        elif issubclass(exc_type, Exception):
+            self.record(failed=True)
+        else:
+            self.release()
+        return False
+
+    def snapshot(self):
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, f in self._outcomes if f)
+            state = self.state
+            retry_in = None
+            if state == OPEN:
+                retry_in = max(0.0, self.open_seconds - (now - self.opened_at))
+                if retry_in == 0:
+                    state = HALF_OPEN
+            return {
+                'state': state,
+                'calls': calls,
+                'failure_rate': round(failures / calls, 3) if calls else 0.0,
+                'retry_in': round(retry_in, 1) if retry_in is not None else None,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """The process-wide breaker for dependency ``name``."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(
+                    name,
+                    window=getattr(settings, 'CIRCUIT_BREAKER_WINDOW', 60),
+                    min_calls=getattr(settings, 'CIRCUIT_BREAKER_MIN_CALLS', 5),
+                    failure_rate=getattr(settings, 'CIRCUIT_BREAKER_FAILURE_RATE', 0.5),
+                    open_seconds=getattr(settings, 'CIRCUIT_BREAKER_OPEN_SECONDS', 30),
+                )
+    return breaker
+
+
+def health():
+    """Breaker state of every dependency."""
+    return {name: get_breaker(name).snapshot() for name in DEPENDENCIES}
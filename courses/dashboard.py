@@ -0,0 +1,70 @@
+"""
+Homepage dashboard data, served from the cache.
+
+Content counts and the recent-materials list are cached until a Topic,
+CourseMaterial or Post changes (see courses.signals). The AI usage total is
+kept in its own key and incremented by courses.metering as usage events are
+flushed, so a warm page view runs no aggregate queries at all. That key
+expires after DASHBOARD_AI_USAGE_TIMEOUT seconds so it also picks up events
+flushed by other workers, whose increments only reach their own cache.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metering import AI_USAGE_CACHE_KEY, counter_value
+from .models import CourseMaterial, Topic
+
+STATS_CACHE_KEY = 'dashboard:stats'
+RECENT_MATERIALS_CACHE_KEY = 'dashboard:recent_materials'
+RECENT_MATERIALS_LIMIT = 6
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 3600)
+
+
+def _ai_usage_timeout():
+    return getattr(settings, 'DASHBOARD_AI_USAGE_TIMEOUT', 60)
+
+
+def get_dashboard_stats():
+    from community.models import Post
+
+    cached = cache.get_many([STATS_CACHE_KEY, AI_USAGE_CACHE_KEY])
+    stats = cached.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = {
+            'topics': Topic.objects.count(),
+            'materials': CourseMaterial.objects.count(),
+            'posts': Post.objects.count(),
+        }
+        cache.set(STATS_CACHE_KEY, stats, _timeout())
+
+    ai_usage = cached.get(AI_USAGE_CACHE_KEY)
+    if ai_usage is None:
+        ai_usage = counter_value('llm_calls')
+        # cache.incr keeps the expiry, so the total is reread from UsageCounter periodically
+        cache.add(AI_USAGE_CACHE_KEY, ai_usage, _ai_usage_timeout())
+
+    return {**stats, 'ai_usage': ai_usage}
+
+
+def get_recent_materials():
+    materials = cache.get(RECENT_MATERIALS_CACHE_KEY)
+    if materials is None:
+        materials = [
+            {'pk': row['id'], 'title': row['title'], 'file_type': row['file_type'], 'topic': {'name': row['topic__name']}}
+            for row in CourseMaterial.objects.order_by('-id').values(
+                'id', 'title', 'file_type', 'topic__name'
+            )[:RECENT_MATERIALS_LIMIT]
+        ]
+        cache.set(RECENT_MATERIALS_CACHE_KEY, materials, _timeout())
+    return materials
+
+
+def invalidate_dashboard(recent=True):
+    keys = [STATS_CACHE_KEY]
+    if recent:
+        keys.append(RECENT_MATERIALS_CACHE_KEY)
+    cache.delete_many(keys)
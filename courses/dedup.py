@@ -0,0 +1,243 @@
+"""
+Near-duplicate detection for course materials with MinHash and LSH.
+
+Each material's description and text are split into word shingles; the
+MinHash signature (NUM_PERM minimum hashes) estimates the Jaccard similarity
+of two shingle sets. The signature is cut into LSH_BANDS bands whose hashes
+are stored in the indexed MinHashBucket table, so candidate duplicates are
+found with an index lookup per band instead of a scan over the corpus; only
+candidates are compared signature to signature.
+
+Signatures are computed on save (courses.signals) and backfilled with
+``manage.py compute_signatures``.
+
+numpy is imported inside the functions so that importing this module (from
+courses.signals, at startup) stays cheap.
+"""
+
+import hashlib
+import logging
+import re
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import CourseMaterial, MaterialSignature, MinHashBucket
+from .vector_index import get_index as get_compact_index
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+LSH_BANDS = 16  # 8 rows per band: candidate pairs from a Jaccard similarity of about 0.7
+SHINGLE_SIZE = 5
+MIN_TOKENS = 10  # shorter texts are not fingerprinted
+
+_PRIME = (1 << 32) + 15  # smallest prime above the 32-bit shingle hashes
+_TOKEN_RE = re.compile(r'\w+')
+_permutations = None
+
+
+def _get_permutations():
+    import numpy as np
+
+    global _permutations
+    if _permutations is None:
+        rng = np.random.default_rng(1)  # fixed: signatures must be comparable across processes
+        _permutations = (
+            rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64),
+            rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64),
+        )
+    return _permutations
+
+
+def material_text(material):
+    """The text compared for duplicates; titles are ignored on purpose."""
+    return f"{material.description or ''}\n{material.text_content or ''}"
+
+
+def content_hash(text):
+    return hashlib.sha256(" ".join(text.lower().split()).encode('utf-8')).hexdigest()
+
+
+def minhash(text):
+    """
+    MinHash signature of the word shingles of ``text``.
+
+    Returns:
+        uint32 array of length NUM_PERM, or None if the text is too short
+    """
+    import numpy as np
+
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < MIN_TOKENS:
+        return None
+    shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    a, b = _get_permutations()
+    # a, b and hashes are below 2**32, so a * hash fits in uint64
+    permuted = (hashes[:, None] * a % _PRIME + b) % _PRIME
+    return (permuted.min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def band_hashes(signature):
+    """One signed 64-bit hash per LSH band (fits a BigIntegerField)."""
+    rows = NUM_PERM // LSH_BANDS
+    return [
+        int.from_bytes(
+            hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+            'little', signed=True,
+        )
+        for band in range(LSH_BANDS)
+    ]
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two signatures."""
+    import numpy as np
+
+    return float(np.mean(signature == other))
+
+
+def _from_bytes(data):
+    import numpy as np
+
+    return np.frombuffer(bytes(data), dtype=np.uint32)
+
+
+def update_signature(material):
+    """Compute and store the signature and LSH buckets of a material if its text changed."""
+    text = material_text(material)
+    digest = content_hash(text)
+    existing = MaterialSignature.objects.filter(material_id=material.pk).values_list('content_hash', flat=True).first()
+    if existing == digest:
+        return
+
+    signature = minhash(text)
+    with transaction.atomic():
+        MinHashBucket.objects.filter(material_id=material.pk).delete()
+        if signature is None:
+            MaterialSignature.objects.filter(material_id=material.pk).delete()
+            return
+        MaterialSignature.objects.update_or_create(
+            material_id=material.pk,
+            defaults={'content_hash': digest, 'minhash': signature.tobytes()},
+        )
+        MinHashBucket.objects.bulk_create([
+            MinHashBucket(material_id=material.pk, band=band, bucket=bucket)
+            for band, bucket in enumerate(band_hashes(signature))
+        ])
+
+
+def find_near_duplicates(text, exclude_id=None, threshold=None, limit=5):
+    """
+    Materials whose text is a near-duplicate of ``text``.
+
+    Returns:
+        List of (CourseMaterial, similarity) tuples, most similar first
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'NEAR_DUPLICATE_THRESHOLD', 0.8)
+    signature = minhash(text)
+    if signature is None:
+        return []
+
+    bands = Q()
+    for band, bucket in enumerate(band_hashes(signature)):
+        bands |= Q(band=band, bucket=bucket)
+    candidates = MinHashBucket.objects.filter(bands).values('material_id')
+    if exclude_id is not None:
+        candidates = candidates.exclude(material_id=exclude_id)
+
+    scored = []
+    for material_id, data in MaterialSignature.objects.filter(material_id__in=candidates).values_list('material_id', 'minhash'):
+        score = similarity(signature, _from_bytes(data))
+        if score >= threshold:
+            scored.append((material_id, score))
+    scored.sort(key=lambda item: -item[1])
+    scored = scored[:limit]
+
+    materials = CourseMaterial.objects.in_bulk([material_id for material_id, _ in scored])
+    return [(materials[material_id], score) for material_id, score in scored if material_id in materials]
+
+
+def collapse_near_duplicates(materials, threshold=None):
+    """
+    Drop materials that near-duplicate an earlier (better ranked) one.
+
+    Order is preserved. Materials without a signature are always kept.
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'NEAR_DUPLICATE_THRESHOLD', 0.8)
+    if len(materials) < 2:
+        return list(materials)
+
+    signatures = {
+        material_id: _from_bytes(data)
+        for material_id, data in MaterialSignature.objects.filter(
+            material_id__in=[m.id for m in materials]
+        ).values_list('material_id', 'minhash')
+    }
+    kept = []
+    kept_signatures = []
+    for material in materials:
+        signature = signatures.get(material.id)
+        if signature is not None:
+            if any(similarity(signature, other) >= threshold for other in kept_signatures):
+                continue
+            kept_signatures.append(signature)
+        kept.append(material)
+    if len(kept) < len(materials):
+        logger.debug(f"Collapsed {len(materials) - len(kept)} near-duplicate results")
+    return kept
+
+
+def embed_document(document, vector_store):
+    """
+    Write a material's document to the vector store, embedding only new text.
+
+    If the stored vector already matches the text nothing but the metadata is
+    updated; if another material has the identical text embedded, its vector
+    is copied instead of running the model.
+
+    Returns:
+        True if the embedding model was run
+    """
+    material_id = document['id']
+    digest = hashlib.sha256(document['text'].encode('utf-8')).hexdigest()
+    current = MaterialSignature.objects.filter(material_id=material_id).values_list('embedded_hash', flat=True).first()
+
+    if current == digest and vector_store.has_document(material_id):
+        vector_store.update_metadata(material_id, document['metadata'])
+        return False
+
+    donor = MaterialSignature.objects.filter(embedded_hash=digest).exclude(
+        material_id=material_id
+    ).values_list('material_id', flat=True).first()
+    embedding = vector_store.get_embedding(donor) if donor is not None else None
+    if embedding is not None:
+        vector_store.delete_document(material_id)
+        vector_store.add_embeddings_batch([material_id], [embedding], [document['metadata']])
+        compact_index = get_compact_index()
+        if compact_index is not None:
+            compact_index.add([material_id], [embedding])
+        embedded = False
+    else:
+        vector_store.update_document(material_id, document['text'], document['metadata'])
+        embedded = True
+
+    # Materials too short for a MinHash signature have no row and are always re-embedded
+    MaterialSignature.objects.filter(material_id=material_id).update(embedded_hash=digest)
+    return embedded
+
+
+def mark_embedded(documents):
+    """Record the text hash of documents just written to the vector store in bulk."""
+    with transaction.atomic():
+        for document in documents:
+            MaterialSignature.objects.filter(material_id=document['id']).update(
+                embedded_hash=hashlib.sha256(document['text'].encode('utf-8')).hexdigest()
+            )
@@ -1,14 +1,73 @@
-import google.generativeai as genai
+import hashlib
+import io
+import logging
+from datetime import timedelta
+
 from django.conf import settings
+from django.utils import timezone
+
+from . import background
+from .gemini import get_model
+from .metering import track_llm_call
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+DIGITIZE_PROMPT = "Digitize these handwritten engineering notes into a professional Markdown document. Use LaTeX for equations and formulas. Keep the structure clean and academic."
+
 
 class DigitizationService:
     def __init__(self):
         self.api_key = getattr(settings, "GEMINI_API_KEY", None)
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.model = None
+        self.model = get_model()
+        self.max_dimension = getattr(settings, 'DIGITIZATION_MAX_DIMENSION', 1600)
+        self.jpeg_quality = getattr(settings, 'DIGITIZATION_JPEG_QUALITY', 80)
+
+    @staticmethod
+    def hash_file(image_file):
+        """SHA-256 of an uploaded file, read in chunks so large photos never sit in memory."""
+        digest = hashlib.sha256()
+        for chunk in image_file.chunks():
+            digest.update(chunk)
+        image_file.seek(0)
+        return digest.hexdigest()
+
+    def preprocess_image(self, image_file):
+        """
+        Downscale and recompress a photo before it is sent to Gemini.
+
+        Phone photos are often 4000px+ and several MB; the model reads
+        handwriting just as well at ~1600px, so this cuts upload size by an
+        order of magnitude. Returns (jpeg_bytes, mime_type).
+        """
+        from PIL import Image, ImageOps
+
+        with span('digitization.preprocess'), Image.open(image_file) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
+        return buffer.getvalue(), "image/jpeg"
+
+    def _generate(self, image_data, mime_type):
+        with track_llm_call('digitization') as call:
+            call.response = self.model.generate_content([
+                DIGITIZE_PROMPT,
+                {
+                    "mime_type": mime_type,
+                    "data": image_data
+                }
+            ])
+        return call.response.text.strip()
+
+    @staticmethod
+    def format_error(error):
+        error_msg = str(error)
+        if "429" in error_msg:
+            return "⚠️ AI Quota Exceeded (429): The free tier limit has been reached. Please wait 1 minute and try again."
+        return f"Digitization error: {error_msg}"
 
     def digitize(self, image_file):
         """
@@ -18,24 +77,105 @@ class DigitizationService:
             return "Gemini API Key missing."
 
         try:
-            # Read the image content
-            image_data = image_file.read()
-            
-            # Prepare the multimodal prompt
-            prompt = "Digitize these handwritten engineering notes into a professional Markdown document. Use LaTeX for equations and formulas. Keep the structure clean and academic."
-            
-            # Pass both the prompt and the image data
-            response = self.model.generate_content([
-                prompt,
-                {
-                    "mime_type": image_file.content_type if hasattr(image_file, 'content_type') else "image/jpeg",
-                    "data": image_data
-                }
-            ])
-            
-            return response.text.strip()
+            image_data, mime_type = self.preprocess_image(image_file)
+            return self._generate(image_data, mime_type)
+        except Exception as e:
+            return self.format_error(e)
+
+    def process_job(self, job_id):
+        """
+        Background worker for a DigitizationJob: preprocess, call the model and
+        store the Markdown. Queued jobs for the same image (e.g. a page uploaded
+        twice) are completed with the same result.
+        """
+        from .models import DigitizationJob
+
+        # Claim the job atomically so two workers never process the same page
+        claimed = DigitizationJob.objects.filter(pk=job_id, status='PENDING').update(
+            status='PROCESSING', updated_at=timezone.now()
+        )
+        if not claimed:
+            return
+        job = DigitizationJob.objects.get(pk=job_id)
+
+        # Evaluated now: the status filter no longer matches once the jobs are finished
+        sibling_ids = list(DigitizationJob.objects.filter(
+            image_hash=job.image_hash, status__in=['PENDING', 'PROCESSING']
+        ).values_list('pk', flat=True))
+        siblings = DigitizationJob.objects.filter(pk__in=sibling_ids)
+
+        if not self.model:
+            siblings.update(status='FAILED', error="Gemini API Key missing.", updated_at=timezone.now())
+            discard_images(sibling_ids)
+            return
+
+        try:
+            with job.image.open('rb') as image_file:
+                image_data, mime_type = self.preprocess_image(image_file)
+            content = self._generate(image_data, mime_type)
         except Exception as e:
-            error_msg = str(e)
-            if "429" in error_msg:
-                return "⚠️ AI Quota Exceeded (429): The free tier limit has been reached. Please wait 1 minute and try again."
-            return f"Digitization error: {error_msg}"
+            logger.error(f"Digitization job {job.pk} failed: {e}")
+            siblings.update(status='FAILED', error=self.format_error(e), updated_at=timezone.now())
+            discard_images(sibling_ids)
+            return
+
+        siblings.update(status='DONE', content=content, error='', updated_at=timezone.now())
+        discard_images(sibling_ids)
+        logger.info(f"Digitization job {job.pk} done ({len(image_data)} bytes sent)")
+
+
+def discard_images(job_ids):
+    """Delete the uploaded originals of finished jobs; only the Markdown is kept."""
+    from .models import DigitizationJob
+
+    jobs = DigitizationJob.objects.filter(pk__in=job_ids, status__in=['DONE', 'FAILED']).exclude(image='').exclude(image=None)
+    for job in jobs.only('id', 'image'):
+        try:
+            job.image.delete(save=False)
+        except OSError as e:
+            logger.warning(f"Could not delete image of digitization job {job.pk}: {e}")
+        DigitizationJob.objects.filter(pk=job.pk).update(image=None)
+
+
+def _stale_cutoff():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'DIGITIZATION_STALE_SECONDS', 600))
+
+
+def is_stale(job):
+    """True for an unfinished job that has not progressed within DIGITIZATION_STALE_SECONDS."""
+    return job.status in ('PENDING', 'PROCESSING') and job.updated_at < _stale_cutoff()
+
+
+def sweep_stale_jobs(jobs=None):
+    """
+    Recover jobs orphaned by a restart (the in-process queue is lost with it).
+
+    PENDING jobs not picked up within DIGITIZATION_STALE_SECONDS are queued
+    again; PROCESSING jobs not finished within that time are marked FAILED,
+    since the page may be what brought the worker down. ``jobs`` limits the
+    sweep to a queryset (e.g. one batch). Returns (requeued, failed) counts.
+    """
+    from .models import DigitizationJob
+
+    if jobs is None:
+        jobs = DigitizationJob.objects.all()
+    cutoff = _stale_cutoff()
+    stale = jobs.filter(updated_at__lt=cutoff)
+
+    failed_ids = list(stale.filter(status='PROCESSING').values_list('pk', flat=True))
+    failed = DigitizationJob.objects.filter(pk__in=failed_ids, status='PROCESSING', updated_at__lt=cutoff).update(
+        status='FAILED', error="Digitization was interrupted. Please upload the page again.", updated_at=timezone.now()
+    )
+    discard_images(failed_ids)
+
+    pending_ids = list(stale.filter(status='PENDING').values_list('pk', flat=True))
+    if pending_ids:
+        # Touch the jobs so the next sweep waits for this attempt; claiming in
+        # process_job keeps a job that is still queued elsewhere from running twice
+        DigitizationJob.objects.filter(pk__in=pending_ids, status='PENDING').update(updated_at=timezone.now())
+        service = DigitizationService()
+        for job_id in pending_ids:
+            background.submit(service.process_job, job_id, key=f"digitize:{job_id}")
+    if failed or pending_ids:
+        logger.warning(f"Swept stale digitization jobs: {len(pending_ids)} requeued, {failed} failed")
+    return len(pending_ids), failed
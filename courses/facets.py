@@ -0,0 +1,113 @@
+"""
+Faceted counts for material search.
+
+All four facets (tag, topic, week, file type) are computed by a single SQL
+statement: one GROUP BY per facet over the same filtered material set,
+combined with UNION ALL.
+"""
+
+from django.db.models import CharField, Count, F, Q, Value
+from django.db.models.functions import Cast
+
+from .models import CourseMaterial, MaterialTag
+from .tagging import normalize_tag
+
+FACETS = ('tag', 'topic', 'week', 'file_type')
+
+
+class InvalidFilter(ValueError):
+    """A facet selection has a malformed value."""
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidFilter(f"'{name}' must be an integer") from None
+
+
+def filter_materials(params):
+    """
+    Materials matching the search text and any facet selections in ``params``.
+
+    Raises InvalidFilter if ``topic`` or ``week`` is not an integer.
+    """
+    queryset = CourseMaterial.objects.all()
+
+    query = (params.get('q') or '').strip()
+    if query:
+        tagged = MaterialTag.objects.filter(tag__name=normalize_tag(query)).values('material_id')
+        queryset = queryset.filter(
+            Q(title__icontains=query) | Q(description__icontains=query) | Q(id__in=tagged)
+        )
+
+    tag = params.get('tag')
+    if tag:
+        queryset = queryset.filter(id__in=MaterialTag.objects.filter(tag__name=normalize_tag(tag)).values('material_id'))
+    topic = _int_param(params, 'topic')
+    if topic is not None:
+        queryset = queryset.filter(topic_id=topic)
+    week = _int_param(params, 'week')
+    if week is not None:
+        queryset = queryset.filter(week=week)
+    if params.get('file_type'):
+        queryset = queryset.filter(file_type=params['file_type'])
+    if params.get('category'):
+        queryset = queryset.filter(category=params['category'])
+    return queryset
+
+
+def _facet(queryset, facet, group_by, key, label, count):
+    return queryset.order_by().values(group_by).annotate(
+        facet=Value(facet, output_field=CharField()),
+        key=key,
+        label=label,
+        count=count,
+    ).values_list('facet', 'key', 'label', 'count')
+
+
+def material_facets(queryset, tag_limit=30):
+    """
+    Counts per tag, topic, week and file type for ``queryset``.
+
+    Returns a dict of facet name -> list of {'value', 'label', 'count'},
+    most frequent first (weeks in week order).
+    """
+    material_ids = queryset.order_by().values('id')
+    tags = _facet(
+        MaterialTag.objects.filter(material_id__in=material_ids), 'tag', 'tag_id',
+        Cast('tag_id', CharField()), F('tag__name'), Count('material_id'),
+    )
+    topics = _facet(
+        queryset, 'topic', 'topic_id',
+        Cast('topic_id', CharField()), F('topic__name'), Count('id'),
+    )
+    weeks = _facet(
+        queryset, 'week', 'week',
+        Cast('week', CharField()), Cast('week', CharField()), Count('id'),
+    )
+    file_types = _facet(
+        queryset, 'file_type', 'file_type',
+        F('file_type'), F('file_type'), Count('id'),
+    )
+
+    file_type_labels = dict(CourseMaterial.FILE_TYPE_CHOICES)
+    result = {facet: [] for facet in FACETS}
+    for facet, key, label, count in tags.union(topics, weeks, file_types, all=True):
+        if key is None:
+            continue  # materials without a topic/week
+        if facet == 'file_type':
+            label = file_type_labels.get(key, key)
+        value = int(key) if facet in ('tag', 'topic', 'week') else key
+        result[facet].append({'value': value, 'label': label, 'count': count})
+
+    for facet in FACETS:
+        if facet == 'week':
+            result[facet].sort(key=lambda row: row['value'])
+        else:
+            result[facet].sort(key=lambda row: (-row['count'], str(row['label'])))
+    result['tag'] = result['tag'][:tag_limit]
+    return result
@@ -0,0 +1,34 @@
+"""
+Lazy access to the Gemini client.
+
+``google.generativeai`` pulls in protobuf, gRPC and IPython, which costs most
+of a second at import. Importing it here on first use keeps it out of Django
+startup, migrations and every view that never calls the model.
+"""
+
+import threading
+
+from django.conf import settings
+
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+_models = {}
+_lock = threading.Lock()
+
+
+def get_model(name=DEFAULT_MODEL):
+    """Shared GenerativeModel, or None if GEMINI_API_KEY is not configured."""
+    api_key = getattr(settings, "GEMINI_API_KEY", None)
+    if not api_key:
+        return None
+
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                import google.generativeai as genai
+
+                genai.configure(api_key=api_key)
+                model = _models[name] = genai.GenerativeModel(name)
+    return model
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import background
+from .metering import record_cache_hit
+from .models import CourseMaterial, GeneratedContent
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCache:
+    """
+    Persistent cache for AI generated quizzes, flashcards and video scripts.
+
+    A cache key combines the generator type, the normalized query and the
+    prompt version. Each entry also records the ids of the materials it was
+    grounded on and a hash of their updated_at; a hit rehashes just those rows,
+    so retrieval (and its query-expansion LLM call) only runs on a miss. Hits
+    are served straight from the database; entries older than the TTL or whose
+    sources changed are served stale while a background refresh runs (if
+    enabled). The table is kept bounded by evicting least recently used
+    entries by count and total size.
+    """
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'GENERATION_CACHE_ENABLED', True)
+        self.ttl = timedelta(seconds=getattr(settings, 'GENERATION_CACHE_TTL', 7 * 24 * 3600))
+        self.stale_while_revalidate = getattr(settings, 'GENERATION_CACHE_STALE_WHILE_REVALIDATE', True)
+        self.max_entries = getattr(settings, 'GENERATION_CACHE_MAX_ENTRIES', 2000)
+        self.max_bytes = getattr(settings, 'GENERATION_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(str(query).lower().split())[:255]
+
+    @staticmethod
+    def source_fingerprint(materials):
+        """Hash of the ids and modification times of the grounding materials."""
+        parts = sorted(
+            f"{m.id}:{m.updated_at.isoformat() if m.updated_at else ''}" for m in materials
+        )
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def make_key(generator, query, prompt_version):
+        raw = f"{generator}\x1f{query}\x1f{prompt_version}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_cacheable(result):
+        """Empty results and error payloads are never cached."""
+        if not result:
+            return False
+        if isinstance(result, dict) and result.get('error'):
+            return False
+        return True
+
+    def get_or_generate(self, generator, query, producer, retrieve=None, prompt_version=1):
+        """
+        Return the cached payload for this request, generating it on a miss.
+
+        Args:
+            generator: One of GeneratedContent.GENERATOR_CHOICES keys
+            query: Topic or free-text query the content is generated for
+            producer: Callable doing the actual generation; called as
+                ``producer(sources)`` if ``retrieve`` is given, else ``producer()``
+            retrieve: Zero-argument callable returning the CourseMaterial
+                objects used as grounding context; only called on a miss or refresh
+            prompt_version: Bump whenever the prompt changes to invalidate old entries
+        """
+        def generate():
+            if retrieve is None:
+                return producer(), ()
+            sources = retrieve()
+            return producer(sources), sources
+
+        if not self.enabled:
+            return generate()[0]
+
+        key, normalized = self._key(generator, query, prompt_version)
+        entry = self._lookup(key)
+
+        if entry is None:
+            result, sources = generate()
+            if self.is_cacheable(result):
+                self._store(key, generator, normalized, sources, prompt_version, result)
+            return result
+
+        if timezone.now() - entry.refreshed_at > self.ttl or self.sources_changed(entry):
+            if self.stale_while_revalidate:
+                background.submit(
+                    self._refresh, key, generator, normalized, prompt_version, generate,
+                    key=f"generation-cache:{key}",
+                )
+            else:
+                result, sources = generate()
+                if self.is_cacheable(result):
+                    self._store(key, generator, normalized, sources, prompt_version, result)
+                    return result
+
+        return entry.payload
+
+    def get(self, generator, query, prompt_version=1):
+        """
+        Return the cached payload (even if past its TTL) or None, counting a hit.
+        An entry whose source materials changed is a miss.
+        """
+        if not self.enabled:
+            return None
+        entry = self._lookup(self._key(generator, query, prompt_version)[0])
+        if entry is None or self.sources_changed(entry):
+            return None
+        return entry.payload
+
+    def set(self, generator, query, payload, sources=(), prompt_version=1):
+        """Store a payload produced outside ``get_or_generate`` (e.g. a completed stream)."""
+        if not self.enabled or not self.is_cacheable(payload):
+            return
+        key, normalized = self._key(generator, query, prompt_version)
+        self._store(key, generator, normalized, sources, prompt_version, payload)
+
+    def _key(self, generator, query, prompt_version):
+        normalized = self.normalize_query(query)
+        return self.make_key(generator, normalized, prompt_version), normalized
+
+    def sources_changed(self, entry):
+        """True if a source material of the entry was edited or deleted since it was stored."""
+        if not entry.source_ids:
+            return False
+        current = CourseMaterial.objects.filter(id__in=entry.source_ids).only('id', 'updated_at')
+        return self.source_fingerprint(current) != entry.source_hash
+
+    def _lookup(self, key):
+        entry = GeneratedContent.objects.filter(cache_key=key).only(
+            'id', 'generator', 'payload', 'refreshed_at', 'source_ids', 'source_hash'
+        ).first()
+        if entry is not None:
+            GeneratedContent.objects.filter(pk=entry.pk).update(
+                hits=F('hits') + 1, last_accessed_at=timezone.now()
+            )
+            record_cache_hit(f"cache.{entry.generator.lower()}")
+        return entry
+
+    def _refresh(self, key, generator, query, prompt_version, generate):
+        result, sources = generate()
+        if self.is_cacheable(result):
+            self._store(key, generator, query, sources, prompt_version, result)
+            logger.info(f"Revalidated {generator} cache entry for: {query[:50]}")
+
+    def _store(self, key, generator, query, sources, prompt_version, payload):
+        now = timezone.now()
+        size = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        source_ids = sorted(m.id for m in sources)
+        source_hash = self.source_fingerprint(sources)
+        updated = GeneratedContent.objects.filter(cache_key=key).update(
+            payload=payload, size_bytes=size, misses=F('misses') + 1,
+            source_ids=source_ids, source_hash=source_hash, refreshed_at=now, last_accessed_at=now,
+        )
+        if not updated:
+            try:
+                GeneratedContent.objects.create(
+                    cache_key=key, generator=generator, query=query,
+                    source_ids=source_ids, source_hash=source_hash, prompt_version=prompt_version,
+                    payload=payload, size_bytes=size,
+                )
+            except IntegrityError:
+                # Another worker stored the same entry concurrently
+                pass
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until both count and size limits hold."""
+        excess = GeneratedContent.objects.count() - self.max_entries
+        if excess > 0:
+            stale_ids = list(
+                GeneratedContent.objects.order_by('last_accessed_at').values_list('id', flat=True)[:excess]
+            )
+            GeneratedContent.objects.filter(id__in=stale_ids).delete()
+
+        total = GeneratedContent.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+        if total > self.max_bytes:
+            doomed = []
+            for entry_id, size in GeneratedContent.objects.order_by('last_accessed_at').values_list('id', 'size_bytes').iterator():
+                if total <= self.max_bytes:
+                    break
+                doomed.append(entry_id)
+                total -= size
+            GeneratedContent.objects.filter(id__in=doomed).delete()
+
+    @staticmethod
+    def stats():
+        """Hit/miss counters per generator for currently cached entries."""
+        rows = GeneratedContent.objects.values('generator').annotate(
+            hits=Sum('hits'), misses=Sum('misses'), size=Sum('size_bytes')
+        ).order_by('generator')
+        stats = []
+        for row in rows:
+            requests_total = row['hits'] + row['misses']
+            stats.append({
+                'generator': dict(GeneratedContent.GENERATOR_CHOICES).get(row['generator'], row['generator']),
+                'hits': row['hits'],
+                'misses': row['misses'],
+                'hit_rate': row['hits'] / requests_total if requests_total else 0.0,
+                'size_bytes': row['size'],
+            })
+        return stats
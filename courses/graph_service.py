@@ -0,0 +1,68 @@
+import gzip
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CourseMaterial, RelatedMaterial, Topic
+
+logger = logging.getLogger(__name__)
+
+GRAPH_CACHE_KEY = 'knowledge_graph:payload'
+
+
+def build_graph():
+    """
+    Build the knowledge graph in a constant number of queries.
+
+    Topic -> material edges come from the foreign key, material <-> material
+    edges from the precomputed embedding neighbours in RelatedMaterial.
+    """
+    nodes = []
+    links = []
+
+    for topic_id, name in Topic.objects.values_list('id', 'name'):
+        nodes.append({"id": topic_id, "label": name, "type": "topic"})
+
+    for material_id, title, topic_id in CourseMaterial.objects.values_list('id', 'title', 'topic_id'):
+        nodes.append({"id": f"m{material_id}", "label": title, "type": "material"})
+        if topic_id is not None:
+            links.append({"source": topic_id, "target": f"m{material_id}"})
+
+    max_rank = getattr(settings, 'GRAPH_SIMILARITY_LINKS', 2)
+    min_score = getattr(settings, 'GRAPH_SIMILARITY_MIN_SCORE', 0.5)
+    seen = set()
+    similar = RelatedMaterial.objects.filter(rank__lt=max_rank, score__gte=min_score).values_list(
+        'material_id', 'related_id', 'score'
+    )
+    for source, target, score in similar:
+        pair = (min(source, target), max(source, target))
+        if pair in seen:
+            continue
+        seen.add(pair)
+        links.append({"source": f"m{source}", "target": f"m{target}", "type": "similar", "score": round(score, 3)})
+
+    return {"nodes": nodes, "links": links}
+
+
+def get_graph_payload():
+    """
+    Serialized graph as {'json', 'gzip', 'etag'}, served from the cache when possible.
+    """
+    payload = cache.get(GRAPH_CACHE_KEY)
+    if payload is None:
+        body = json.dumps(build_graph(), separators=(',', ':')).encode('utf-8')
+        payload = {
+            'json': body,
+            'gzip': gzip.compress(body, compresslevel=6),
+            'etag': '"%s"' % hashlib.sha256(body).hexdigest()[:32],
+        }
+        cache.set(GRAPH_CACHE_KEY, payload, getattr(settings, 'GRAPH_CACHE_TIMEOUT', 24 * 3600))
+        logger.info(f"Rebuilt knowledge graph payload ({len(body)} bytes)")
+    return payload
+
+
+def invalidate_graph():
+    cache.delete(GRAPH_CACHE_KEY)
@@ -0,0 +1,269 @@
+"""
+Portable snapshots of the vector index.
+
+A snapshot is a (optionally compressed) tar archive:
+
+- ``snapshot.json``: format version, embedding model identity, corpus
+  watermark and the size and SHA-256 of every other member. It is written
+  first so it can be read without scanning the archive.
+- ``index/``: a CompactIndex as written by :meth:`CompactIndex.save`,
+  including the full-precision vectors.
+- ``metadata.jsonl``: the compact per-document metadata of the collection.
+
+``import_snapshot`` verifies the checksums, installs the index files into
+VECTOR_INDEX_PATH (workers memory-map them read-only) and ``catch_up``
+then embeds only the materials changed since the watermark.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import CourseMaterial
+from .vector_index import MANIFEST_NAME, CompactIndex, reset_index
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_MANIFEST = 'snapshot.json'
+METADATA_NAME = 'metadata.jsonl'
+COMPRESSION_MODES = {'gz': 'w:gz', 'xz': 'w:xz', 'bz2': 'w:bz2', 'none': 'w'}
+
+
+class SnapshotError(Exception):
+    """The snapshot is unreadable, corrupt or incompatible with this node."""
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _index_path():
+    return str(settings.VECTOR_INDEX_PATH)
+
+
+def export_snapshot(output, vector_store, dtype='int8', dims=None, reduction='pca', compression='gz'):
+    """
+    Write a snapshot of every indexed, still existing material to ``output``.
+
+    Returns:
+        The snapshot manifest dict
+    """
+    import numpy as np
+
+    # Read the watermark first: anything changed while exporting is caught up later
+    watermark = CourseMaterial.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+
+    doc_ids, embeddings = vector_store.get_all_embeddings()
+    metadatas = vector_store.get_all_metadatas()
+    existing = set(CourseMaterial.objects.values_list('id', flat=True))
+    keep = [i for i, doc_id in enumerate(doc_ids) if int(doc_id) in existing]
+    if not keep:
+        raise SnapshotError("The vector store is empty; run index_materials first")
+    ids = np.array([int(doc_ids[i]) for i in keep], dtype=np.int64)
+
+    index = CompactIndex.build(ids, embeddings[keep], dtype=dtype, dims=dims, reduction=reduction)
+
+    with tempfile.TemporaryDirectory() as staging:
+        index.save(os.path.join(staging, 'index'))
+        with open(os.path.join(staging, METADATA_NAME), 'w') as fh:
+            for i in keep:
+                fh.write(json.dumps({'id': doc_ids[i], 'metadata': metadatas.get(doc_ids[i]) or {}}) + '\n')
+
+        members = [f'index/{name}' for name in sorted(os.listdir(os.path.join(staging, 'index')))]
+        members.append(METADATA_NAME)
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'created_at': timezone.now().isoformat(),
+            'model': vector_store.MODEL_NAME,
+            'dimension': vector_store.EMBEDDING_DIMENSION,
+            'count': int(len(ids)),
+            'watermark': watermark.isoformat() if watermark else None,
+            'files': {
+                name: {'size': os.path.getsize(os.path.join(staging, name)), 'sha256': _sha256(os.path.join(staging, name))}
+                for name in members
+            },
+        }
+
+        payload = json.dumps(manifest, indent=2, sort_keys=True).encode()
+        with tarfile.open(output, COMPRESSION_MODES[compression]) as tar:
+            info = tarfile.TarInfo(SNAPSHOT_MANIFEST)
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload))
+            for name in members:
+                tar.add(os.path.join(staging, name), arcname=name, recursive=False)
+    return manifest
+
+
+def read_manifest(snapshot):
+    """Read and validate the manifest of a snapshot archive."""
+    try:
+        with tarfile.open(snapshot, 'r:*') as tar:
+            member = tar.next()
+            if member is None or member.name != SNAPSHOT_MANIFEST:
+                raise SnapshotError(f"{snapshot} is not an index snapshot")
+            manifest = json.load(tar.extractfile(member))
+    except (OSError, tarfile.TarError, ValueError) as e:
+        raise SnapshotError(f"Cannot read {snapshot}: {e}") from e
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {manifest.get('version')!r}")
+    return manifest
+
+
+def import_snapshot(snapshot, vector_store_cls, path=None, force=False):
+    """
+    Verify ``snapshot`` and install its index into ``path`` (VECTOR_INDEX_PATH).
+
+    Only members listed in the manifest are extracted, into a staging
+    directory next to ``path``; each one is checksummed before any file is
+    moved into place.
+
+    Returns:
+        (manifest, metadata): the snapshot manifest and {doc id: metadata}
+    """
+    path = path or _index_path()
+    manifest = read_manifest(snapshot)
+    expected = (vector_store_cls.MODEL_NAME, vector_store_cls.EMBEDDING_DIMENSION)
+    found = (manifest.get('model'), manifest.get('dimension'))
+    if found != expected and not force:
+        raise SnapshotError(f"Snapshot was built with {found[0]} ({found[1]} dims), this node uses {expected[0]} ({expected[1]} dims)")
+
+    files = manifest['files']
+    for name in files:
+        if os.path.isabs(name) or '..' in name.split('/'):
+            raise SnapshotError(f"Refusing to extract {name!r}")
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.index-import-', dir=parent)
+    try:
+        with tarfile.open(snapshot, 'r:*') as tar:
+            for member in tar:
+                if member.name not in files:
+                    continue
+                if not member.isfile():
+                    raise SnapshotError(f"Unexpected member type for {member.name}")
+                target = os.path.join(staging, member.name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with tar.extractfile(member) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+
+        for name, expected_file in files.items():
+            target = os.path.join(staging, name)
+            if not os.path.exists(target):
+                raise SnapshotError(f"Snapshot is missing {name}")
+            if os.path.getsize(target) != expected_file['size'] or _sha256(target) != expected_file['sha256']:
+                raise SnapshotError(f"Checksum mismatch for {name}")
+
+        metadata = {}
+        with open(os.path.join(staging, METADATA_NAME)) as fh:
+            for line in fh:
+                row = json.loads(line)
+                metadata[row['id']] = row['metadata']
+
+        # Files are renamed into place one by one, the manifest last, so
+        # workers that have the old vectors mapped keep reading them
+        os.makedirs(path, exist_ok=True)
+        index_files = sorted(name for name in files if name.startswith('index/'))
+        index_files.sort(key=lambda name: name == f'index/{MANIFEST_NAME}')
+        for name in index_files:
+            os.replace(os.path.join(staging, name), os.path.join(path, os.path.basename(name)))
+        installed = {os.path.basename(name) for name in index_files}
+        for name in os.listdir(path):
+            if name.endswith('.npy') and name not in installed:
+                os.remove(os.path.join(path, name))
+    except (OSError, tarfile.TarError, ValueError, KeyError) as e:
+        raise SnapshotError(f"Cannot import {snapshot}: {e}") from e
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    _set_watermark(path, manifest.get('watermark'))
+    reset_index()
+    return manifest, metadata
+
+
+def _set_watermark(path, watermark):
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    with open(manifest_path) as fh:
+        manifest = json.load(fh)
+    manifest['watermark'] = watermark
+    with open(f'{manifest_path}.tmp', 'w') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+
+
+def load_into_collection(index, metadata, vector_store, batch_size=500):
+    """Copy the snapshot's full-precision vectors into the Chroma collection (no re-embedding)."""
+    ids = index.ids.tolist()
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        vector_store.add_embeddings_batch(
+            batch,
+            index.full[start:start + batch_size],
+            [metadata.get(str(doc_id), {}) for doc_id in batch],
+        )
+
+
+def catch_up(vector_store, path=None, batch_size=50):
+    """
+    Bring the installed index up to date with the database.
+
+    Materials changed after the index watermark are re-embedded, deleted
+    materials are dropped, and the index is saved with the new watermark.
+
+    Returns:
+        (updated, removed) counts
+    """
+    path = path or _index_path()
+    index = CompactIndex.load(path)
+    watermark = parse_datetime(index.manifest.get('watermark') or '')
+
+    new_watermark = CourseMaterial.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+    changed = CourseMaterial.objects.select_related('topic')
+    if watermark is not None:
+        changed = changed.filter(updated_at__gt=watermark)
+
+    updated = 0
+    batch = []
+    for material in changed.iterator(chunk_size=500):
+        document = vector_store.document_for_material(material)
+        if document is None:
+            index.remove([material.id])
+            continue
+        batch.append(document)
+        if len(batch) >= batch_size:
+            updated += _embed_batch(vector_store, index, batch)
+            batch = []
+    if batch:
+        updated += _embed_batch(vector_store, index, batch)
+
+    existing = set(CourseMaterial.objects.values_list('id', flat=True))
+    removed = [material_id for material_id in index.ids.tolist() if material_id not in existing]
+    index.remove(removed)
+
+    index.manifest['watermark'] = new_watermark.isoformat() if new_watermark else None
+    index.save(path)
+    reset_index()
+    logger.info(f"Vector index caught up: {updated} updated, {len(removed)} removed")
+    return updated, len(removed)
+
+
+def _embed_batch(vector_store, index, documents):
+    """Embed documents once and write them to both the collection and the index."""
+    ids = [doc['id'] for doc in documents]
+    embeddings = vector_store.embedding_model.encode([doc['text'] for doc in documents], convert_to_numpy=True)
+    vector_store.add_embeddings_batch(ids, embeddings, [doc['metadata'] for doc in documents])
+    index.add(ids, embeddings)
+    return len(documents)
@@ -0,0 +1,105 @@
+"""
+Django management command to build the compact in-memory vector index.
+Usage: python manage.py build_vector_index --dtype int8 --dims 128 --reduction pca
+       python manage.py build_vector_index --report
+
+Reads every embedding from the Chroma collection, learns the optional PCA
+projection, quantizes and writes the index to VECTOR_INDEX_PATH. Workers
+load it on first search; restart them (or let them reload) after a rebuild.
+
+--report builds a set of configurations in memory and prints the memory
+saved against the recall@10 lost, with and without full-precision
+rescoring, without writing anything.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from courses.models import CourseMaterial
+from courses.vector_index import DTYPES, CompactIndex, recall_at_k, reset_index
+from courses.vector_store import VectorStoreService
+
+REPORT_CONFIGS = [
+    ('float16', None, 'none'),
+    ('int8', None, 'none'),
+    ('float16', 192, 'pca'),
+    ('int8', 192, 'pca'),
+    ('int8', 128, 'pca'),
+    ('int8', 64, 'pca'),
+    ('int8', 128, 'truncate'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Build the compact (float16/int8, optionally PCA-reduced) vector index used for semantic search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dtype', choices=DTYPES, default='int8', help='Storage type of the compact vectors')
+        parser.add_argument('--dims', type=int, default=0, help='Reduce to this many dimensions (0 keeps all)')
+        parser.add_argument(
+            '--reduction',
+            choices=['pca', 'truncate'],
+            default='pca',
+            help='pca: learned projection; truncate: keep the leading dimensions (Matryoshka models)',
+        )
+        parser.add_argument(
+            '--no-full',
+            action='store_true',
+            help='Do not keep full-precision vectors for rescoring (smaller on disk, lower recall)',
+        )
+        parser.add_argument('--path', default=getattr(settings, 'VECTOR_INDEX_PATH', None), help='Output directory')
+        parser.add_argument('--report', action='store_true', help='Compare configurations instead of building')
+        parser.add_argument('--queries', type=int, default=200, help='Sample queries used to measure recall@10')
+
+    def handle(self, *args, **options):
+        vector_store = VectorStoreService()
+        doc_ids, embeddings = vector_store.get_all_embeddings()
+
+        existing = set(CourseMaterial.objects.values_list('id', flat=True))
+        keep = [i for i, doc_id in enumerate(doc_ids) if int(doc_id) in existing]
+        ids = np.array([int(doc_ids[i]) for i in keep], dtype=np.int64)
+        embeddings = embeddings[keep]
+
+        if len(ids) < 11:
+            self.stdout.write(self.style.WARNING('Not enough indexed materials; run index_materials first'))
+            return
+
+        rng = np.random.default_rng(0)
+        queries = rng.choice(len(ids), min(options['queries'], len(ids)), replace=False)
+
+        if options['report']:
+            self.report(ids, embeddings, queries)
+            return
+
+        index = CompactIndex.build(
+            ids, embeddings, dtype=options['dtype'], dims=options['dims'] or None,
+            reduction=options['reduction'], keep_full=not options['no_full'],
+        )
+        self.stdout.write(self.describe(index, embeddings, queries))
+        index.save(options['path'])
+        reset_index()
+        self.stdout.write(self.style.SUCCESS(f"✓ Wrote {len(ids)} vectors to {options['path']}"))
+
+    def report(self, ids, embeddings, queries):
+        self.stdout.write(
+            f'{len(ids)} vectors x {embeddings.shape[1]} dims, '
+            f'float32 baseline {embeddings.astype(np.float32).nbytes / 1024 / 1024:.1f} MB, '
+            f'{len(queries)} queries\n'
+        )
+        for dtype, dims, reduction in REPORT_CONFIGS:
+            if dims and dims >= embeddings.shape[1]:
+                continue
+            index = CompactIndex.build(ids, embeddings, dtype=dtype, dims=dims, reduction=reduction)
+            self.stdout.write(self.describe(index, embeddings, queries))
+
+    def describe(self, index, embeddings, queries):
+        baseline = embeddings.astype(np.float32).nbytes + index.ids.nbytes
+        saved = 1 - index.memory_bytes() / baseline
+        label = f'{index.dtype} x {index.codes.shape[1]}' + (f' ({index.reduction})' if index.reduction != 'none' else '')
+        line = (
+            f'{label:24} {index.memory_bytes() / 1024 / 1024:7.1f} MB resident ({saved:4.0%} saved)  '
+            f'recall@10 {recall_at_k(index, embeddings, queries, rescore_factor=0):.3f}'
+        )
+        if index.full is not None:
+            line += f', rescored {recall_at_k(index, embeddings, queries):.3f}'
+        return line
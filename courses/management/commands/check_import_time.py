@@ -0,0 +1,114 @@
+"""
+Django management command to benchmark the cold import of the URLconf.
+Usage: python manage.py check_import_time --budget 500 --repeat 3
+
+Each run starts a fresh interpreter with ``python -X importtime``, calls
+django.setup() and then imports ROOT_URLCONF. The command fails (non-zero
+exit) if the fastest URLconf import exceeds the budget, so heavy
+dependencies (torch, chromadb, the Gemini SDK) creeping back into module
+scope are caught in CI.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CHILD_SCRIPT = """
+import json, sys, time
+import django
+start = time.perf_counter()
+django.setup()
+setup_done = time.perf_counter()
+# __import__ rather than importlib.import_module: only the former is logged by -X importtime
+__import__(sys.argv[1])
+end = time.perf_counter()
+print(json.dumps({'setup_ms': (setup_done - start) * 1000, 'urlconf_ms': (end - setup_done) * 1000}))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into (module, self_us, cumulative_us, depth) tuples."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        name = parts[2]
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+def urlconf_imports(rows, urlconf):
+    """Modules first imported while importing ``urlconf`` (its subtree in the import tree)."""
+    for index, (name, _, _, depth) in enumerate(rows):
+        if name == urlconf:
+            children = []
+            for row in reversed(rows[:index]):
+                if row[3] <= depth:
+                    break
+                children.append(row)
+            return rows[index], children
+    return None, []
+
+
+class Command(BaseCommand):
+    help = 'Measure the cold import time of the URLconf and fail if it exceeds a budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget',
+            type=float,
+            default=getattr(settings, 'IMPORT_TIME_BUDGET_MS', 500),
+            help='Maximum URLconf import time in milliseconds',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of fresh interpreters to run; the fastest run is compared to the budget',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Number of heaviest modules to list',
+        )
+
+    def handle(self, *args, **options):
+        urlconf = settings.ROOT_URLCONF
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+
+        best = None
+        for _ in range(max(1, options['repeat'])):
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, urlconf],
+                capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+            )
+            if proc.returncode != 0:
+                raise CommandError(f'Importing {urlconf} failed:\n{proc.stderr[-2000:]}')
+            timings = json.loads(proc.stdout.strip().splitlines()[-1])
+            if best is None or timings['urlconf_ms'] < best[0]['urlconf_ms']:
+                best = (timings, proc.stderr)
+
+        timings, stderr = best
+        _, children = urlconf_imports(parse_importtime(stderr), urlconf)
+
+        self.stdout.write(f"django.setup(): {timings['setup_ms']:.0f} ms")
+        self.stdout.write(f"import {urlconf}: {timings['urlconf_ms']:.0f} ms (budget {options['budget']:.0f} ms)")
+        if children:
+            self.stdout.write(f'\nHeaviest modules imported by {urlconf} (cumulative):')
+            for name, _, cumulative_us, depth in sorted(children, key=lambda row: -row[2])[:options['top']]:
+                self.stdout.write(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+
+        if timings['urlconf_ms'] > options['budget']:
+            raise CommandError(
+                f"URLconf import took {timings['urlconf_ms']:.0f} ms, over the {options['budget']:.0f} ms budget"
+            )
+        self.stdout.write(self.style.SUCCESS('✓ URLconf import is within budget'))
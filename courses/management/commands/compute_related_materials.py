@@ -0,0 +1,77 @@
+"""
+Django management command to precompute embedding-similarity neighbours for every material.
+Usage: python manage.py compute_related_materials --top-k 5 --block-size 1024
+
+Similarities are computed in row blocks so memory stays bounded on large
+collections. Day-to-day changes are handled incrementally on save; run this
+after a full re-index.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.graph_service import invalidate_graph
+from courses.models import CourseMaterial, RelatedMaterial
+from courses.similarity import blocked_top_k, normalize
+from courses.vector_store import VectorStoreService
+
+
+class Command(BaseCommand):
+    help = 'Compute top-k similar materials from stored embeddings (used by the knowledge graph)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=getattr(settings, 'RELATED_MATERIALS_TOP_K', 5),
+            help='Number of neighbours to keep per material',
+        )
+        parser.add_argument(
+            '--min-score',
+            type=float,
+            default=getattr(settings, 'RELATED_MATERIALS_MIN_SCORE', 0.0),
+            help='Discard neighbours with cosine similarity below this value',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=1024,
+            help='Rows of the similarity matrix computed at a time',
+        )
+
+    def handle(self, *args, **options):
+        top_k = options['top_k']
+        vector_store = VectorStoreService()
+        doc_ids, embeddings = vector_store.get_all_embeddings()
+
+        # Only keep vectors whose material still exists
+        existing = set(CourseMaterial.objects.values_list('id', flat=True))
+        keep = [i for i, doc_id in enumerate(doc_ids) if int(doc_id) in existing]
+        material_ids = np.array([int(doc_ids[i]) for i in keep], dtype=np.int64)
+        embeddings = embeddings[keep]
+
+        if len(material_ids) < 2:
+            self.stdout.write(self.style.WARNING('Not enough indexed materials; run index_materials first'))
+            return
+
+        self.stdout.write(f'Computing neighbours for {len(material_ids)} materials')
+
+        top, scores = blocked_top_k(normalize(embeddings), top_k, options['block_size'])
+
+        rows = []
+        for i, (neighbours, neighbour_scores) in enumerate(zip(top, scores)):
+            for rank, (j, score) in enumerate(zip(neighbours, neighbour_scores)):
+                if score < options['min_score']:
+                    break
+                rows.append(RelatedMaterial(
+                    material_id=int(material_ids[i]), related_id=int(material_ids[j]),
+                    score=float(score), rank=rank,
+                ))
+
+        with transaction.atomic():
+            RelatedMaterial.objects.all().delete()
+            RelatedMaterial.objects.bulk_create(rows, batch_size=1000)
+        invalidate_graph()
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Stored {len(rows)} related-material links'))
@@ -0,0 +1,46 @@
+"""
+Django management command to compute MinHash signatures for near-duplicate detection.
+Usage: python manage.py compute_signatures [--rebuild] [--report]
+
+Signatures are maintained on save; run this once to backfill existing
+materials, or with --rebuild after changing the shingling parameters.
+--report lists groups of near-duplicate materials.
+"""
+
+from django.core.management.base import BaseCommand
+from courses.dedup import find_near_duplicates, material_text, update_signature
+from courses.models import CourseMaterial, MaterialSignature, MinHashBucket
+
+
+class Command(BaseCommand):
+    help = 'Compute MinHash/LSH signatures of all materials (near-duplicate detection)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute every signature')
+        parser.add_argument('--report', action='store_true', help='List near-duplicate groups afterwards')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            MinHashBucket.objects.all().delete()
+            MaterialSignature.objects.all().delete()
+
+        materials = CourseMaterial.objects.only('id', 'title', 'description', 'text_content')
+        count = 0
+        for material in materials.iterator(chunk_size=500):
+            update_signature(material)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Checked {count} materials, {MaterialSignature.objects.count()} have signatures'
+        ))
+
+        if not options['report']:
+            return
+        seen = set()
+        for material in materials.filter(signature__isnull=False).iterator(chunk_size=500):
+            if material.id in seen:
+                continue
+            duplicates = find_near_duplicates(material_text(material), exclude_id=material.id, limit=20)
+            if duplicates:
+                seen.update(duplicate.id for duplicate, _ in duplicates)
+                listed = ', '.join(f'#{duplicate.id} ({score:.0%})' for duplicate, score in duplicates)
+                self.stdout.write(f'#{material.id} {material.title[:60]}: {listed}')
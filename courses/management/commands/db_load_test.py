@@ -0,0 +1,112 @@
+"""
+Django management command to measure concurrent write throughput of the configured database.
+Usage: python manage.py db_load_test --threads 8 --writes 200 --mode insert
+
+Each thread uses its own connection and performs small write transactions,
+like request threads and background tasks do. ``insert`` appends usage
+events; ``counter`` increments one hot UsageCounter row (worst-case lock
+contention). Rows written by the test are removed afterwards.
+"""
+
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from courses.metering import increment_counter
+from courses.models import LLMUsageEvent, UsageCounter
+
+LOAD_TEST_NAME = 'db_load_test'
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent write throughput and latency of the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent writers')
+        parser.add_argument('--writes', type=int, default=200, help='Write transactions per thread')
+        parser.add_argument(
+            '--mode',
+            choices=['insert', 'counter'],
+            default='insert',
+            help='insert: append rows; counter: update one hot row',
+        )
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        writes = options['writes']
+        mode = options['mode']
+
+        self.stdout.write(f'Database: {connection.vendor} {self._describe()}')
+        self.stdout.write(f'{threads} threads x {writes} {mode} transactions')
+
+        barrier = threading.Barrier(threads)
+        results = []
+        results_lock = threading.Lock()
+
+        def worker():
+            latencies = []
+            errors = 0
+            try:
+                barrier.wait()
+                for _ in range(writes):
+                    start = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            if mode == 'counter':
+                                increment_counter(LOAD_TEST_NAME, 1)
+                            else:
+                                LLMUsageEvent.objects.create(endpoint=LOAD_TEST_NAME, created_at=timezone.now())
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+                with results_lock:
+                    results.append((latencies, errors))
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for thread_latencies, _ in results for latency in thread_latencies)
+        errors = sum(thread_errors for _, thread_errors in results)
+
+        LLMUsageEvent.objects.filter(endpoint=LOAD_TEST_NAME).delete()
+        UsageCounter.objects.filter(name=LOAD_TEST_NAME).delete()
+
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'All {errors} writes failed'))
+            return
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {len(latencies)} writes in {elapsed:.2f}s: {len(latencies) / elapsed:.0f} writes/s'
+        ))
+        self.stdout.write(
+            f'  latency ms: mean {statistics.mean(latencies) * 1000:.1f}, p50 {percentile(0.50):.1f}, '
+            f'p95 {percentile(0.95):.1f}, p99 {percentile(0.99):.1f}, max {latencies[-1] * 1000:.1f}'
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f'  {errors} writes failed (database locked or timed out)'))
+
+    def _describe(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                journal = cursor.fetchone()[0]
+                cursor.execute('PRAGMA synchronous')
+                synchronous = cursor.fetchone()[0]
+            return f'(journal_mode={journal}, synchronous={synchronous})'
+        options = connection.settings_dict.get('OPTIONS', {})
+        pooled = 'pooled' if options.get('pool') else f"CONN_MAX_AGE={connection.settings_dict.get('CONN_MAX_AGE')}"
+        return f'({pooled})'
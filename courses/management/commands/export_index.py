@@ -0,0 +1,41 @@
+"""
+Django management command to export the vector index as a portable snapshot.
+Usage: python manage.py export_index snapshot.tar.gz --dtype int8 --compression gz
+
+The snapshot holds the compact and full-precision vectors, ids, compact
+metadata, the embedding model identity and a corpus watermark (latest
+CourseMaterial.updated_at), with a SHA-256 per file. Load it on another
+node with import_index.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from courses.index_snapshot import COMPRESSION_MODES, SnapshotError, export_snapshot
+from courses.vector_index import DTYPES
+from courses.vector_store import VectorStoreService
+
+
+class Command(BaseCommand):
+    help = 'Export the vector index as a versioned, checksummed, compressed snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Snapshot file to write')
+        parser.add_argument('--dtype', choices=DTYPES, default='int8', help='Storage type of the compact vectors')
+        parser.add_argument('--dims', type=int, default=0, help='Reduce to this many dimensions (0 keeps all)')
+        parser.add_argument('--reduction', choices=['pca', 'truncate'], default='pca')
+        parser.add_argument('--compression', choices=sorted(COMPRESSION_MODES), default='gz')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = export_snapshot(
+                options['output'], VectorStoreService(), dtype=options['dtype'],
+                dims=options['dims'] or None, reduction=options['reduction'],
+                compression=options['compression'],
+            )
+        except SnapshotError as e:
+            raise CommandError(str(e))
+
+        size = sum(f['size'] for f in manifest['files'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Exported {manifest['count']} vectors ({manifest['model']}) to {options['output']}"
+        ))
+        self.stdout.write(f"  watermark {manifest['watermark']}, {size / 1024 / 1024:.1f} MB uncompressed")
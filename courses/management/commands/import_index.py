@@ -0,0 +1,60 @@
+"""
+Django management command to install a vector index snapshot on this node.
+Usage: python manage.py import_index snapshot.tar.gz [--load-collection] [--no-catch-up]
+
+The snapshot is verified and its files are installed into VECTOR_INDEX_PATH,
+from where workers memory-map them read-only and serve semantic search
+straight away. Materials changed since the snapshot's watermark are then
+embedded incrementally (--catch-up-only repeats just that step).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.index_snapshot import SnapshotError, catch_up, import_snapshot, load_into_collection
+from courses.vector_index import CompactIndex
+from courses.vector_store import VectorStoreService
+
+
+class Command(BaseCommand):
+    help = 'Install a vector index snapshot and catch up from its watermark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', nargs='?', help='Snapshot file written by export_index')
+        parser.add_argument(
+            '--load-collection',
+            action='store_true',
+            help='Also copy the vectors into the Chroma collection (needed for filtered queries)',
+        )
+        parser.add_argument('--no-catch-up', action='store_true', help='Skip embedding materials changed since the snapshot')
+        parser.add_argument('--catch-up-only', action='store_true', help='Only catch up the installed index')
+        parser.add_argument('--force', action='store_true', help='Import even if the embedding model differs')
+
+    def handle(self, *args, **options):
+        if not options['catch_up_only']:
+            if not options['snapshot']:
+                raise CommandError('A snapshot file is required')
+            started = time.perf_counter()
+            try:
+                manifest, metadata = import_snapshot(options['snapshot'], VectorStoreService, force=options['force'])
+            except SnapshotError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Installed {manifest['count']} vectors in {time.perf_counter() - started:.1f}s "
+                f"(watermark {manifest['watermark']})"
+            ))
+
+            if options['load_collection']:
+                vector_store = VectorStoreService()
+                load_into_collection(CompactIndex.load(str(settings.VECTOR_INDEX_PATH)), metadata, vector_store)
+                self.stdout.write(self.style.SUCCESS('✓ Copied vectors into the Chroma collection'))
+
+        if options['no_catch_up']:
+            return
+        try:
+            updated, removed = catch_up(VectorStoreService())
+        except (ImportError, OSError, ValueError) as e:
+            raise CommandError(f'Catch-up failed: {e}')
+        self.stdout.write(self.style.SUCCESS(f'✓ Caught up: {updated} materials embedded, {removed} removed'))
+
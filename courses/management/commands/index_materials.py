@@ -4,6 +4,7 @@ Usage: python manage.py index_materials
 """
 
 from django.core.management.base import BaseCommand
+from courses.dedup import mark_embedded
 from courses.models import CourseMaterial
 from courses.vector_store import VectorStoreService
 from tqdm import tqdm
@@ -39,7 +40,7 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS('Index cleared'))
             
             # Get all course materials
-            materials = CourseMaterial.objects.all()
+            materials = CourseMaterial.objects.select_related('topic')
             total_count = materials.count()
             
             if total_count == 0:
@@ -52,41 +53,24 @@ class Command(BaseCommand):
             batch_size = options['batch_size']
             documents = []
             indexed_count = 0
+            text_bytes = 0
             
             # Process materials with progress bar
             for material in tqdm(materials, desc="Indexing materials", unit="doc"):
-                # Combine title, description, and content for better search
-                text_content = f"{material.title}\n\n"
-                
-                if material.description:
-                    text_content += f"{material.description}\n\n"
-                
-                if material.text_content:
-                    text_content += material.text_content
+                document = VectorStoreService.document_for_material(material)
                 
                 # Skip if no meaningful content
-                if len(text_content.strip()) < 10:
+                if document is None:
                     continue
                 
-                # Prepare metadata
-                metadata = {
-                    'title': material.title,
-                    'file_type': material.file_type,
-                    'topic_name': material.topic.name if material.topic else 'N/A',
-                    'tags': material.tags or '',
-                }
-                
-                # Add to batch
-                documents.append({
-                    'id': material.id,
-                    'text': text_content,
-                    'metadata': metadata
-                })
+                documents.append(document)
+                text_bytes += len(document['text'].encode('utf-8'))
                 
                 # Process batch when it reaches batch_size
                 if len(documents) >= batch_size:
                     try:
                         vector_store.add_documents_batch(documents)
+                        mark_embedded(documents)
                         indexed_count += len(documents)
                         documents = []  # Clear batch
                     except Exception as e:
@@ -98,6 +82,7 @@ class Command(BaseCommand):
             if documents:
                 try:
                     vector_store.add_documents_batch(documents)
+                    mark_embedded(documents)
                     indexed_count += len(documents)
                 except Exception as e:
                     self.stdout.write(
@@ -122,6 +107,10 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(
                 f'✓ Vector dimension: {stats["embedding_dimension"]}'
             ))
+            if not stats.get('stores_documents', True):
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ Document text not duplicated in the vector store ({text_bytes / 1024 / 1024:.1f} MB kept in the database only)'
+                ))
             
         except Exception as e:
             self.stdout.write(
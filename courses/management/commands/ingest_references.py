@@ -0,0 +1,90 @@
+"""
+Django management command to build the offline reference store.
+Usage: python manage.py ingest_references extracts.jsonl.gz
+       python manage.py ingest_references extracts.jsonl --no-embeddings --max-chars 1500
+
+The input has one JSON object per line with a "title" and an "extract"
+(or "text"/"abstract"), e.g. a curated export of Wikipedia introductions;
+.gz and .bz2 files are read compressed. The store replaces the previous
+one at REFERENCE_STORE_PATH and is used by RAGService as external context
+instead of live Wikipedia requests.
+"""
+
+import bz2
+import gzip
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.reference_store import ReferenceStore, prepare_entries, reset_store
+from courses.vector_store import AVAILABLE as VECTOR_STORE_AVAILABLE, VectorStoreService, _get_embedding_model
+
+TEXT_KEYS = ('extract', 'text', 'abstract')
+
+
+def open_input(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class Command(BaseCommand):
+    help = 'Ingest a JSONL file of encyclopedic extracts into the offline reference store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='JSONL file (optionally .gz or .bz2)')
+        parser.add_argument('--path', default=getattr(settings, 'REFERENCE_STORE_PATH', None), help='Output directory')
+        parser.add_argument('--max-chars', type=int, default=2000, help='Maximum stored characters per extract')
+        parser.add_argument('--no-embeddings', action='store_true', help='Title lookup only (no embedding model needed)')
+        parser.add_argument('--batch-size', type=int, default=256)
+
+    def handle(self, *args, **options):
+        rows = []
+        skipped = 0
+        try:
+            with open_input(options['input']) as fh:
+                for line in fh:
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    text = next((row[key] for key in TEXT_KEYS if row.get(key)), None) if isinstance(row, dict) else None
+                    if not text or not row.get('title'):
+                        skipped += 1
+                        continue
+                    rows.append((str(row['title']), str(text)))
+        except (OSError, EOFError, UnicodeDecodeError) as e:
+            raise CommandError(f"Cannot read {options['input']}: {e}")
+
+        entries = prepare_entries(rows, max_chars=options['max_chars'])
+        self.stdout.write(f"{len(entries)} entries ({len(rows) - len(entries)} duplicates, {skipped} invalid lines skipped)")
+
+        embeddings = None
+        if not options['no_embeddings']:
+            if not VECTOR_STORE_AVAILABLE:
+                self.stdout.write(self.style.WARNING('sentence-transformers not installed; storing titles only'))
+            else:
+                embeddings = self.embed(entries, options['batch_size'])
+
+        manifest = ReferenceStore.write(
+            options['path'], entries, embeddings=embeddings, model=VectorStoreService.MODEL_NAME,
+        )
+        reset_store()
+        self.stdout.write(self.style.SUCCESS(f"✓ Wrote {manifest['count']} entries to {options['path']}"))
+
+    def embed(self, entries, batch_size):
+        model = _get_embedding_model(VectorStoreService.MODEL_NAME)
+        chunks = []
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            vectors = model.encode([f"{title}. {extract[:500]}" for title, extract in batch], convert_to_numpy=True)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            chunks.append((vectors / np.where(norms == 0, 1, norms)).astype(np.float16))
+            self.stdout.write(f"  embedded {min(start + batch_size, len(entries))}/{len(entries)}")
+        return np.concatenate(chunks) if chunks else np.zeros((0, VectorStoreService.EMBEDDING_DIMENSION), np.float16)
@@ -0,0 +1,115 @@
+"""
+Django management command to pre-generate flashcard decks and quiz variants per Topic.
+Intended to run nightly, e.g. from cron:
+    0 2 * * * cd /path/to/project && python manage.py pregenerate_topic_content
+Usage: python manage.py pregenerate_topic_content --variants 3 --concurrency 2
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from courses.generation_cache import GenerationCache
+from courses.models import PregeneratedContent, Topic
+from courses.rag_service import RAGService
+
+
+class Command(BaseCommand):
+    help = 'Pre-generate flashcard decks and quiz variants for each Topic'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--variants',
+            type=int,
+            default=3,
+            help='Number of variants to generate per topic and generator',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Maximum number of concurrent Gemini requests',
+        )
+        parser.add_argument(
+            '--kind',
+            choices=['all', 'quiz', 'flashcards'],
+            default='all',
+            help='Which generator to run',
+        )
+        parser.add_argument(
+            '--topic',
+            type=int,
+            action='append',
+            dest='topic_ids',
+            help='Only process the given Topic id (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        variants = max(1, options['variants'])
+        topics = Topic.objects.all().order_by('id')
+        if options['topic_ids']:
+            topics = topics.filter(id__in=options['topic_ids'])
+        topics = list(topics)
+
+        if not topics:
+            self.stdout.write(self.style.WARNING('No topics found'))
+            return
+
+        rag = RAGService()
+        if not rag.model:
+            self.stdout.write(self.style.ERROR('Gemini API Key not configured, nothing to generate'))
+            return
+
+        kinds = ['QUIZ', 'FLASHCARDS'] if options['kind'] == 'all' else [options['kind'].upper()]
+        versions = {
+            'QUIZ': RAGService.QUIZ_PROMPT_VERSION,
+            'FLASHCARDS': RAGService.FLASHCARDS_PROMPT_VERSION,
+        }
+
+        # Retrieval touches the database, so do it up front on the main thread;
+        # worker threads only wait on Gemini.
+        jobs = []
+        for topic in topics:
+            results = rag.search(topic.name) if 'QUIZ' in kinds else []
+            for generator in kinds:
+                for variant in range(variants):
+                    if generator == 'QUIZ':
+                        producer = (lambda name=topic.name, res=results: rag._generate_quiz(name, res))
+                    else:
+                        producer = (lambda name=topic.name: rag._generate_flashcards(name))
+                    jobs.append((topic, generator, variant, producer))
+
+        self.stdout.write(
+            f'Generating {len(jobs)} items for {len(topics)} topics '
+            f'with concurrency {options["concurrency"]}'
+        )
+
+        stored = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as executor:
+            futures = {executor.submit(job[3]): job for job in jobs}
+            for future in as_completed(futures):
+                topic, generator, variant, _ = futures[future]
+                try:
+                    payload = future.result()
+                except Exception as e:
+                    payload = None
+                    self.stdout.write(self.style.ERROR(f'{topic.name} {generator} #{variant}: {e}'))
+
+                if not GenerationCache.is_cacheable(payload):
+                    failed += 1
+                    continue
+
+                PregeneratedContent.objects.update_or_create(
+                    topic=topic, generator=generator, variant=variant,
+                    defaults={'payload': payload, 'prompt_version': versions[generator]},
+                )
+                stored += 1
+
+        # Drop variants beyond the requested count from earlier runs
+        PregeneratedContent.objects.filter(
+            topic__in=topics, generator__in=kinds, variant__gte=variants
+        ).delete()
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Stored {stored} pre-generated items'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} items failed and were skipped'))
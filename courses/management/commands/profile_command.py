@@ -0,0 +1,30 @@
+"""
+Django management command to profile another management command.
+Usage: python manage.py profile_command index_materials --batch-size 50
+       python manage.py profile_command --mode cprofile index_materials
+
+Writes the profile to PROFILER_OUTPUT_DIR like the request profiler does.
+"""
+
+import argparse
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from courses.profiling import FORMATS, MODES, profile
+
+
+class Command(BaseCommand):
+    help = 'Run a management command under the profiler (e.g. index_materials)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('command_name', help='Management command to profile')
+        parser.add_argument('command_args', nargs=argparse.REMAINDER, help='Arguments passed to the command')
+        parser.add_argument('--mode', choices=MODES, help='Collector (default: PROFILER_MODE)')
+        parser.add_argument('--format', dest='fmt', choices=FORMATS, help='Output format in sampling mode (default: PROFILER_FORMAT)')
+        parser.add_argument('--interval', type=float, help='Seconds between samples (default: PROFILER_INTERVAL)')
+
+    def handle(self, *args, **options):
+        name = options['command_name']
+        with profile(name, mode=options['mode'], fmt=options['fmt'], interval=options['interval']) as result:
+            call_command(name, *options['command_args'], stdout=self.stdout, stderr=self.stderr)
+        self.stdout.write(self.style.SUCCESS(f'✓ Profile written to {result.path}'))
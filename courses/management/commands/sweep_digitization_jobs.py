@@ -0,0 +1,20 @@
+"""
+Django management command to recover digitization jobs orphaned by a restart.
+Usage: python manage.py sweep_digitization_jobs
+
+PENDING jobs older than DIGITIZATION_STALE_SECONDS are queued again and
+PROCESSING jobs older than that are marked FAILED (see
+courses.digitization.sweep_stale_jobs). Status polling sweeps its own batch
+the same way; run this from cron or at startup to cover batches nobody polls.
+"""
+
+from django.core.management.base import BaseCommand
+from courses.digitization import sweep_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Requeue stale PENDING digitization jobs and fail stale PROCESSING ones'
+
+    def handle(self, *args, **options):
+        requeued, failed = sweep_stale_jobs()
+        self.stdout.write(self.style.SUCCESS(f'✓ {requeued} jobs requeued, {failed} marked failed'))
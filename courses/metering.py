@@ -0,0 +1,209 @@
+"""
+Usage metering for LLM calls.
+
+Every Gemini call (and every generation cache hit) is recorded with its
+endpoint, latency, token counts and whether it was rate limited. Events are
+buffered in memory and batch-inserted by the background pool, so metering
+never adds a database write to the request path; a buffer that is not
+filled is flushed at the latest USAGE_METER_FLUSH_INTERVAL seconds after its
+first event. Running totals in
+UsageCounter (and the dashboard's cached copy) are incremented at flush time.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from . import background
+from .circuit_breaker import get_breaker
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = 'gemini-2.5-flash'
+
+# Cache key of the incrementally maintained "AI interactions" total
+AI_USAGE_CACHE_KEY = 'dashboard:ai_usage'
+
+
+class LLMCall:
+    """Mutable record filled in while a metered call runs."""
+
+    __slots__ = (
+        'endpoint', 'model_name', 'latency_ms', 'prompt_tokens', 'completion_tokens',
+        'cache_hit', 'rate_limited', 'success', 'response', 'created_at',
+    )
+
+    def __init__(self, endpoint, model_name=DEFAULT_MODEL_NAME, cache_hit=False):
+        self.endpoint = endpoint
+        self.model_name = model_name
+        self.latency_ms = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hit = cache_hit
+        self.rate_limited = False
+        self.success = True
+        self.response = None
+        self.created_at = timezone.now()
+
+    def read_usage(self):
+        """Copy token counts from the Gemini response, once it has been consumed."""
+        usage = getattr(self.response, 'usage_metadata', None)
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+            self.completion_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+
+
+class UsageMeter:
+    """Thread-safe in-memory buffer of LLMCall records, flushed in batches."""
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'USAGE_METERING_ENABLED', True)
+        self.batch_size = getattr(settings, 'USAGE_METER_BATCH_SIZE', 50)
+        self.flush_interval = getattr(settings, 'USAGE_METER_FLUSH_INTERVAL', 10)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def record(self, call):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._buffer.append(call)
+            due = (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            if not due and self._timer is None:
+                # Bound how long events wait if no further call arrives to trigger the flush
+                self._timer = threading.Timer(self.flush_interval, self._flush_due)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            background.submit(self.flush, key='usage-meter-flush')
+
+    def _flush_due(self):
+        with self._lock:
+            if self._timer is threading.current_thread():
+                self._timer = None
+        background.submit(self.flush, key='usage-meter-flush')
+
+    def flush(self):
+        """Insert buffered events in one batch and bump the running counters."""
+        from .models import LLMUsageEvent
+
+        with self._lock:
+            calls, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not calls:
+            return
+
+        LLMUsageEvent.objects.bulk_create([
+            LLMUsageEvent(
+                endpoint=call.endpoint[:50], model_name=call.model_name or '',
+                latency_ms=call.latency_ms, prompt_tokens=call.prompt_tokens,
+                completion_tokens=call.completion_tokens, cache_hit=call.cache_hit,
+                rate_limited=call.rate_limited, success=call.success, created_at=call.created_at,
+            )
+            for call in calls
+        ], batch_size=500)
+
+        totals = {
+            'llm_calls': len(calls),
+            'cache_hits': sum(call.cache_hit for call in calls),
+            'rate_limited': sum(call.rate_limited for call in calls),
+            'prompt_tokens': sum(call.prompt_tokens for call in calls),
+            'completion_tokens': sum(call.completion_tokens for call in calls),
+        }
+        for name, amount in totals.items():
+            if amount:
+                increment_counter(name, amount)
+
+        try:
+            cache.incr(AI_USAGE_CACHE_KEY, len(calls))
+        except ValueError:
+            # Not cached yet; the dashboard loads it from UsageCounter on first view
+            pass
+        logger.debug(f"Flushed {len(calls)} usage events")
+
+
+def increment_counter(name, amount):
+    from .models import UsageCounter
+
+    if UsageCounter.objects.filter(name=name).update(value=F('value') + amount):
+        return
+    try:
+        UsageCounter.objects.create(name=name, value=amount)
+    except IntegrityError:
+        UsageCounter.objects.filter(name=name).update(value=F('value') + amount)
+
+
+def counter_value(name):
+    from .models import UsageCounter
+
+    return UsageCounter.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
+meter = UsageMeter()
+atexit.register(meter.flush)
+
+
+@contextmanager
+def track_llm_call(endpoint, model_name=DEFAULT_MODEL_NAME):
+    """
+    Meter (and trace, as stage ``gemini.<endpoint>``) the LLM call made
+    inside the block. Assign the Gemini response to
+    ``call.response`` so token counts can be read; for streamed responses keep
+    the block open until the stream has been consumed.
+
+        with track_llm_call('rag.answer') as call:
+            call.response = self.model.generate_content(prompt)
+
+    The call goes through the ``gemini`` circuit breaker: while it is open
+    the block is not entered and CircuitOpenError is raised (and not metered).
+    """
+    breaker = get_breaker('gemini')
+    breaker.before_call()
+    call = LLMCall(endpoint, model_name)
+    start = time.perf_counter()
+    try:
+        with span(f"gemini.{endpoint}"):
+            yield call
+    except GeneratorExit:
+        # A stream closed by the client says nothing about Gemini's health
+        breaker.release()
+        raise
+    except Exception as e:
+        breaker.record(failed=True)
+        call.success = False
+        call.rate_limited = '429' in str(e)
+        raise
+    else:
+        breaker.record(failed=False)
+    finally:
+        call.latency_ms = int((time.perf_counter() - start) * 1000)
+        try:
+            call.read_usage()
+        except Exception:
+            # Usage metadata of an interrupted stream may be unavailable
+            pass
+        meter.record(call)
+
+
+def record_cache_hit(endpoint, latency_ms=0):
+    """Record a request answered from a cache without calling the model."""
+    call = LLMCall(endpoint, model_name='', cache_hit=True)
+    call.latency_ms = latency_ms
+    meter.record(call)
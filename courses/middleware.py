@@ -0,0 +1,95 @@
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .profiling import profile
+from .tracing import DEBUG_HEADER, STAGE_DURATION, end_trace, should_sample, start_trace, tracing_enabled
+
+
+class TracingMiddleware:
+    """
+    Samples requests for stage tracing (see courses.tracing).
+
+    Staff users (or anyone when DEBUG is on) can force a trace by sending
+    ``X-Debug-Timing: 1``; the stage timings then come back in a
+    ``Server-Timing`` header, which browser dev tools display directly.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not tracing_enabled():
+            return self.get_response(request)
+
+        debug = self._debug_requested(request)
+        trace, token = start_trace(sampled=debug or should_sample())
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_trace(token)
+
+        if trace.sampled:
+            seconds = time.perf_counter() - start
+            STAGE_DURATION.observe('http.request', seconds)
+            if debug:
+                trace.spans.append(('http.request', seconds))
+                response['Server-Timing'] = trace.server_timing()
+        return response
+
+    @staticmethod
+    def _debug_requested(request):
+        if request.META.get(DEBUG_HEADER) != '1':
+            return False
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in request profiler (see courses.profiling).
+
+    Profiles PROFILER_SAMPLE_RATE of requests, every request whose path starts
+    with one of PROFILER_PATHS, and requests from staff users (or anyone when
+    DEBUG is on) sending ``X-Profile: 1``. The latter get the file name back in
+    an ``X-Profile-File`` header. Only the view is profiled; the body of a
+    streaming response is produced after the profile is written.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.sample_rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+        self.paths = tuple(getattr(settings, 'PROFILER_PATHS', ()))
+
+    def __call__(self, request):
+        requested = self._header_requested(request)
+        if not (requested or self._selected(request)):
+            return self.get_response(request)
+
+        with profile(f"{request.method} {request.path}") as result:
+            response = self.get_response(request)
+        if requested:
+            response['X-Profile-File'] = os.path.basename(result.path)
+        return response
+
+    def _selected(self, request):
+        if self.paths and request.path.startswith(self.paths):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def _header_requested(request):
+        if request.META.get('HTTP_X_PROFILE') != '1':
+            return False
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return bool(user is not None and user.is_authenticated and user.is_staff)
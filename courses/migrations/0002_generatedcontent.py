@@ -0,0 +1,35 @@
+# Generated by Django 5.2.9 on 2026-10-19 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('generator', models.CharField(choices=[('QUIZ', 'Quiz'), ('FLASHCARDS', 'Flashcards'), ('VIDEO', 'Video Script')], max_length=20)),
+                ('query', models.CharField(max_length=255)),
+                ('source_hash', models.CharField(max_length=64)),
+                ('prompt_version', models.PositiveIntegerField(default=1)),
+                ('payload', models.JSONField()),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('misses', models.PositiveIntegerField(default=1, help_text='Number of times this entry was (re)generated')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('refreshed_at', models.DateTimeField(auto_now_add=True)),
+                ('last_accessed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Generated content cache entry',
+                'verbose_name_plural': 'Generated content cache',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0002_generatedcontent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PregeneratedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generator', models.CharField(choices=[('QUIZ', 'Quiz'), ('FLASHCARDS', 'Flashcards')], max_length=20)),
+                ('variant', models.PositiveIntegerField(default=0)),
+                ('prompt_version', models.PositiveIntegerField(default=1)),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pregenerated', to='courses.topic')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['topic', 'generator', 'prompt_version'], name='courses_pre_topic_i_13705d_idx')],
+                'constraints': [models.UniqueConstraint(fields=('topic', 'generator', 'variant'), name='unique_pregenerated_variant')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_digitizationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedMaterial',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text="Cosine similarity of the two materials' embeddings")),
+                ('rank', models.PositiveSmallIntegerField(default=0)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='courses.coursematerial')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.coursematerial')),
+            ],
+            options={
+                'ordering': ['material', 'rank'],
+                'indexes': [models.Index(fields=['material', 'rank'], name='courses_rel_materia_132e25_idx')],
+                'constraints': [models.UniqueConstraint(fields=('material', 'related'), name='unique_related_material')],
+            },
+        ),
+    ]
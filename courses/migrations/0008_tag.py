@@ -0,0 +1,57 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_llmusageevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MaterialTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_links', to='courses.coursematerial')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='material_links', to='courses.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='coursematerial',
+            name='normalized_tags',
+            field=models.ManyToManyField(blank=True, related_name='materials', through='courses.MaterialTag', to='courses.tag'),
+        ),
+        migrations.AddIndex(
+            model_name='coursematerial',
+            index=models.Index(fields=['file_type'], name='courses_cou_file_ty_55be31_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursematerial',
+            index=models.Index(fields=['category'], name='courses_cou_categor_d2c0a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursematerial',
+            index=models.Index(fields=['week'], name='courses_cou_week_b1f81e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursematerial',
+            index=models.Index(fields=['topic', 'week'], name='courses_cou_topic_i_385d5d_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='materialtag',
+            constraint=models.UniqueConstraint(fields=('material', 'tag'), name='unique_material_tag'),
+        ),
+    ]
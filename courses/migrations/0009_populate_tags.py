@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def populate_tags(apps, schema_editor):
+    """Parse the comma-separated CourseMaterial.tags text into Tag/MaterialTag rows."""
+    CourseMaterial = apps.get_model('courses', 'CourseMaterial')
+    Tag = apps.get_model('courses', 'Tag')
+    MaterialTag = apps.get_model('courses', 'MaterialTag')
+
+    material_tags = {}
+    for material_id, text in CourseMaterial.objects.exclude(tags='').values_list('id', 'tags').iterator():
+        names = []
+        for part in (text or '').split(','):
+            # Same normalization as courses.tagging.normalize_tag
+            name = " ".join(part.strip().lstrip('#').lower().split())[:50]
+            if name and name not in names:
+                names.append(name)
+        if names:
+            material_tags[material_id] = names
+
+    all_names = {name for names in material_tags.values() for name in names}
+    Tag.objects.bulk_create([Tag(name=name) for name in sorted(all_names)], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(name__in=all_names).values_list('name', 'id'))
+
+    MaterialTag.objects.bulk_create(
+        [
+            MaterialTag(material_id=material_id, tag_id=tag_ids[name])
+            for material_id, names in material_tags.items()
+            for name in names
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_tag'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_tags, migrations.RunPython.noop),
+    ]
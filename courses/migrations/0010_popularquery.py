@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_populate_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=255, unique=True)),
+                ('text', models.CharField(help_text='Most recent original spelling', max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_seen_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-count'], name='courses_pop_count_5d14fd_idx')],
+            },
+        ),
+    ]
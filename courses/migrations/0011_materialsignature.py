@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_popularquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialSignature',
+            fields=[
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='courses.coursematerial')),
+                ('content_hash', models.CharField(db_index=True, help_text='SHA-256 of the normalized description and text', max_length=64)),
+                ('minhash', models.BinaryField()),
+                ('embedded_hash', models.CharField(blank=True, db_index=True, help_text='SHA-256 of the document text currently embedded in the vector store', max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MinHashBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='minhash_buckets', to='courses.coursematerial')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='courses_min_band_8cb767_idx')],
+            },
+        ),
+    ]
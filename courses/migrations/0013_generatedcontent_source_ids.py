@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_chatsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedcontent',
+            name='source_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
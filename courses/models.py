@@ -1,3 +1,5 @@
+import uuid
+from django.conf import settings
 from django.db import models
 
 class Topic(models.Model):
@@ -32,9 +34,291 @@ class CourseMaterial(models.Model):
     topic = models.ForeignKey(Topic, on_delete=models.SET_NULL, null=True, blank=True, related_name='materials')
     week = models.PositiveIntegerField(null=True, blank=True)
     tags = models.CharField(max_length=255, blank=True, help_text="Comma-separated tags")
+    # Parsed from ``tags`` on save (see courses.tagging); used for search and facets
+    normalized_tags = models.ManyToManyField('Tag', through='MaterialTag', related_name='materials', blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['file_type']),
+            models.Index(fields=['category']),
+            models.Index(fields=['week']),
+            models.Index(fields=['topic', 'week']),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.get_category_display()})"
+
+class Tag(models.Model):
+    """A normalized (lowercase, trimmed) material tag."""
+    name = models.CharField(max_length=50, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class MaterialTag(models.Model):
+    material = models.ForeignKey(CourseMaterial, on_delete=models.CASCADE, related_name='tag_links')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='material_links')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'tag'], name='unique_material_tag'),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} #{self.tag_id}"
+
+class GeneratedContent(models.Model):
+    """
+    Cached output of an AI generator (quiz, flashcards, video script).
+
+    Entries are keyed by the generator, the normalized query and the prompt
+    version. The ids and a fingerprint of the source materials used to ground
+    an entry are stored with it, so edits to those materials mark it stale.
+    """
+    GENERATOR_CHOICES = [
+        ('QUIZ', 'Quiz'),
+        ('FLASHCARDS', 'Flashcards'),
+        ('VIDEO', 'Video Script'),
+    ]
+
+    cache_key = models.CharField(max_length=64, unique=True)
+    generator = models.CharField(max_length=20, choices=GENERATOR_CHOICES)
+    query = models.CharField(max_length=255)
+    source_ids = models.JSONField(default=list, blank=True)
+    source_hash = models.CharField(max_length=64)
+    prompt_version = models.PositiveIntegerField(default=1)
+
+    payload = models.JSONField()
+    size_bytes = models.PositiveIntegerField(default=0)
+
+    hits = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=1, help_text="Number of times this entry was (re)generated")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    refreshed_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Generated content cache entry"
+        verbose_name_plural = "Generated content cache"
+
+    def __str__(self):
+        return f"{self.get_generator_display()}: {self.query}"
+
+class PregeneratedContent(models.Model):
+    """
+    Flashcard decks and quiz variants generated ahead of time for a Topic
+    by the ``pregenerate_topic_content`` batch job.
+    """
+    GENERATOR_CHOICES = [
+        ('QUIZ', 'Quiz'),
+        ('FLASHCARDS', 'Flashcards'),
+    ]
+
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='pregenerated')
+    generator = models.CharField(max_length=20, choices=GENERATOR_CHOICES)
+    variant = models.PositiveIntegerField(default=0)
+    prompt_version = models.PositiveIntegerField(default=1)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['topic', 'generator', 'variant'], name='unique_pregenerated_variant'),
+        ]
+        indexes = [
+            models.Index(fields=['topic', 'generator', 'prompt_version']),
+        ]
+
+    def __str__(self):
+        return f"{self.topic.name} - {self.get_generator_display()} #{self.variant}"
+
+    @classmethod
+    def pick_random(cls, topic, generator, prompt_version):
+        """Return the payload of a random current variant, or None if none exist."""
+        variant = cls.objects.filter(
+            topic=topic, generator=generator, prompt_version=prompt_version
+        ).only('payload').order_by('?').first()
+        return variant.payload if variant else None
+
+class DigitizationJob(models.Model):
+    """
+    One page of a handwritten-note digitization batch, processed in the background.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('PROCESSING', 'Processing'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    batch_id = models.UUIDField(db_index=True)
+    page = models.PositiveIntegerField(default=1)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='digitization_jobs')
+
+    image = models.FileField(upload_to='digitization/', blank=True, null=True)
+    image_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    content = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['batch_id', 'page']
+
+    def __str__(self):
+        return f"Digitization {self.batch_id} page {self.page} ({self.get_status_display()})"
+
+class RelatedMaterial(models.Model):
+    """
+    Precomputed nearest neighbours of a material by embedding similarity.
+    Filled offline by the ``compute_related_materials`` command and kept up
+    to date incrementally when a material is saved.
+    """
+    material = models.ForeignKey(CourseMaterial, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(CourseMaterial, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(help_text="Cosine similarity of the two materials' embeddings")
+    rank = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['material', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'related'], name='unique_related_material'),
+        ]
+        indexes = [
+            models.Index(fields=['material', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} -> {self.related_id} ({self.score:.2f})"
+
+class RenderedContent(models.Model):
+    """
+    Sanitized HTML rendering of a note body, keyed by a hash of the source
+    text and renderer version (see courses.rendering).
+    """
+    content_hash = models.CharField(max_length=64, unique=True)
+    html = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.content_hash[:12]
+
+class LLMUsageEvent(models.Model):
+    """
+    One metered LLM call (or generation cache hit), written in batches by
+    courses.metering.
+    """
+    endpoint = models.CharField(max_length=50, db_index=True)
+    model_name = models.CharField(max_length=50, blank=True)
+    latency_ms = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cache_hit = models.BooleanField(default=False)
+    rate_limited = models.BooleanField(default=False, help_text="The call failed with HTTP 429")
+    success = models.BooleanField(default=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.endpoint} ({self.latency_ms} ms)"
+
+class UsageCounter(models.Model):
+    """Running totals maintained incrementally as usage events are flushed."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class PopularQuery(models.Model):
+    """How often a (normalized) question was asked; feeds search suggestions."""
+    query = models.CharField(max_length=255, unique=True)
+    text = models.CharField(max_length=255, help_text="Most recent original spelling")
+    count = models.PositiveIntegerField(default=0)
+    last_seen_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-count']),
+        ]
+
+    def __str__(self):
+        return f"{self.text} ({self.count})"
+
+class MaterialSignature(models.Model):
+    """
+    MinHash signature of a material's text, computed on save (see courses.dedup).
+    """
+    material = models.OneToOneField(CourseMaterial, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    content_hash = models.CharField(max_length=64, db_index=True, help_text="SHA-256 of the normalized description and text")
+    minhash = models.BinaryField()
+    embedded_hash = models.CharField(
+        max_length=64, blank=True, db_index=True,
+        help_text="SHA-256 of the document text currently embedded in the vector store",
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Signature of {self.material_id}"
+
+class MinHashBucket(models.Model):
+    """One LSH band of a material's MinHash signature; equal buckets mark candidate near-duplicates."""
+    material = models.ForeignKey(CourseMaterial, on_delete=models.CASCADE, related_name='minhash_buckets')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.material_id} band {self.band}"
+
+class ChatSession(models.Model):
+    """
+    A conversation with the chat assistant. Older turns are folded into
+    ``summary`` in the background (courses.chat) so prompts stay bounded.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_sessions')
+    summary = models.TextField(blank=True)
+    summarized_through = models.PositiveIntegerField(default=0, help_text="Turns already folded into the summary")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        return f"Chat {self.id} ({self.user_id})"
+
+class ChatTurn(models.Model):
+    """One question and answer in a ChatSession."""
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='turns')
+    index = models.PositiveIntegerField()
+    query = models.TextField()
+    search_query = models.TextField(help_text="Query after rewriting with the conversation context")
+    answer = models.TextField(blank=True)
+    source_ids = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['session', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_chat_turn'),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} #{self.index}"
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MaterialCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: each page is an indexed range scan,
+    so deep pages cost the same as the first one.
+    """
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
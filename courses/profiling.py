@@ -0,0 +1,186 @@
+"""
+Profiling of live requests and management commands.
+
+The default collector is a sampling profiler: a helper thread snapshots the
+profiled thread's stack every PROFILER_INTERVAL seconds via
+``sys._current_frames()``, so the profiled code runs at full speed. Samples
+are written as a speedscope JSON profile (open at https://www.speedscope.app)
+or as collapsed stacks for flamegraph.pl. The ``cprofile`` mode uses the
+deterministic cProfile collector instead and writes a pstats ``.prof`` file.
+
+Files go to PROFILER_OUTPUT_DIR, which is kept to the newest
+PROFILER_MAX_FILES profiles.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sampling', 'cprofile')
+FORMATS = ('speedscope', 'collapsed')
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval."""
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='courses-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    @staticmethod
+    def _frame_name(frame):
+        name, filename, line = frame
+        base = str(settings.BASE_DIR)
+        if filename.startswith(base):
+            filename = os.path.relpath(filename, base)
+        return f"{name} ({filename}:{line})"
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format, one ``a;b;c count`` line per stack."""
+        lines = [
+            f"{';'.join(self._frame_name(frame) for frame in stack)} {count}"
+            for stack, count in self.samples.most_common()
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self, name):
+        """Profile in speedscope's sampled JSON format."""
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        interval_ms = self.interval * 1000
+        for stack, count in self.samples.items():
+            sample = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+                sample.append(index[frame])
+            samples.append(sample)
+            weights.append(count * interval_ms)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+            'name': name,
+            'exporter': 'courses.profiling',
+        }
+
+
+def output_dir():
+    path = getattr(settings, 'PROFILER_OUTPUT_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _rotate(directory):
+    max_files = getattr(settings, 'PROFILER_MAX_FILES', 50)
+    entries = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in entries[:max(0, len(entries) - max_files)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _filename(label, extension):
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:60] or 'profile'
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{slug}.{extension}"
+
+
+class ProfileResult:
+    """Path of the written profile, available once the ``profile`` block exits."""
+
+    path = None
+
+
+@contextmanager
+def profile(label, mode=None, fmt=None, interval=None):
+    """
+    Profile the enclosed block and write the result to the profile directory.
+
+        with profile('index_materials') as result:
+            ...
+        print(result.path)
+    """
+    mode = mode or getattr(settings, 'PROFILER_MODE', 'sampling')
+    fmt = fmt or getattr(settings, 'PROFILER_FORMAT', 'speedscope')
+    interval = interval or getattr(settings, 'PROFILER_INTERVAL', 0.005)
+    result = ProfileResult()
+
+    if mode == 'cprofile':
+        collector = cProfile.Profile()
+        collector.enable()
+    else:
+        collector = SamplingProfiler(interval=interval)
+        collector.start()
+
+    try:
+        yield result
+    finally:
+        directory = output_dir()
+        if mode == 'cprofile':
+            collector.disable()
+            result.path = os.path.join(directory, _filename(label, 'prof'))
+            collector.dump_stats(result.path)
+        else:
+            collector.stop()
+            if fmt == 'collapsed':
+                result.path = os.path.join(directory, _filename(label, 'collapsed.txt'))
+                with open(result.path, 'w', encoding='utf-8') as f:
+                    f.write(collector.collapsed())
+            else:
+                result.path = os.path.join(directory, _filename(label, 'speedscope.json'))
+                with open(result.path, 'w', encoding='utf-8') as f:
+                    json.dump(collector.speedscope(label), f)
+        _rotate(directory)
+        logger.info(f"Wrote profile {result.path}")
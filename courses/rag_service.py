@@ -1,33 +1,43 @@
-import google.generativeai as genai
-import json
 import requests
 from django.conf import settings
-from .models import CourseMaterial
+from .dedup import collapse_near_duplicates
+from .models import CourseMaterial, MaterialTag
+from .generation_cache import GenerationCache
+from .gemini import get_model
+from .metering import track_llm_call
+from .circuit_breaker import CircuitOpenError, get_breaker
+from .tracing import span
+from .tagging import normalize_tag
+from .tokens import estimate_tokens, truncate_to_tokens
+from .reference_store import get_store as get_reference_store
+from .structured_output import (
+    FLASHCARD_SCHEMA, QUIZ_QUESTION_SCHEMA, JSONArrayStreamParser, parse_json_array
+)
 from django.db.models import Q
 import logging
 
-# Import vector store for semantic search
-try:
-    from .vector_store import VectorStoreService
-    VECTOR_STORE_AVAILABLE = True
-except ImportError:
-    VECTOR_STORE_AVAILABLE = False
+# Vector store dependencies are imported lazily; only check they are installed
+from .vector_store import AVAILABLE as VECTOR_STORE_AVAILABLE, VectorStoreService
+if not VECTOR_STORE_AVAILABLE:
     logging.warning("Vector store not available. Install chromadb and sentence-transformers.")
 
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+
 class RAGService:
+    # Bump when a prompt changes so cached generations are invalidated
+    QUIZ_PROMPT_VERSION = 1
+    FLASHCARDS_PROMPT_VERSION = 1
+
     def __init__(self, use_vector_search=True):
         self.api_key = getattr(settings, "GEMINI_API_KEY", None)
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.model = None
+        self.model = get_model()
         
         # Initialize vector store for semantic search
         self.use_vector_search = use_vector_search and VECTOR_STORE_AVAILABLE
         if self.use_vector_search:
             try:
-                self.vector_store = VectorStoreService()
+                with span('rag.init_vector_store'):
+                    self.vector_store = VectorStoreService()
                 logging.info("Vector store initialized for semantic search")
             except Exception as e:
                 logging.error(f"Failed to initialize vector store: {e}")
@@ -38,30 +48,56 @@ class RAGService:
 
     def get_wikipedia_context(self, query):
         """
-        External context tool: simulating an MCP server wrapper over Wikipedia.
+        External encyclopedic context for ``query``.
+
+        Looked up in the offline reference store (courses.reference_store);
+        the live Wikipedia API is only asked when WIKIPEDIA_LIVE_FALLBACK is
+        enabled and the store has no match.
         """
+        store = get_reference_store()
+        if store is not None:
+            embedder = self.vector_store.embedding_model if self.vector_store else None
+            with span('rag.reference_store'):
+                extract = store.lookup(query, embedder=embedder)
+            if extract:
+                return extract[:1000]
+        if not getattr(settings, 'WIKIPEDIA_LIVE_FALLBACK', False):
+            return None
+
+        params = {
+            'action': 'query', 'format': 'json', 'prop': 'extracts', 'exintro': 1,
+            'explaintext': 1, 'redirects': 1, 'titles': query,
+        }
         try:
-            url = f"https://en.wikipedia.org/w/api.php?action=query&format=json&prop=extracts&exintro&explaintext&redirects=1&titles={query}"
-            response = requests.get(url, timeout=5)
-            data = response.json()
+            with span('rag.wikipedia'), get_breaker('wikipedia'):
+                response = requests.get(WIKIPEDIA_API_URL, params=params, timeout=5)
+                response.raise_for_status()
+                data = response.json()
             pages = data['query']['pages']
             page_id = next(iter(pages))
             if page_id != "-1":
-                return pages[page_id]['extract'][:1000]
+                return pages[page_id].get('extract', '')[:1000] or None
+            return None
+        except CircuitOpenError:
             return None
-        except:
+        except (requests.RequestException, ValueError, KeyError, StopIteration) as e:
+            logging.warning(f"Wikipedia lookup failed: {e}")
             return None
 
-    def query_ai(self, prompt):
+    def query_ai(self, prompt, endpoint='rag.query'):
         """
         Helper to call Google Gemini API with improved error handling.
+        ``endpoint`` labels the call in usage metering.
         """
         if not self.model:
             return "Gemini API Key not configured. Please add GEMINI_API_KEY to settings.py."
         
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            with track_llm_call(endpoint) as call:
+                call.response = self.model.generate_content(prompt)
+            return call.response.text.strip()
+        except CircuitOpenError as e:
+            return f"⚠️ AI service temporarily unavailable: {e}. Please try again shortly."
         except Exception as e:
             error_msg = str(e)
             if "429" in error_msg:
@@ -78,16 +114,20 @@ class RAGService:
         if self.use_vector_search and self.vector_store:
             try:
                 # Perform semantic similarity search
-                vector_results = self.vector_store.search(query, n_results=n_results)
+                with span('rag.search.vector'):
+                    # Over-fetch so that collapsing near-duplicates still fills n_results
+                    vector_results = self.vector_store.search(query, n_results=n_results * 2, include_text=False)
                 
                 if vector_results:
                     # Convert vector results to CourseMaterial objects
                     material_ids = [int(result['id']) for result in vector_results]
-                    materials = CourseMaterial.objects.filter(id__in=material_ids)
+                    with span('rag.search.db_fetch'):
+                        materials = list(CourseMaterial.objects.filter(id__in=material_ids))
                     
                     # Preserve the order from vector search (most similar first)
                     materials_dict = {m.id: m for m in materials}
                     ordered_materials = [materials_dict[mid] for mid in material_ids if mid in materials_dict]
+                    ordered_materials = collapse_near_duplicates(ordered_materials)
                     
                     logging.info(f"Semantic search found {len(ordered_materials)} results for: {query[:50]}")
                     return ordered_materials[:n_results]
@@ -100,10 +140,11 @@ class RAGService:
         
         # Part 1: Semantic Expansion (ask Gemini for keywords if it's a complex query)
         expanded_keywords = [query]
-        if len(query.split()) > 3:
+        # Skip the Gemini round trip while its breaker is open
+        if len(query.split()) > 3 and self.model and not get_breaker('gemini').is_open:
             expansion_prompt = f"Given the educational query '{query}', list 5-7 core technical keywords or synonyms that would help find relevant course materials or code snippets. Return ONLY keywords separated by commas."
-            expanded_text = self.query_ai(expansion_prompt)
-            if "Error" not in expanded_text:
+            expanded_text = self.query_ai(expansion_prompt, endpoint='rag.query_expansion')
+            if "Error" not in expanded_text and not expanded_text.startswith("⚠️"):
                 expanded_keywords.extend([k.strip() for k in expanded_text.split(',')])
         else:
             # For small queries, strip stop words for better DB matching
@@ -120,19 +161,25 @@ class RAGService:
 
         # Part 3: Search Execution
         q_objects = Q()
+        tag_names = set()
         for word in expanded_keywords:
             if len(word) > 2:
-                q_objects |= Q(title__icontains=word) | Q(description__icontains=word) | Q(text_content__icontains=word) | Q(tags__icontains=word)
+                q_objects |= Q(title__icontains=word) | Q(description__icontains=word) | Q(text_content__icontains=word)
+                tag_names.add(normalize_tag(word))
+        if tag_names:
+            # Exact match on normalized tags (indexed) instead of a substring scan
+            q_objects |= Q(id__in=MaterialTag.objects.filter(tag__name__in=tag_names).values('material_id'))
 
         results = CourseMaterial.objects.filter(q_objects).distinct()
 
         # Part 4: Ranking/Prioritization
-        results_list = list(results[:20])
+        with span('rag.search.keyword'):
+            results_list = list(results[:20])
         if is_code_search:
             # Sort CODE materials to the top
             results_list = sorted(results_list, key=lambda x: 0 if x.file_type == 'CODE' else 1)
         
-        return results_list[:n_results]
+        return collapse_near_duplicates(results_list)[:n_results]
 
     def get_context_with_excerpts(self, results):
         context_docs = []
@@ -155,24 +202,72 @@ class RAGService:
             context_docs.append(f"Source: {item.title}\nContent: {content}")
         return "\n\n".join(context_docs)
 
-    def generate_answer(self, query):
+    def generate_answer(self, query, results=None, conversation='', token_budget=None, search_query=None):
         """
         Part 2: Intelligent RAG-Based Search & Answer with External Context.
+        
+        Chat sessions (courses.chat) pass pre-retrieved ``results``, a
+        ``conversation`` block (summary and recent turns) and a
+        ``token_budget``; context excerpts are then dropped or shortened so
+        the whole prompt stays within the budget. ``search_query`` (the
+        follow-up rewritten into a standalone query) is used for retrieval.
         """
-        results = self.search(query)
+        search_query = search_query or query
+        if results is None:
+            results = self.search(search_query)
         excerpts = self.get_context_with_excerpts(results)
         
+        # Part 3 Requirement: Fetch external context if needed
+        wiki = None
+        if len(excerpts) < 2:
+            wiki = self.get_wikipedia_context(search_query)
+        
+        context_budget = None
+        if token_budget is not None:
+            context_budget = token_budget - estimate_tokens(self._answer_prompt(query, '', '', conversation))
+        
         # Build internal context
-        internal_context = "\n\n".join([f"Source: {res['title']}\nContent: {res['excerpt']}" for res in excerpts])
+        blocks = [f"Source: {res['title']}\nContent: {res['excerpt']}" for res in excerpts]
+        if context_budget is not None:
+            kept = []
+            for block in blocks:
+                cost = estimate_tokens(block) + 1
+                if cost > context_budget:
+                    if not kept and context_budget > 50:
+                        kept.append(truncate_to_tokens(block, context_budget - 1))
+                        context_budget = 0
+                    break
+                kept.append(block)
+                context_budget -= cost
+            excerpts = excerpts[:len(kept)]
+            blocks = kept
+        internal_context = "\n\n".join(blocks)
         
-        # Part 3 Requirement: Fetch external context if needed
         external_context = ""
-        if len(excerpts) < 2:
-            wiki = self.get_wikipedia_context(query)
-            if wiki:
-                external_context = f"External Source (Wikipedia):\n{wiki}"
-
-        prompt = f"""You are 'EduBot', a university academic assistant. 
+        if wiki:
+            external_context = f"External Source (Wikipedia):\n{wiki}"
+            if context_budget is not None:
+                external_context = truncate_to_tokens(external_context, context_budget)
+        
+        prompt = self._answer_prompt(query, internal_context, external_context, conversation)
+        answer = self.query_ai(prompt, endpoint='rag.answer')
+        
+        # Check the answer against exactly the context the model was given
+        passages = [(res['id'], block) for res, block in zip(excerpts, blocks)]
+        if external_context:
+            passages.append(('wikipedia', external_context))
+        with span('rag.grounding'):
+            grounding = self._validator().check_grounding(answer, passages=passages)
+        
+        return {
+            "answer": answer,
+            "sources": excerpts,
+            "grounding": grounding,
+        }
+    
+    def _answer_prompt(self, query, internal_context, external_context, conversation=''):
+        conversation_block = f"Conversation so far:\n{conversation}\n\n" if conversation else ''
+        return f"""You are 'EduBot', a university academic assistant. 
 Use the following context to answer the student's question accurately.
 
 Internal Course Materials:
@@ -180,7 +275,7 @@ Internal Course Materials:
 
 {external_context if external_context else ''}
 
-Question: {query}
+{conversation_block}Question: {query}
 
 Instructions:
 - Prioritize internal course materials if they are relevant.
@@ -189,13 +284,6 @@ Instructions:
 - If it's a coding question, provide a structured explanation.
 - Keep the tone helpful, professional, and technical."""
 
-        answer = self.query_ai(prompt)
-        
-        return {
-            "answer": answer,
-            "sources": excerpts 
-        }
-
     def generate_learning_material(self, topic, material_type):
         """
         Part 3: Generated Learning Materials using Internal & External Context.
@@ -213,7 +301,7 @@ Instructions:
         else:
             prompt = f"Outline a 5-slide presentation for '{topic}'. Include content for each slide. Context:\n{full_context}"
 
-        content = self.query_ai(prompt)
+        content = self.query_ai(prompt, endpoint='rag.learning_material')
         
         # Clean up potential markdown wrapper
         if "```" in content:
@@ -223,18 +311,32 @@ Instructions:
                 content = match.group(1).strip()
 
         validation_result = None
+        grounding = None
         if material_type == 'CODE':
-            from .validation import ContentValidator
-            validator = ContentValidator()
-            validation_result = validator.validate_code(content, language="python")
+            validation_result = self._validator().validate_code(content, language="python")
+        else:
+            passages = [(item.id, item.text_content or item.description) for item in results[:5]]
+            if external_context != "No external data found.":
+                passages.append(('wikipedia', external_context))
+            with span('rag.grounding'):
+                grounding = self._validator().check_grounding(content, passages=passages)
 
-        return {"content": content, "validation": validation_result}
+        return {"content": content, "validation": validation_result, "grounding": grounding}
+
+    def _validator(self):
+        from .validation import ContentValidator
+        return ContentValidator(embedder=self.vector_store.embedding_model if self.vector_store else None)
 
     def generate_quiz(self, topic):
-        """Generate a 5-question MCQ quiz based on topic and context"""
-        results = self.search(topic)
+        """Generate a 5-question MCQ quiz based on topic and context (cached)"""
+        return GenerationCache().get_or_generate(
+            'QUIZ', topic, lambda results: self._generate_quiz(topic, results),
+            retrieve=lambda: self.search(topic), prompt_version=self.QUIZ_PROMPT_VERSION,
+        )
+
+    def _quiz_prompt(self, topic, results):
         context = self.get_context_string(results)
-        prompt = f"""Based on the following context, generate a 5-question multiple choice quiz about '{topic}'.
+        return f"""Based on the following context, generate a 5-question multiple choice quiz about '{topic}'.
         Context: {context}
         
         Format the output AS ONLY A JSON LIST with this structure:
@@ -247,43 +349,116 @@ Instructions:
             }}
         ]
         Return ONLY the JSON."""
-        
+
+    def _generate_quiz(self, topic, results):
         if not self.model:
             return []
 
         try:
-            response = self.model.generate_content(prompt)
-            import re
-            # Extract JSON array using regex
-            match = re.search(r"\[.*\]", response.text, re.DOTALL)
-            if match:
-                return json.loads(match.group(0))
-            return []
+            with track_llm_call('rag.quiz') as call:
+                call.response = self.model.generate_content(self._quiz_prompt(topic, results))
+            return parse_json_array(call.response.text, QUIZ_QUESTION_SCHEMA)
         except Exception as e:
+            logging.error(f"Quiz generation failed: {e}")
             return []
 
+    def stream_quiz(self, topic):
+        """
+        Yield quiz questions one by one as the model produces them.
+        Cached quizzes are replayed immediately; a fresh stream is cached once complete.
+        """
+        cache = GenerationCache()
+        cached = cache.get('QUIZ', topic, prompt_version=self.QUIZ_PROMPT_VERSION)
+        if cached:
+            yield from cached
+            return
+
+        results = self.search(topic)
+        questions, complete = yield from self._stream_items(
+            self._quiz_prompt(topic, results), QUIZ_QUESTION_SCHEMA, 'rag.quiz_stream'
+        )
+        # A stream that failed or was cut off must not be served to everyone from the cache
+        if complete and questions:
+            cache.set('QUIZ', topic, questions, sources=results, prompt_version=self.QUIZ_PROMPT_VERSION)
+
+    def _stream_items(self, prompt, schema, endpoint):
+        """
+        Stream a JSON-array completion, yielding each valid item.
+
+        Returns:
+            (items, complete): all items, and whether the stream finished
+            without error and the array was closed (not truncated)
+        """
+        items = []
+        if not self.model:
+            return items, False
+
+        parser = JSONArrayStreamParser(schema)
+        complete = False
+        try:
+            with track_llm_call(endpoint) as call:
+                call.response = self.model.generate_content(prompt, stream=True)
+                for chunk in call.response:
+                    for item in parser.feed(chunk.text):
+                        items.append(item)
+                        yield item
+                    if parser.done:
+                        break
+                complete = parser.done
+                # Salvage a truncated last item for this response only
+                for item in parser.close():
+                    items.append(item)
+                    yield item
+        except Exception as e:
+            logging.error(f"Streaming generation failed after {len(items)} items: {e}")
+        return items, complete
+
     def provide_bangla_explanation(self, topic):
         """Advanced Feature: Bangla explanation for complex concepts"""
         prompt = f"Explain the academic concept of '{topic}' in simple Bangla, specifically for a university student. Ensure technical terms are in English but the explanation is in Bangla. Highlight key BUET level insights."
-        return self.query_ai(prompt)
+        return self.query_ai(prompt, endpoint='rag.bangla')
 
     def generate_flashcards(self, topic):
-        """Advanced Feature: AI Flashcard Generator"""
-        prompt = f"""Generate 6 high-quality academic flashcards for the topic: {topic}.
+        """Advanced Feature: AI Flashcard Generator (cached)"""
+        cards = GenerationCache().get_or_generate(
+            'FLASHCARDS', topic, lambda: self._generate_flashcards(topic),
+            prompt_version=self.FLASHCARDS_PROMPT_VERSION,
+        )
+        if cards is None:
+            return [{"front": "Error", "back": "Failed to generate cards. Try again."}]
+        if not cards and self.model:
+            return [{"front": "Error", "back": "AI response was not in expected format."}]
+        return cards
+
+    def _flashcards_prompt(self, topic):
+        return f"""Generate 6 high-quality academic flashcards for the topic: {topic}.
         Format as a JSON list of objects with 'front' (question/concept) and 'back' (answer/explanation).
         Keep it concise and relevant for exam preparation.
         Return ONLY valid JSON."""
-        
+
+    def _generate_flashcards(self, topic):
+        """Returns the generated cards, [] on unparseable output or None on failure."""
         if not self.model:
             return []
 
         try:
-            response = self.model.generate_content(prompt)
-            import re
-            # Extract JSON array using regex
-            match = re.search(r"\[.*\]", response.text, re.DOTALL)
-            if match:
-                return json.loads(match.group(0))
-            return [{"front": "Error", "back": "AI response was not in expected format."}]
-        except:
-            return [{"front": "Error", "back": "Failed to generate cards. Try again."}]
+            with track_llm_call('rag.flashcards') as call:
+                call.response = self.model.generate_content(self._flashcards_prompt(topic))
+            return parse_json_array(call.response.text, FLASHCARD_SCHEMA)
+        except Exception as e:
+            logging.error(f"Flashcard generation failed: {e}")
+            return None
+
+    def stream_flashcards(self, topic):
+        """Yield flashcards one by one as the model produces them (cached like generate_flashcards)."""
+        cache = GenerationCache()
+        cached = cache.get('FLASHCARDS', topic, prompt_version=self.FLASHCARDS_PROMPT_VERSION)
+        if cached:
+            yield from cached
+            return
+
+        cards, complete = yield from self._stream_items(
+            self._flashcards_prompt(topic), FLASHCARD_SCHEMA, 'rag.flashcards_stream'
+        )
+        if complete and cards:
+            cache.set('FLASHCARDS', topic, cards, prompt_version=self.FLASHCARDS_PROMPT_VERSION)
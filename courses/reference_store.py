@@ -0,0 +1,239 @@
+"""
+Offline store of encyclopedic extracts used as external context.
+
+Built by ``manage.py ingest_references`` from a JSONL file (optionally
+gzip/bz2 compressed) with one ``{"title": ..., "extract": ...}`` object per
+line. The store is a directory of flat files that workers memory-map
+read-only, so opening it costs nothing and lookups touch only the pages
+they read:
+
+- ``titles.bin`` / ``title_offsets.npy``: normalized titles, sorted, for
+  binary search;
+- ``extracts.bin`` / ``extract_offsets.npy``: the extracts in title order;
+- ``embeddings.npy``: optional unit-normalized float16 embeddings of
+  title and extract (same model as the vector store);
+- ``manifest.json``: format version, count and embedding model, written last.
+
+A lookup first matches the longest word n-gram of the query against the
+titles ("time complexity of binary search" finds "Binary search"), then
+falls back to the nearest embedding if an embedder is at hand.
+"""
+
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+MAX_NGRAM = 6
+_WORD_RE = re.compile(r'\w+')
+_STOP_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'in', 'on', 'for', 'to', 'is', 'are', 'what', 'how', 'why', 'does',
+    'do', 'explain', 'define', 'about', 'with', 'its', 'it', 'this', 'that',
+}
+
+
+def normalize_title(text):
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+class _Strings:
+    """Sequence view of strings packed in a memory-mapped byte buffer."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+
+def _pack(strings):
+    import numpy as np
+
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return b''.join(encoded), offsets
+
+
+class ReferenceStore:
+    def __init__(self, titles, extracts, embeddings=None, manifest=None):
+        self.titles = titles
+        self.extracts = extracts
+        self.embeddings = embeddings
+        self.manifest = manifest or {}
+
+    def __len__(self):
+        return len(self.titles)
+
+    @classmethod
+    def load(cls, path):
+        import numpy as np
+
+        with open(os.path.join(path, MANIFEST_NAME)) as fh:
+            manifest = json.load(fh)
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported reference store version {manifest.get('version')!r}")
+
+        def strings(name):
+            offsets = np.load(os.path.join(path, f'{name}_offsets.npy'), mmap_mode='r')
+            file = os.path.join(path, f'{name}s.bin')
+            # np.memmap refuses empty files
+            data = np.memmap(file, dtype=np.uint8, mode='r') if os.path.getsize(file) else b''
+            return _Strings(data, offsets)
+
+        embeddings_file = os.path.join(path, 'embeddings.npy')
+        embeddings = np.load(embeddings_file, mmap_mode='r') if os.path.exists(embeddings_file) else None
+        return cls(strings('title'), strings('extract'), embeddings, manifest)
+
+    @staticmethod
+    def write(path, entries, embeddings=None, model=None):
+        """
+        Write ``entries`` ((title, extract) pairs, already deduplicated and
+        sorted by normalized title) to ``path``. Files are renamed into
+        place one by one, the manifest last.
+        """
+        import numpy as np
+
+        os.makedirs(path, exist_ok=True)
+        files = {}
+        for name, values in (('title', [normalize_title(t) for t, _ in entries]), ('extract', [e for _, e in entries])):
+            data, offsets = _pack(values)
+            files[f'{name}s.bin'] = data
+            files[f'{name}_offsets.npy'] = offsets
+        if embeddings is not None:
+            files['embeddings.npy'] = np.asarray(embeddings, dtype=np.float16)
+
+        for name, value in files.items():
+            target = os.path.join(path, name)
+            with open(f'{target}.tmp', 'wb') as fh:
+                if isinstance(value, bytes):
+                    fh.write(value)
+                else:
+                    np.save(fh, value)
+            os.replace(f'{target}.tmp', target)
+        if embeddings is None and os.path.exists(os.path.join(path, 'embeddings.npy')):
+            os.remove(os.path.join(path, 'embeddings.npy'))
+
+        manifest = {
+            'version': STORE_VERSION,
+            'created_at': timezone.now().isoformat(),
+            'count': len(entries),
+            'model': model if embeddings is not None else None,
+            'dimension': int(files['embeddings.npy'].shape[1]) if embeddings is not None else None,
+        }
+        target = os.path.join(path, MANIFEST_NAME)
+        with open(f'{target}.tmp', 'w') as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+        os.replace(f'{target}.tmp', target)
+        return manifest
+
+    def find_title(self, title):
+        """Position of the exactly matching normalized title, or None."""
+        key = normalize_title(title)
+        i = bisect.bisect_left(self.titles, key)
+        if i < len(self.titles) and self.titles[i] == key:
+            return i
+        return None
+
+    def match_title(self, query):
+        """Position of the title matching the longest word n-gram of ``query``, or None."""
+        words = _WORD_RE.findall(query.lower())
+        for n in range(min(MAX_NGRAM, len(words)), 0, -1):
+            for start in range(len(words) - n + 1):
+                window = words[start:start + n]
+                if window[0] in _STOP_WORDS or window[-1] in _STOP_WORDS:
+                    continue
+                if n == 1 and len(window[0]) < 3:
+                    continue
+                i = self.find_title(" ".join(window))
+                if i is not None:
+                    return i
+        return None
+
+    def nearest(self, query_embedding, min_similarity, chunk_size=65536):
+        """Position of the most similar embedding if at least ``min_similarity``, or None."""
+        import numpy as np
+
+        if self.embeddings is None or not len(self.embeddings):
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        query /= np.linalg.norm(query) or 1.0
+        best, best_score = None, min_similarity
+        # Chunked so a large float16 store is never converted to float32 at once
+        for start in range(0, len(self.embeddings), chunk_size):
+            scores = np.asarray(self.embeddings[start:start + chunk_size], dtype=np.float32) @ query
+            i = int(np.argmax(scores))
+            if scores[i] >= best_score:
+                best, best_score = start + i, float(scores[i])
+        return best
+
+    def lookup(self, query, embedder=None, min_similarity=None):
+        """The extract for ``query``, or None if nothing in the store matches."""
+        i = self.match_title(query)
+        if i is None and embedder is not None and self.embeddings is not None:
+            if min_similarity is None:
+                min_similarity = getattr(settings, 'REFERENCE_MIN_SIMILARITY', 0.5)
+            i = self.nearest(embedder.encode(query, convert_to_numpy=True), min_similarity)
+        return self.extracts[i] if i is not None else None
+
+
+def prepare_entries(rows, max_chars=2000):
+    """
+    Deduplicate (first title wins) and sort ``rows`` of (title, extract) for
+    :meth:`ReferenceStore.write`. Extracts are cut at a sentence boundary
+    before ``max_chars``.
+    """
+    entries = {}
+    for title, extract in rows:
+        key = normalize_title(title or '')
+        extract = " ".join((extract or '').split())
+        if not key or not extract or key in entries:
+            continue
+        if len(extract) > max_chars:
+            cut = extract.rfind('. ', 0, max_chars)
+            extract = extract[:cut + 1] if cut > 0 else extract[:max_chars]
+        entries[key] = (title, extract)
+    return [entries[key] for key in sorted(entries)]
+
+
+_store = None
+_store_loaded = False
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide ReferenceStore, or None if none has been ingested."""
+    global _store, _store_loaded
+    if not _store_loaded:
+        with _store_lock:
+            if not _store_loaded:
+                path = str(getattr(settings, 'REFERENCE_STORE_PATH', ''))
+                if path and os.path.exists(os.path.join(path, MANIFEST_NAME)):
+                    try:
+                        _store = ReferenceStore.load(path)
+                        logger.info(f"Loaded reference store ({len(_store)} entries) from {path}")
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.error(f"Failed to load reference store: {e}")
+                _store_loaded = True
+    return _store
+
+
+def reset_store():
+    """Forget the loaded store so the next get_store() reloads it from disk."""
+    global _store, _store_loaded
+    with _store_lock:
+        _store = None
+        _store_loaded = False
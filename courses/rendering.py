@@ -0,0 +1,184 @@
+"""
+Server-side rendering of material notes (Markdown + LaTeX) to sanitized HTML.
+
+Math is converted to MathML, which browsers render natively, so the detail
+page needs neither marked nor KaTeX. Rendered HTML is stored by content hash
+in RenderedContent and reused until the text (or RENDERER_VERSION) changes.
+"""
+
+import hashlib
+import html
+import logging
+import re
+import secrets
+from html.parser import HTMLParser
+
+import markdown
+from django.db import IntegrityError
+
+try:
+    from latex2mathml.converter import convert as latex_to_mathml
+except ImportError:  # optional: math falls back to escaped TeX
+    latex_to_mathml = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when rendering output changes so stored HTML is regenerated
+RENDERER_VERSION = 2
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+
+# Code first so that math delimiters inside code are left alone
+_PROTECTED = re.compile(
+    r"(?P<fence>^(?P<ticks>`{3,}|~{3,})[^\n]*\n.*?^(?P=ticks)[ \t]*$)"
+    r"|(?P<code>`+[^`\n]*?`+)"
+    r"|(?P<escaped>\\\$)"
+    r"|(?P<display>\$\$(?P<d1>.+?)\$\$|\\\[(?P<d2>.+?)\\\])"
+    r"|(?P<inline>(?<![\\$])\$(?P<i1>[^\s$](?:[^$\n]*?[^\s$\\])?)\$(?!\d)|\\\((?P<i2>.+?)\\\))",
+    re.DOTALL | re.MULTILINE,
+)
+
+_ALLOWED_TAGS = {
+    'p', 'br', 'hr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'strong', 'em', 'b', 'i', 'del',
+    'sup', 'sub', 'code', 'pre', 'blockquote', 'ul', 'ol', 'li', 'a', 'img', 'span', 'div',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+_MATHML_TAGS = {
+    'math', 'mrow', 'mi', 'mn', 'mo', 'ms', 'mtext', 'mspace', 'mfrac', 'msqrt', 'mroot',
+    'msub', 'msup', 'msubsup', 'munder', 'mover', 'munderover', 'mtable', 'mtr', 'mtd',
+    'mstyle', 'mpadded', 'mphantom', 'menclose', 'semantics', 'annotation', 'merror',
+}
+_ALLOWED_ATTRS = {
+    'a': {'href', 'title'},
+    'img': {'src', 'alt', 'title'},
+    'code': {'class'},
+    'span': {'class'},
+    'div': {'class'},
+    'th': {'align'},
+    'td': {'align'},
+    'ol': {'start'},
+}
+_MATHML_ATTRS = {
+    'xmlns', 'display', 'mathvariant', 'displaystyle', 'scriptlevel', 'stretchy', 'fence',
+    'separator', 'form', 'lspace', 'rspace', 'minsize', 'maxsize', 'largeop', 'movablelimits',
+    'accent', 'accentunder', 'linethickness', 'width', 'height', 'depth', 'notation',
+    'columnalign', 'rowalign', 'columnspacing', 'rowspacing', 'columnlines', 'rowlines', 'encoding',
+}
+_DROP_WITH_CONTENT = {'script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript'}
+_VOID_TAGS = {'br', 'hr', 'img', 'mspace'}
+_SAFE_URL = re.compile(r"^(https?:|mailto:|/|#|\.{0,2}/|[^:/?#]+(?:[/?#]|$))", re.IGNORECASE)
+
+
+class _Sanitizer(HTMLParser):
+    """Allowlist-based HTML sanitizer; everything not explicitly allowed is escaped or dropped."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _DROP_WITH_CONTENT:
+            self._skip_depth += 1
+            return
+        if self._skip_depth or (tag not in _ALLOWED_TAGS and tag not in _MATHML_TAGS):
+            return
+        allowed = _MATHML_ATTRS if tag in _MATHML_TAGS else _ALLOWED_ATTRS.get(tag, set())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in ('href', 'src') and not _SAFE_URL.match(value.strip()):
+                continue
+            parts.append(f'{name}="{html.escape(value, quote=True)}"')
+        if tag == 'a':
+            parts.append('rel="nofollow noopener"')
+        self.out.append(f"<{' '.join(parts)}>")
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in _DROP_WITH_CONTENT:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth or tag in _VOID_TAGS:
+            return
+        if tag in _ALLOWED_TAGS or tag in _MATHML_TAGS:
+            self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.out.append(html.escape(data, quote=False))
+
+
+def sanitize_html(fragment):
+    parser = _Sanitizer()
+    parser.feed(fragment)
+    parser.close()
+    return ''.join(parser.out)
+
+
+def render_math(tex, display=False):
+    """Convert a TeX expression to MathML, or escaped TeX if conversion is unavailable."""
+    if latex_to_mathml is not None:
+        try:
+            return latex_to_mathml(tex, display='block' if display else 'inline')
+        except Exception as e:
+            logger.debug(f"Could not convert math {tex[:40]!r}: {e}")
+    css = 'math-display' if display else 'math-inline'
+    return f'<code class="{css}">{html.escape(tex, quote=False)}</code>'
+
+
+def render_markdown(text):
+    """Render Markdown with $...$ / $$...$$ / \\(...\\) / \\[...\\] math to sanitized HTML."""
+    math_blocks = []
+    # Random per render so that text typed by the author can never match a placeholder;
+    # alphanumeric so that Markdown leaves it alone
+    token = secrets.token_hex(8)
+
+    def protect(match):
+        if match.group('fence') or match.group('code'):
+            return match.group(0)
+        if match.group('escaped'):
+            return '&#36;'
+        display = bool(match.group('display'))
+        if display:
+            tex = match.group('d1') or match.group('d2')
+        else:
+            tex = match.group('i1') or match.group('i2')
+        math_blocks.append(render_math(tex.strip(), display=display))
+        return f"MATH{token}N{len(math_blocks) - 1}END"
+
+    def restore(match):
+        index = int(match.group(1))
+        return math_blocks[index] if index < len(math_blocks) else match.group(0)
+
+    source = _PROTECTED.sub(protect, text.replace('\r\n', '\n'))
+    rendered = markdown.markdown(source, extensions=MARKDOWN_EXTENSIONS)
+    rendered = re.sub(rf"MATH{token}N(\d+)END", restore, rendered)
+    return sanitize_html(rendered)
+
+
+def content_hash(text):
+    return hashlib.sha256(f"{RENDERER_VERSION}\x1f{text}".encode('utf-8')).hexdigest()
+
+
+def get_rendered_html(text):
+    """Rendered HTML for ``text``, rendering and storing it on first use."""
+    from .models import RenderedContent
+
+    if not text:
+        return ''
+    digest = content_hash(text)
+    stored = RenderedContent.objects.filter(content_hash=digest).values_list('html', flat=True).first()
+    if stored is not None:
+        return stored
+
+    rendered = render_markdown(text)
+    try:
+        RenderedContent.objects.create(content_hash=digest, html=rendered)
+    except IntegrityError:
+        # Rendered concurrently by another request
+        pass
+    return rendered
@@ -1,14 +1,39 @@
 from rest_framework import serializers
 from .models import CourseMaterial, Topic
 
+
+class DynamicFieldsMixin:
+    """
+    Lets clients trim the response with ``?fields=id,title,...``.
+    Unknown field names are ignored.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request else None
+        if requested:
+            allowed = {name.strip() for name in requested.split(',') if name.strip()}
+            for name in set(self.fields) - allowed:
+                self.fields.pop(name)
+
+
 class TopicSerializer(serializers.ModelSerializer):
     class Meta:
         model = Topic
         fields = '__all__'
 
-class CourseMaterialSerializer(serializers.ModelSerializer):
+class CourseMaterialSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     topic_name = serializers.CharField(source='topic.name', read_only=True)
     
     class Meta:
         model = CourseMaterial
         fields = '__all__'
+
+class CourseMaterialListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Listing representation without the (potentially large) note body."""
+    topic_name = serializers.CharField(source='topic.name', read_only=True)
+
+    class Meta:
+        model = CourseMaterial
+        exclude = ['text_content']
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from community.models import Post
+
+from . import background
+from .dedup import update_signature
+from .dashboard import invalidate_dashboard
+from .graph_service import invalidate_graph
+from .rendering import get_rendered_html
+from .models import CourseMaterial, MaterialTag, RelatedMaterial, Topic
+from .similarity import remove_material_embedding, update_related_for_material
+from .tagging import sync_material_tags
+from . import suggest
+
+
+@receiver([post_save, post_delete], sender=Topic)
+@receiver([post_save, post_delete], sender=CourseMaterial)
+@receiver([post_save, post_delete], sender=RelatedMaterial)
+def invalidate_knowledge_graph(sender, **kwargs):
+    invalidate_graph()
+
+
+@receiver([post_save, post_delete], sender=Topic)
+@receiver([post_save, post_delete], sender=CourseMaterial)
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_dashboard_cache(sender, **kwargs):
+    # Only material changes affect the recent-materials list
+    invalidate_dashboard(recent=sender is CourseMaterial)
+
+
+@receiver(post_save, sender=CourseMaterial)
+def update_material_tags(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_material_tags(instance)
+
+
+# Registered after update_material_tags so tag counts are current
+@receiver(post_save, sender=CourseMaterial)
+def update_suggestions_for_material(sender, instance, **kwargs):
+    suggest.material_saved(instance)
+
+
+@receiver(post_delete, sender=CourseMaterial)
+def remove_material_suggestion(sender, instance, **kwargs):
+    suggest.material_deleted(instance)
+
+
+@receiver(post_delete, sender=MaterialTag)
+def update_tag_suggestion(sender, instance, **kwargs):
+    # Links removed by sync_material_tags or by deleting the material
+    suggest.tag_unlinked(instance.tag_id)
+
+
+@receiver(post_save, sender=Topic)
+def update_topic_suggestion(sender, instance, **kwargs):
+    suggest.topic_saved_id(instance.pk)
+
+
+@receiver(post_delete, sender=Topic)
+def remove_topic_suggestion(sender, instance, **kwargs):
+    suggest.topic_deleted(instance)
+
+
+@receiver(post_save, sender=CourseMaterial)
+def prerender_material(sender, instance, **kwargs):
+    # Render on save so the first detail page view is already warm
+    get_rendered_html(instance.text_content)
+
+
+@receiver(post_save, sender=CourseMaterial)
+def update_material_signature(sender, instance, raw=False, **kwargs):
+    # Before refresh_related_materials: the embedding step compares text hashes
+    if not raw:
+        update_signature(instance)
+
+
+@receiver(post_save, sender=CourseMaterial)
+def refresh_related_materials(sender, instance, raw=False, **kwargs):
+    # Re-embed and update neighbour lists off the request thread once the row is committed
+    if raw or not getattr(settings, 'RELATED_MATERIALS_AUTO_UPDATE', True):
+        return
+    material_id = instance.pk
+    transaction.on_commit(lambda: background.submit(
+        update_related_for_material, material_id, key=f"related-materials:{material_id}"
+    ))
+
+
+@receiver(post_delete, sender=CourseMaterial)
+def drop_material_embedding(sender, instance, **kwargs):
+    # RelatedMaterial rows cascade; the vector has to be removed explicitly
+    if not getattr(settings, 'RELATED_MATERIALS_AUTO_UPDATE', True):
+        return
+    material_id = instance.pk
+    transaction.on_commit(lambda: background.submit(remove_material_embedding, material_id))
@@ -0,0 +1,179 @@
+"""
+Nearest-neighbour computation over material embeddings.
+
+numpy is imported inside the functions so that importing this module (from
+courses.signals, at startup) stays cheap.
+
+Used by the ``compute_related_materials`` command for the full offline pass
+and by the post-save hook to keep RelatedMaterial up to date incrementally.
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from .dedup import embed_document
+from .models import CourseMaterial, RelatedMaterial
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(embeddings):
+    """L2-normalize rows so that dot products are cosine similarities."""
+    import numpy as np
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def blocked_top_k(embeddings, k, block_size=1024):
+    """
+    Top-k most similar rows for every row of a normalized matrix, excluding itself.
+
+    The similarity matrix is computed ``block_size`` rows at a time, so memory
+    stays at block_size x n floats instead of n x n.
+
+    Returns:
+        (indices, scores): int arrays/float arrays of shape (n, k), best first
+    """
+    import numpy as np
+
+    n = len(embeddings)
+    k = min(k, n - 1)
+    indices = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=np.float32)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = embeddings[start:stop] @ embeddings.T
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+
+    return indices, scores
+
+
+def _candidate_rows(material_id, vector, candidate_ids, candidate_vectors, live, top_k, min_score):
+    """RelatedMaterial rows (top_k, best first) for one material, ranked among its candidates."""
+    import numpy as np
+
+    if not len(candidate_ids):
+        return []
+    scores = normalize(candidate_vectors) @ normalize([vector])[0]
+    rows = []
+    for j in np.argsort(-scores):
+        other_id = int(candidate_ids[j])
+        if other_id == material_id or other_id not in live:
+            continue
+        if len(rows) >= top_k or float(scores[j]) < min_score:
+            break
+        rows.append(RelatedMaterial(material_id=material_id, related_id=other_id, score=float(scores[j]), rank=len(rows)))
+    return rows
+
+
+_vector_store = None
+
+
+def _get_vector_store():
+    """Shared VectorStoreService so the embedding model is loaded once per process."""
+    global _vector_store
+    if _vector_store is None:
+        from .vector_store import VectorStoreService
+        _vector_store = VectorStoreService()
+    return _vector_store
+
+
+def remove_material_embedding(material_id):
+    try:
+        _get_vector_store().delete_document(material_id)
+    except ImportError:
+        logger.debug("Vector store not installed; nothing to remove")
+
+
+def update_related_for_material(material_id, vector_store=None):
+    """
+    Incrementally refresh neighbours after one material was added or changed.
+
+    Re-embeds the material (skipped when its text is already embedded) and
+    asks the vector store for its RELATED_MATERIALS_CANDIDATES nearest
+    documents. Its own top-k comes from those candidates; so do the lists that
+    may gain it (a candidate whose k-th score it beats). Lists that held it
+    before are reloaded as well. Every affected list is recomputed from one
+    batched nearest-neighbour query, so a save costs a few vector store
+    queries and never a pass over the whole corpus. Lists beyond the
+    candidates that would gain the material are left to the offline
+    ``compute_related_materials`` pass.
+    """
+    top_k = getattr(settings, 'RELATED_MATERIALS_TOP_K', 5)
+    min_score = getattr(settings, 'RELATED_MATERIALS_MIN_SCORE', 0.0)
+    material = CourseMaterial.objects.select_related('topic').filter(pk=material_id).first()
+    if material is None:
+        return
+
+    try:
+        vector_store = vector_store or _get_vector_store()
+    except ImportError:
+        logger.debug("Vector store not installed; related materials not updated")
+        return
+    document = vector_store.document_for_material(material)
+    if document is None:
+        return
+    embed_document(document, vector_store)
+
+    embedding = vector_store.get_embedding(material_id)
+    if embedding is None:
+        logger.warning(f"Material {material_id} is not in the vector store; related materials not updated")
+        return
+
+    # Over-fetch: the material itself and deleted materials are skipped
+    n_candidates = max(getattr(settings, 'RELATED_MATERIALS_CANDIDATES', 50), top_k) + 1
+    candidate_ids, candidate_vectors = vector_store.nearest([embedding], n_candidates)[0]
+    live = set(CourseMaterial.objects.filter(id__in=[int(i) for i in candidate_ids]).values_list('id', flat=True))
+    rows = _candidate_rows(material_id, embedding, candidate_ids, candidate_vectors, live, top_k, min_score)
+
+    # Current k-th best score and neighbour count of the candidate lists, ignoring this material
+    scores = normalize(candidate_vectors) @ normalize([embedding])[0] if len(candidate_ids) else []
+    thresholds = {}
+    counts = {}
+    for row_material, score in RelatedMaterial.objects.filter(material_id__in=live).exclude(
+        related_id=material_id
+    ).values_list('material_id', 'score'):
+        counts[row_material] = counts.get(row_material, 0) + 1
+        thresholds[row_material] = min(thresholds.get(row_material, score), score)
+
+    # Lists that gain this material, and lists that held it before (and may lose it)
+    gaining = set()
+    for doc_id, score in zip(candidate_ids, scores):
+        other_id = int(doc_id)
+        if other_id == material_id or other_id not in live or float(score) < min_score:
+            continue
+        if counts.get(other_id, 0) < top_k or float(score) > thresholds.get(other_id, -1.0):
+            gaining.add(other_id)
+    holding = set(RelatedMaterial.objects.filter(related_id=material_id).exclude(
+        material_id=material_id
+    ).values_list('material_id', flat=True))
+
+    # Every list that changes is recomputed in full, so a material that loses
+    # the link gets its next-best neighbour back and ranks stay contiguous
+    affected_ids, affected_vectors = vector_store.get_embeddings(sorted(gaining | holding))
+    affected = [int(doc_id) for doc_id in affected_ids]
+    if affected:
+        neighbours = vector_store.nearest(affected_vectors, top_k * 2 + 1)
+        live_neighbours = set(CourseMaterial.objects.filter(
+            id__in={int(doc_id) for ids, _ in neighbours for doc_id in ids}
+        ).values_list('id', flat=True))
+        for other_id, vector, (ids, vectors) in zip(affected, affected_vectors, neighbours):
+            rows.extend(_candidate_rows(other_id, vector, ids, vectors, live_neighbours, top_k, min_score))
+
+    with transaction.atomic():
+        RelatedMaterial.objects.filter(material_id__in=[material_id, *affected]).delete()
+        RelatedMaterial.objects.filter(related_id=material_id).delete()
+        RelatedMaterial.objects.bulk_create(rows)
+
+    logger.info(f"Updated related materials for {material_id} ({len(affected)} neighbour lists recomputed)")
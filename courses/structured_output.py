@@ -0,0 +1,290 @@
+"""
+Tolerant parsing of JSON produced by the LLM.
+
+Gemini is asked for "ONLY JSON" but regularly wraps it in code fences, adds a
+sentence before or after, leaves trailing commas, or gets cut off mid-item.
+`JSONArrayStreamParser` consumes the text as it streams in and emits every
+element of the top-level array as soon as its closing brace arrives, so one
+bad item (or a stray bracket in surrounding prose) no longer fails the whole
+response.
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+def repair_json(text):
+    """
+    Fix the most common LLM JSON mistakes in a single pass.
+
+    Handles markdown code fences, single and smart quoted strings, Python
+    literals (True/False/None), raw newlines inside strings, trailing commas
+    and truncated output (unterminated strings and unclosed brackets).
+    """
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+    if text.endswith('```'):
+        text = text[:-3]
+
+    out = []
+    stack = []
+    quote = None  # closing quote of the string being scanned, or None
+    escape = False
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if quote:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == quote or (quote == '”' and ch == '“'):
+                quote = None
+                ch = '"'
+            elif ch == '"':
+                # Bare double quote inside a single/smart-quoted string
+                ch = '\\"'
+            elif ch == '\n':
+                ch = '\\n'
+            elif ch == '\t':
+                ch = '\\t'
+            out.append(ch)
+            i += 1
+            continue
+
+        if ch in '"\'“':
+            quote = {'"': '"', "'": "'", '“': '”'}[ch]
+            ch = '"'
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            if stack:
+                stack.pop()
+        elif ch.isalpha():
+            j = i
+            while j < n and text[j].isalpha():
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        out.append(ch)
+        i += 1
+
+    if quote:
+        if escape:
+            out.pop()
+        out.append('"')
+    while out and (out[-1].isspace() or out[-1] in ',:'):
+        out.pop()
+    out.extend(reversed(stack))
+    return ''.join(out)
+
+
+def loads_lenient(text):
+    """json.loads, retried once on the repaired text. Raises ValueError if both fail."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(repair_json(text))
+
+
+class ItemSchema:
+    """
+    Minimal schema for a generated item: required and optional keys with types.
+    Unknown keys are dropped and scalar values are coerced to str where a
+    string is expected.
+    """
+
+    def __init__(self, required, optional=None):
+        self.required = required
+        self.optional = optional or {}
+
+    def validate(self, item):
+        """Return the cleaned item, or None if it does not match the schema."""
+        if not isinstance(item, dict):
+            return None
+        cleaned = {}
+        for fields, mandatory in ((self.required, True), (self.optional, False)):
+            for key, expected in fields.items():
+                if key not in item or item[key] is None:
+                    if mandatory:
+                        return None
+                    continue
+                value = item[key]
+                if expected is str and isinstance(value, (int, float)):
+                    value = str(value)
+                if not isinstance(value, expected):
+                    if mandatory:
+                        return None
+                    continue
+                cleaned[key] = value
+        return cleaned
+
+
+QUIZ_QUESTION_SCHEMA = ItemSchema(
+    required={'question': str, 'options': list, 'answer': str},
+    optional={'explanation': str},
+)
+
+FLASHCARD_SCHEMA = ItemSchema(required={'front': str, 'back': str})
+
+VIDEO_SCENE_SCHEMA = ItemSchema(required={'visual': str, 'audio': str}, optional={'time': str})
+
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for a top-level JSON array of objects.
+
+    Feed it chunks of model output with ``feed()``; each call returns the
+    items completed by that chunk. Text before the array (prose, code fences)
+    is skipped, brackets inside strings are ignored, and malformed or
+    schema-invalid items are dropped individually. Call ``close()`` at the end
+    of the stream to salvage a truncated last item.
+    """
+
+    def __init__(self, schema=None):
+        self.schema = schema
+        self.items_seen = 0
+        self.items_dropped = 0
+        self._state = 'seek'  # seek -> array -> item -> done
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item = []
+
+    @property
+    def done(self):
+        return self._state == 'done'
+
+    def feed(self, chunk):
+        completed = []
+        for ch in chunk:
+            if self._state == 'seek':
+                if ch == '[':
+                    self._state = 'array'
+            elif self._state == 'array':
+                if ch == '{':
+                    self._state = 'item'
+                    self._depth = 1
+                    self._item = [ch]
+                elif ch == ']':
+                    self._state = 'done' if self.items_seen else 'seek'
+                elif ch.isspace() or ch == ',':
+                    continue
+                elif not self.items_seen:
+                    # A '[' in leading prose, not the start of the array
+                    self._state = 'seek'
+            elif self._state == 'item':
+                self._item.append(ch)
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == '\\':
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_string = False
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in '{[':
+                    self._depth += 1
+                elif ch in '}]':
+                    self._depth -= 1
+                    if self._depth == 0:
+                        item = self._finish_item()
+                        if item is not None:
+                            completed.append(item)
+                        self._state = 'array'
+        return completed
+
+    def close(self):
+        """Flush a truncated trailing item, if any. Returns a list of 0 or 1 items."""
+        if self._state != 'item' or not self._item:
+            return []
+        item = self._finish_item()
+        self._state = 'done'
+        return [item] if item is not None else []
+
+    def _finish_item(self):
+        text = ''.join(self._item)
+        self._item = []
+        self._in_string = False
+        self._escape = False
+        self.items_seen += 1
+        try:
+            item = loads_lenient(text)
+        except ValueError:
+            self.items_dropped += 1
+            logger.warning(f"Dropped unparseable item from model output: {text[:80]}")
+            return None
+        if self.schema is not None:
+            item = self.schema.validate(item)
+            if item is None:
+                self.items_dropped += 1
+                logger.warning(f"Dropped item not matching schema: {text[:80]}")
+        return item
+
+
+def iter_json_array(chunks, schema=None):
+    """Yield validated array items from an iterable of text chunks as they complete."""
+    parser = JSONArrayStreamParser(schema)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    yield from parser.close()
+
+
+def parse_json_array(text, schema=None):
+    """Parse every valid item of the first JSON array in ``text``."""
+    return list(iter_json_array([text], schema))
+
+
+def parse_json_object(text):
+    """
+    Extract and parse the first JSON object in ``text``, tolerating prose,
+    code fences and the issues handled by ``repair_json``.
+    Raises ValueError if no object can be recovered.
+    """
+    start = text.find('{')
+    if start == -1:
+        raise ValueError("No JSON object found in model output")
+
+    depth = 0
+    in_string = False
+    escape = False
+    end = len(text)
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                end = i + 1
+                break
+
+    result = loads_lenient(text[start:end])
+    if not isinstance(result, dict):
+        raise ValueError("Model output is not a JSON object")
+    return result
@@ -0,0 +1,240 @@
+"""
+Search-as-you-type suggestions.
+
+Material titles, topic names, tags and popular past questions are kept in an
+in-memory sorted array of (key, entry) pairs. A lookup bisects to the range
+of keys starting with the prefix and ranks every entry in it by weight, so it
+never touches the database. Every word position of an entry is indexed, so
+"sort" also finds "Merge Sort".
+
+The index is built lazily per process and patched in place when materials,
+topics or queries change in this process; a periodic background rebuild
+(SUGGEST_REBUILD_INTERVAL) picks up changes made by other workers.
+"""
+
+import bisect
+import heapq
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, F
+from django.urls import reverse
+
+from . import background
+from .models import CourseMaterial, MaterialTag, PopularQuery, Tag, Topic
+
+logger = logging.getLogger(__name__)
+
+MIN_PREFIX_LENGTH = 2
+MAX_INDEXED_WORDS = 6
+MAX_QUERY_LENGTH = 120
+
+# Relative weight of each source when ranking suggestions
+QUERY_WEIGHT = 3.0
+TOPIC_WEIGHT = 2.0
+TAG_WEIGHT = 1.0
+MATERIAL_WEIGHT = 1.0
+
+
+def normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over weighted suggestion entries."""
+
+    def __init__(self):
+        self._pairs = []    # sorted (key, entry_id)
+        self._entries = {}  # entry_id -> suggestion dict
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _keys(text):
+        words = normalize(text).split()
+        return {" ".join(words[i:]) for i in range(min(len(words), MAX_INDEXED_WORDS))}
+
+    def add(self, entry_id, text, kind, weight, url=None):
+        """Insert or replace an entry."""
+        with self._lock:
+            self._remove(entry_id)
+            self._entries[entry_id] = {'text': text, 'type': kind, 'weight': weight, 'url': url}
+            for key in self._keys(text):
+                bisect.insort(self._pairs, (key, entry_id))
+
+    def add_many(self, entries):
+        """Insert (entry_id, text, kind, weight, url) tuples with a single sort (for full builds)."""
+        with self._lock:
+            for entry_id, text, kind, weight, url in entries:
+                self._remove(entry_id)
+                self._entries[entry_id] = {'text': text, 'type': kind, 'weight': weight, 'url': url}
+                self._pairs.extend((key, entry_id) for key in self._keys(text))
+            self._pairs.sort()
+
+    def set_weight(self, entry_id, weight):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is not None:
+                entry['weight'] = weight
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in self._keys(entry['text']):
+            i = bisect.bisect_left(self._pairs, (key, entry_id))
+            if i < len(self._pairs) and self._pairs[i] == (key, entry_id):
+                del self._pairs[i]
+
+    def search(self, prefix, limit=8):
+        """Best ``limit`` entries with a word starting with ``prefix``, by weight."""
+        prefix = normalize(prefix)
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return []
+
+        # The whole matching range is ranked: keys are in alphabetical, not weight, order
+        with self._lock:
+            start = bisect.bisect_left(self._pairs, (prefix,))
+            end = bisect.bisect_left(self._pairs, (prefix + '\U0010ffff',), start)
+            matched = {entry_id: self._entries[entry_id] for _, entry_id in self._pairs[start:end]}
+            best = heapq.nsmallest(
+                limit, matched.values(),
+                key=lambda entry: (-entry['weight'], len(entry['text']), entry['text']),
+            )
+            return [{'text': entry['text'], 'type': entry['type'], 'url': entry['url']} for entry in best]
+
+
+def _material_entry(material_id, title):
+    return f"material:{material_id}", title, 'material', MATERIAL_WEIGHT, reverse('material_detail', args=[material_id])
+
+
+def _topic_entry(topic_id, name, material_count):
+    return f"topic:{topic_id}", name, 'topic', TOPIC_WEIGHT + material_count, None
+
+
+def _tag_entry(name, material_count):
+    return f"tag:{name}", name, 'tag', TAG_WEIGHT * material_count, None
+
+
+def _query_entry(query, text, count):
+    return f"query:{query}", text, 'query', QUERY_WEIGHT * count, None
+
+
+def build_index():
+    """Full build from the database (4 queries)."""
+    entries = [_material_entry(material_id, title) for material_id, title in CourseMaterial.objects.values_list('id', 'title')]
+    entries += [
+        _topic_entry(topic_id, name, count)
+        for topic_id, name, count in Topic.objects.annotate(n=Count('materials')).values_list('id', 'name', 'n')
+    ]
+    entries += [
+        _tag_entry(name, count)
+        for name, count in Tag.objects.annotate(n=Count('material_links')).filter(n__gt=0).values_list('name', 'n')
+    ]
+    queries = PopularQuery.objects.filter(
+        count__gte=getattr(settings, 'SUGGEST_MIN_QUERY_COUNT', 2)
+    ).order_by('-count').values_list('query', 'text', 'count')[:getattr(settings, 'SUGGEST_MAX_QUERIES', 5000)]
+    entries += [_query_entry(query, text, count) for query, text, count in queries]
+
+    index = PrefixIndex()
+    index.add_many(entries)
+    return index
+
+
+_index = None
+_built_at = 0.0
+_build_lock = threading.Lock()
+
+
+def _rebuild():
+    global _index, _built_at
+    index = build_index()
+    _index, _built_at = index, time.monotonic()
+    logger.info(f"Built suggestion index with {len(index)} entries")
+
+
+def get_index():
+    """The process-wide index, built on first use and refreshed in the background."""
+    if _index is None:
+        with _build_lock:
+            if _index is None:
+                _rebuild()
+    elif time.monotonic() - _built_at > getattr(settings, 'SUGGEST_REBUILD_INTERVAL', 300):
+        background.submit(_rebuild, key='suggest-rebuild')
+    return _index
+
+
+def suggest(prefix, limit=8):
+    return get_index().search(prefix, limit)
+
+
+# Incremental updates (called from courses.signals). They only patch an index
+# that has already been built; otherwise the first lookup builds it fresh.
+
+def material_saved(material):
+    if _index is None:
+        return
+    _index.add(*_material_entry(material.pk, material.title))
+    if material.topic_id:
+        topic_saved_id(material.topic_id)
+    material_tags = MaterialTag.objects.filter(material=material).values('tag_id')
+    for name, count in Tag.objects.filter(id__in=material_tags).annotate(n=Count('material_links')).values_list('name', 'n'):
+        _index.add(*_tag_entry(name, count))
+
+
+def material_deleted(material):
+    if _index is not None:
+        _index.remove(f"material:{material.pk}")
+
+
+def tag_unlinked(tag_id):
+    """Lower a tag's weight after one of its material links was removed (or drop it at zero)."""
+    if _index is None:
+        return
+    tag = Tag.objects.filter(pk=tag_id).annotate(n=Count('material_links')).values_list('name', 'n').first()
+    if tag is None:
+        return
+    name, count = tag
+    if count:
+        _index.add(*_tag_entry(name, count))
+    else:
+        _index.remove(f"tag:{name}")
+
+
+def topic_saved_id(topic_id):
+    if _index is None:
+        return
+    topic = Topic.objects.filter(pk=topic_id).annotate(n=Count('materials')).values_list('name', 'n').first()
+    if topic:
+        _index.add(*_topic_entry(topic_id, *topic))
+
+
+def topic_deleted(topic):
+    if _index is not None:
+        _index.remove(f"topic:{topic.pk}")
+
+
+def record_query(text):
+    """Count a user question (off the request path) and surface it once it is popular."""
+    text = " ".join(str(text).split())
+    if not text or len(text) > MAX_QUERY_LENGTH:
+        return
+    background.submit(_record_query, text)
+
+
+def _record_query(text):
+    query = normalize(text)
+    updated = PopularQuery.objects.filter(query=query).update(count=F('count') + 1, text=text)
+    if not updated:
+        PopularQuery.objects.get_or_create(query=query, defaults={'text': text, 'count': 1})
+    count = PopularQuery.objects.filter(query=query).values_list('count', flat=True).first() or 0
+    if _index is not None and count >= getattr(settings, 'SUGGEST_MIN_QUERY_COUNT', 2):
+        _index.add(*_query_entry(query, text, count))
@@ -0,0 +1,44 @@
+"""
+Normalized material tags.
+
+``CourseMaterial.tags`` stays the free-text, comma-separated field users edit;
+on save it is parsed into Tag rows linked through MaterialTag, which search
+and facet queries use instead of substring matching on the raw text.
+"""
+
+from django.db import transaction
+
+from .models import MaterialTag, Tag
+
+MAX_TAG_LENGTH = 50
+
+
+def normalize_tag(name):
+    return " ".join(name.strip().lstrip('#').lower().split())[:MAX_TAG_LENGTH]
+
+
+def parse_tags(text):
+    """Unique normalized tag names from a comma-separated string, in order."""
+    names = []
+    for part in (text or '').split(','):
+        name = normalize_tag(part)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def sync_material_tags(material):
+    """Make the material's Tag links match its ``tags`` text."""
+    names = parse_tags(material.tags)
+    with transaction.atomic():
+        if names:
+            Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        tag_ids = set(Tag.objects.filter(name__in=names).values_list('id', flat=True))
+
+        links = MaterialTag.objects.filter(material=material)
+        links.exclude(tag_id__in=tag_ids).delete()
+        existing = set(links.values_list('tag_id', flat=True))
+        MaterialTag.objects.bulk_create(
+            [MaterialTag(material=material, tag_id=tag_id) for tag_id in tag_ids - existing],
+            ignore_conflicts=True,
+        )
@@ -1,3 +1,1001 @@
-from django.test import TestCase
+import os
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase
+
+from .structured_output import (
+    FLASHCARD_SCHEMA, JSONArrayStreamParser, iter_json_array, parse_json_array, parse_json_object, repair_json,
+)
+
+
+class StructuredOutputTests(SimpleTestCase):
+    def test_items_split_across_chunks(self):
+        parser = JSONArrayStreamParser(FLASHCARD_SCHEMA)
+        self.assertEqual(parser.feed('Sure! ```json\n[{"front": "A", "ba'), [])
+        self.assertEqual(parser.feed('ck": "1"}, {"front": "B",'), [{'front': 'A', 'back': '1'}])
+        self.assertEqual(parser.feed(' "back": "2"}]\n```'), [{'front': 'B', 'back': '2'}])
+        self.assertTrue(parser.done)
+
+    def test_truncated_last_item_is_salvaged_on_close(self):
+        parser = JSONArrayStreamParser(FLASHCARD_SCHEMA)
+        self.assertEqual(parser.feed('[{"front": "A", "back": "1"}, {"front": "B", "back": "cut o'), [{'front': 'A', 'back': '1'}])
+        self.assertFalse(parser.done)
+        self.assertEqual(parser.close(), [{'front': 'B', 'back': 'cut o'}])
+
+    def test_escaped_quotes_and_brackets_inside_strings(self):
+        text = r'[{"front": "Say \"hi\" [twice]", "back": "a } b \\"}]'
+        self.assertEqual(parse_json_array(text, FLASHCARD_SCHEMA), [{'front': 'Say "hi" [twice]', 'back': 'a } b \\'}])
+
+    def test_nested_arrays(self):
+        text = '[{"question": "Q", "options": ["a", ["b", "c"]], "answer": "a"}, {"question": "R", "options": [], "answer": "x"}]'
+        items = parse_json_array(text)
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[0]['options'], ['a', ['b', 'c']])
+
+    def test_bad_items_are_dropped_individually(self):
+        parser = JSONArrayStreamParser(FLASHCARD_SCHEMA)
+        items = parser.feed('[{"front": "A", "back": "1"}, {"front": oops}, {"front": "only"}, {"front": "C", "back": "3"}]')
+        self.assertEqual([item['front'] for item in items], ['A', 'C'])
+        self.assertEqual(parser.items_dropped, 2)
+
+    def test_bracket_in_leading_prose_is_skipped(self):
+        text = 'Here are [some] cards:\n[{"front": "A", "back": "1"}]'
+        self.assertEqual(parse_json_array(text, FLASHCARD_SCHEMA), [{'front': 'A', 'back': '1'}])
+
+    def test_iter_json_array_stops_at_end_of_array(self):
+        chunks = iter(['[{"front": "A", "back": "1"}]', ' trailing [{"front": "X", "back": "Y"}]'])
+        self.assertEqual(list(iter_json_array(chunks, FLASHCARD_SCHEMA)), [{'front': 'A', 'back': '1'}])
+
+    def test_repair_json(self):
+        self.assertEqual(repair_json("{'a': True, 'b': None, 'c': [1, 2,],}"), '{"a": true, "b": null, "c": [1, 2]}')
+        self.assertEqual(repair_json('{"a": "unterminated'), '{"a": "unterminated"}')
+        self.assertEqual(repair_json('```json\n[{"a": 1}, {"b": [2'), '[{"a": 1}, {"b": [2]}]')
+
+    def test_parse_json_object(self):
+        self.assertEqual(parse_json_object('Result:\n{"title": "T", "scenes": [{"a": "}"}]} done'), {'title': 'T', 'scenes': [{'a': '}'}]})
+        with self.assertRaises(ValueError):
+            parse_json_object('no object here')
+
+
+class StreamCachingTests(TestCase):
+    def setUp(self):
+        # Usage events are flushed from a background thread, outside the test database
+        patcher = mock.patch('courses.metering.meter.enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _rag(self, chunks):
+        from .rag_service import RAGService
+
+        def stream():
+            for chunk in chunks:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield mock.Mock(text=chunk)
+
+        rag = RAGService(use_vector_search=False)
+        rag.model = mock.Mock()
+        rag.model.generate_content.return_value = stream()
+        return rag
+
+    def test_complete_stream_is_cached(self):
+        from .generation_cache import GenerationCache
+
+        rag = self._rag(['[{"front": "A", "back": "1"},', ' {"front": "B", "back": "2"}]'])
+        self.assertEqual(len(list(rag.stream_flashcards('graphs'))), 2)
+        self.assertEqual(len(GenerationCache().get('FLASHCARDS', 'graphs', prompt_version=rag.FLASHCARDS_PROMPT_VERSION)), 2)
+
+    def test_interrupted_or_truncated_stream_is_not_cached(self):
+        from .generation_cache import GenerationCache
+
+        for chunks in (['[{"front": "A", "back": "1"},', RuntimeError('connection reset')],
+                       ['[{"front": "A", "back": "1"}, {"front": "B", "ba']):
+            rag = self._rag(chunks)
+            self.assertTrue(list(rag.stream_flashcards('trees')))
+            self.assertFalse(GenerationCache().get('FLASHCARDS', 'trees', prompt_version=rag.FLASHCARDS_PROMPT_VERSION))
+
+
+class FakeVectorStore:
+    """In-memory stand-in for VectorStoreService's embedding lookups."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.nearest_calls = 0
+
+    def document_for_material(self, material):
+        return {'id': material.id, 'text': material.title, 'metadata': {}}
+
+    MODEL_NAME = 'fake-model'
+    EMBEDDING_DIMENSION = 48
+
+    def get_embedding(self, doc_id):
+        return self.embeddings.get(int(doc_id))
+
+    def get_all_embeddings(self):
+        ids = sorted(self.embeddings)
+        return self.get_embeddings(ids)
+
+    def get_all_metadatas(self):
+        return {str(i): {'title': f"Material {i}"} for i in self.embeddings}
+
+    def get_embeddings(self, doc_ids):
+        import numpy as np
+
+        ids = [int(i) for i in doc_ids if int(i) in self.embeddings]
+        return [str(i) for i in ids], np.array([self.embeddings[i] for i in ids], dtype=np.float32).reshape(len(ids), -1)
+
+    def nearest(self, query_embeddings, n_results):
+        import numpy as np
+
+        self.nearest_calls += 1
+        ids = sorted(self.embeddings)
+        matrix = np.array([self.embeddings[i] for i in ids], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        results = []
+        for query in query_embeddings:
+            order = np.argsort(-(matrix @ np.asarray(query, dtype=np.float32)))[:n_results]
+            results.append(([str(ids[j]) for j in order], matrix[order]))
+        return results
+
+
+@mock.patch('courses.similarity.embed_document', lambda document, vector_store: False)
+class RelatedMaterialUpdateTests(TestCase):
+    def setUp(self):
+        from .models import CourseMaterial
+
+        self.ids = [CourseMaterial.objects.create(title=f"M{i}").id for i in range(5)]
+
+    def neighbour_lists(self):
+        from .models import RelatedMaterial
+
+        lists = {}
+        for material_id, related_id, rank in RelatedMaterial.objects.order_by('material_id', 'rank').values_list(
+            'material_id', 'related_id', 'rank'
+        ):
+            lists.setdefault(material_id, []).append((rank, related_id))
+        return {material_id: [related for _, related in rows] for material_id, rows in lists.items()}
+
+    def brute_force(self, embeddings, top_k):
+        import numpy as np
+
+        lists = {}
+        for material_id, vector in embeddings.items():
+            others = [other for other in embeddings if other != material_id]
+            score = lambda other: float(np.dot(vector, embeddings[other]) / np.linalg.norm(vector) / np.linalg.norm(embeddings[other]))
+            lists[material_id] = sorted(others, key=score, reverse=True)[:top_k]
+        return lists
+
+    def test_lists_that_lose_a_material_are_refilled(self):
+        from django.test import override_settings
+        from .similarity import update_related_for_material
+
+        a, b, c, d, e = self.ids
+        embeddings = {a: [1.0, 0.0], b: [0.95, 0.1], c: [0.9, 0.3], d: [0.2, 1.0], e: [0.0, 1.0]}
+        store = FakeVectorStore(embeddings)
+        with override_settings(RELATED_MATERIALS_TOP_K=2, RELATED_MATERIALS_MIN_SCORE=-1.0):
+            for material_id in self.ids:
+                update_related_for_material(material_id, vector_store=store)
+            self.assertEqual(self.neighbour_lists(), self.brute_force(embeddings, 2))
+
+            # b moves next to d and e: a and c lose it and must get their next-best neighbour back
+            embeddings[b] = [0.1, 1.0]
+            update_related_for_material(b, vector_store=store)
+            self.assertEqual(self.neighbour_lists(), self.brute_force(embeddings, 2))
+
+    def test_material_missing_from_the_store_is_skipped(self):
+        from .similarity import update_related_for_material
+
+        store = FakeVectorStore({self.ids[0]: [1.0, 0.0]})
+        update_related_for_material(self.ids[1], vector_store=store)
+        self.assertEqual(store.nearest_calls, 0)
+
+
+class UsageMeterTests(SimpleTestCase):
+    def test_idle_buffer_is_flushed_after_the_interval(self):
+        import threading
+
+        from .metering import LLMCall, UsageMeter
+
+        meter = UsageMeter()
+        meter.enabled, meter.batch_size, meter.flush_interval = True, 50, 0.05
+        flushed = threading.Event()
+        with mock.patch('courses.metering.background.submit', lambda fn, key=None: flushed.set()):
+            meter.record(LLMCall('test'))
+            self.assertTrue(flushed.wait(2))
+
+
+class DigitizationJobTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        from django.test import override_settings
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        patcher = mock.patch('courses.metering.meter.enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _job(self, **fields):
+        import io
+        import uuid
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        from .models import DigitizationJob
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (20, 20), 'white').save(buffer, format='PNG')
+        return DigitizationJob.objects.create(
+            batch_id=uuid.uuid4(), image_hash='h', image=SimpleUploadedFile('page.png', buffer.getvalue()), **fields
+        )
+
+    def test_uploaded_image_is_deleted_when_the_job_finishes(self):
+        from .digitization import DigitizationService
+
+        for outcome in (mock.Mock(text='# Notes'), RuntimeError('boom')):
+            job = self._job()
+            path = job.image.path
+            service = DigitizationService()
+            service.model = mock.Mock()
+            service.model.generate_content.side_effect = [outcome]
+            service.process_job(job.pk)
+            job.refresh_from_db()
+            self.assertIn(job.status, ('DONE', 'FAILED'))
+            self.assertFalse(job.image)
+            self.assertFalse(os.path.exists(path))
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .digitization import sweep_stale_jobs
+        from .models import DigitizationJob
+
+        pending, processing, recent = self._job(), self._job(status='PROCESSING'), self._job(status='PROCESSING')
+        long_ago = timezone.now() - timedelta(hours=1)
+        DigitizationJob.objects.filter(pk__in=[pending.pk, processing.pk]).update(updated_at=long_ago)
+
+        with mock.patch('courses.digitization.background.submit') as submit:
+            self.assertEqual(sweep_stale_jobs(), (1, 1))
+        self.assertEqual(submit.call_args.args[1], pending.pk)
+        processing.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(processing.status, 'FAILED')
+        self.assertFalse(processing.image)
+        self.assertEqual(recent.status, 'PROCESSING')
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        from .circuit_breaker import CircuitBreaker
+
+        self.now = 0.0
+        self.breaker = CircuitBreaker('test', window=60, min_calls=4, failure_rate=0.5, open_seconds=30, clock=lambda: self.now)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            self.breaker.before_call()
+            self.breaker.record(failed=True)
+
+    def test_opens_at_the_failure_rate_after_min_calls(self):
+        from .circuit_breaker import CircuitOpenError
+
+        self.breaker.before_call()
+        self.breaker.record(failed=False)
+        self.fail(2)
+        self.assertFalse(self.breaker.is_open)  # 3 calls < min_calls
+        self.fail()
+        self.assertTrue(self.breaker.is_open)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_in, 30)
+
+    def test_failures_outside_the_window_are_forgotten(self):
+        self.fail(3)
+        self.now = 61
+        self.fail()
+        self.assertFalse(self.breaker.is_open)
+
+    def test_half_open_lets_one_probe_through(self):
+        from .circuit_breaker import CLOSED, OPEN, CircuitOpenError
+
+        self.fail(4)
+        self.now = 30
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record(failed=True)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now = 60
+        with self.breaker:
+            pass
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.snapshot()['calls'], 0)
+
+    def test_release_frees_the_probe_without_a_verdict(self):
+        from .circuit_breaker import HALF_OPEN
+
+        self.fail(4)
+        self.now = 30
+        self.breaker.before_call()
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.before_call()  # the next caller may probe
+
+
+class NearDuplicateTests(TestCase):
+    TEXT = (
+        "A binary search tree keeps its keys in sorted order so that lookup insertion and deletion "
+        "take time proportional to the height of the tree which is logarithmic when the tree is balanced"
+    )
+
+    def _material(self, title, text):
+        from .dedup import update_signature
+        from .models import CourseMaterial
+
+        material = CourseMaterial.objects.create(title=title, text_content=text)
+        update_signature(material)
+        return material
+
+    def test_minhash_estimates_jaccard_similarity(self):
+        from .dedup import SHINGLE_SIZE, band_hashes, minhash, similarity
+
+        def shingles(text):
+            words = text.lower().split()
+            return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+        edited = self.TEXT.replace('logarithmic', 'small')
+        exact = len(shingles(self.TEXT) & shingles(edited)) / len(shingles(self.TEXT) | shingles(edited))
+        self.assertAlmostEqual(similarity(minhash(self.TEXT), minhash(edited)), exact, delta=0.15)
+        self.assertEqual(band_hashes(minhash(self.TEXT)), band_hashes(minhash(self.TEXT.upper())))
+        self.assertIsNone(minhash('too short to fingerprint'))
+
+    def test_find_and_collapse_near_duplicates(self):
+        from .dedup import collapse_near_duplicates, find_near_duplicates
+
+        original = self._material('BST', self.TEXT)
+        copy = self._material('BST copy', self.TEXT + ' indeed')
+        other = self._material('Hashing', "Hash tables map keys to buckets with a hash function and resolve collisions by chaining or open addressing in expected constant time")
+
+        found = find_near_duplicates(self.TEXT, exclude_id=original.id)
+        self.assertEqual([material for material, _ in found], [copy])
+        self.assertGreaterEqual(found[0][1], 0.8)
+        self.assertEqual(collapse_near_duplicates([copy, other, original]), [copy, other])
+
+
+class SuggestTests(TestCase):
+    def test_prefix_index_matches_any_word_by_weight(self):
+        from .suggest import PrefixIndex
+
+        index = PrefixIndex()
+        index.add('material:1', 'Merge Sort', 'material', 1.0)
+        index.add('topic:1', 'Sorting Algorithms', 'topic', 3.0)
+        index.add('material:2', 'Heaps', 'material', 1.0)
+        self.assertEqual([s['text'] for s in index.search('SOR')], ['Sorting Algorithms', 'Merge Sort'])
+        self.assertEqual(index.search('s'), [])
+
+        index.add('material:1', 'Quick Sort', 'material', 5.0)
+        index.remove('topic:1')
+        self.assertEqual([s['text'] for s in index.search('sort')], ['Quick Sort'])
+        self.assertEqual(index.search('merge'), [])
+
+    def test_heavy_entries_are_found_past_thousands_of_lighter_keys(self):
+        from .suggest import PrefixIndex
+
+        index = PrefixIndex()
+        index.add_many([(f"material:{i}", f"data {i:05d}", 'material', 1.0, None) for i in range(5000)])
+        index.add('topic:1', 'Data Structures', 'topic', 50.0)  # sorts after every "data 0..." key
+        self.assertEqual(index.search('da', limit=1)[0]['text'], 'Data Structures')
+
+    def test_tag_weight_drops_when_links_are_removed(self):
+        from . import suggest
+        from .models import CourseMaterial
+
+        first = CourseMaterial.objects.create(title='One', tags='graphs')
+        CourseMaterial.objects.create(title='Two', tags='graphs, trees')
+        with mock.patch('courses.suggest._index', suggest.build_index()), mock.patch('courses.suggest._built_at', time.monotonic()):
+            self.assertEqual(suggest._index._entries['tag:graphs']['weight'], 2)
+            first.tags = 'trees'
+            first.save()
+            self.assertEqual(suggest._index._entries['tag:graphs']['weight'], 1)
+            self.assertEqual(suggest._index._entries['tag:trees']['weight'], 2)
+            CourseMaterial.objects.filter(tags__contains='graphs').delete()
+            self.assertEqual([s['text'] for s in suggest.suggest('gr')], [])
+
+    def test_index_is_built_from_the_database_and_learns_popular_queries(self):
+        from . import suggest
+        from .models import CourseMaterial, Topic
+
+        topic = Topic.objects.create(name='Graph Theory')
+        CourseMaterial.objects.create(title='Graph traversal', topic=topic)
+        # A fresh build time keeps get_index() from starting a background rebuild
+        with mock.patch('courses.suggest._index', suggest.build_index()), mock.patch('courses.suggest._built_at', time.monotonic()):
+            self.assertEqual([s['type'] for s in suggest.suggest('graph')], ['topic', 'material'])
+
+            suggest._record_query('What is a graph cut?')
+            self.assertEqual(len(suggest.suggest('graph')), 2)
+            suggest._record_query('what is a GRAPH cut?')
+            self.assertEqual(suggest.suggest('graph')[0], {'text': 'what is a GRAPH cut?', 'type': 'query', 'url': None})
+
+
+class TokenBudgetTests(SimpleTestCase):
+    def test_truncate_to_tokens(self):
+        from .tokens import estimate_tokens, truncate_to_tokens
+
+        text = " ".join(f"word{i}" for i in range(100))
+        self.assertEqual(estimate_tokens('abcde'), 2)
+        self.assertEqual(truncate_to_tokens('short', 10), 'short')
+        head = truncate_to_tokens(text, 10)
+        self.assertTrue(head.startswith('word0 ') and head.endswith('…'))
+        self.assertLessEqual(len(head), 41)
+        self.assertNotIn('word1…', head.replace(' ', ''))  # cut at a word boundary
+        tail = truncate_to_tokens(text, 10, keep='end')
+        self.assertTrue(tail.startswith('…word') and tail.endswith('word99'))
+        self.assertEqual(truncate_to_tokens(text, 0), '')
+
+    def test_rewrite_query(self):
+        from .chat import rewrite_query
+
+        self.assertEqual(rewrite_query('and its complexity?', 'How does BFS work?'), 'BFS complexity')
+        self.assertEqual(rewrite_query('what about DFS?', 'BFS complexity'), 'DFS complexity')
+        self.assertEqual(rewrite_query('Explain quicksort partitioning', 'BFS complexity'), 'Explain quicksort partitioning')
+        self.assertEqual(rewrite_query('and its complexity?', None), 'and its complexity?')
+
+    def test_build_conversation_keeps_newest_turns_within_budget(self):
+        from django.test import override_settings
+
+        from .chat import build_conversation
+        from .models import ChatSession, ChatTurn
+
+        session = ChatSession(summary='Earlier: graphs.', summarized_through=1)
+        turns = [ChatTurn(index=i, query=f"question {i}", answer="x " * 200) for i in range(5)]
+        with override_settings(CHAT_HISTORY_TOKEN_BUDGET=120, CHAT_TURN_MAX_TOKENS=40):
+            conversation = build_conversation(session, turns)
+        self.assertTrue(conversation.startswith('Summary of earlier discussion: Earlier: graphs.'))
+        self.assertIn('question 4', conversation)
+        self.assertNotIn('question 1', conversation)
+        self.assertLess(conversation.index('question 3'), conversation.index('question 4'))
+        self.assertLessEqual(len(conversation) // 4, 120)
+
+
+@mock.patch('courses.chat.get_model', lambda: None)
+class ChatSummaryTests(TestCase):
+    def test_extractive_summary_folds_turns_outside_the_recent_window(self):
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+
+        from .chat import update_summary
+        from .models import ChatSession, ChatTurn
+
+        session = ChatSession.objects.create(user=get_user_model().objects.create(username='student'))
+        for i in range(5):
+            ChatTurn.objects.create(
+                session=session, index=i, query=f"q{i}", search_query=f"topic {i}", answer=f"Answer {i}. More detail."
+            )
+        with override_settings(CHAT_RECENT_TURNS=3):
+            update_summary(session.pk)
+            session.refresh_from_db()
+            self.assertEqual(session.summarized_through, 2)
+            self.assertEqual(session.summary, "- topic 0: Answer 0.\n- topic 1: Answer 1.")
+
+            update_summary(session.pk)  # nothing new to fold
+            session.refresh_from_db()
+            self.assertEqual(session.summarized_through, 2)
+
+
+class QuizTopicValidationTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        self.client.force_login(get_user_model().objects.create(username='student'))
+
+    def test_malformed_or_unknown_topic_id_is_rejected(self):
+        from django.urls import reverse
+
+        for name in ('api_quiz_generate', 'api_quiz_stream'):
+            url = reverse(name)
+            response = self.client.post(url, {'topic_id': 'abc'}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'topic_id must be an integer'})
+            self.assertEqual(self.client.post(url, {'topic_id': 999999}, content_type='application/json').status_code, 404)
+            self.assertEqual(self.client.post(url, {'topic': 42}, content_type='application/json').status_code, 400)
+
+
+class GenerationCacheTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('courses.metering.meter.enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_skips_retrieval_until_a_source_changes(self):
+        from .generation_cache import GenerationCache
+        from .models import CourseMaterial
+
+        material = CourseMaterial.objects.create(title='BFS')
+        retrieve = mock.Mock(return_value=[material])
+        producer = mock.Mock(side_effect=lambda sources: [{'q': len(sources)}])
+        cache = GenerationCache()
+        cache.stale_while_revalidate = False
+
+        self.assertEqual(cache.get_or_generate('QUIZ', 'Graphs', producer, retrieve=retrieve), [{'q': 1}])
+        self.assertEqual(cache.get_or_generate('QUIZ', '  graphs ', producer, retrieve=retrieve), [{'q': 1}])
+        self.assertEqual((retrieve.call_count, producer.call_count), (1, 1))
+
+        material.title = 'Breadth-first search'
+        material.save()
+        cache.get_or_generate('QUIZ', 'graphs', producer, retrieve=retrieve)
+        self.assertEqual((retrieve.call_count, producer.call_count), (2, 2))
+        self.assertEqual(GenerationCache.stats()[0] | {'size_bytes': 0}, {
+            'generator': 'Quiz', 'hits': 2, 'misses': 2, 'hit_rate': 0.5, 'size_bytes': 0,
+        })
+
+    def test_expired_entry_is_served_stale_while_it_refreshes(self):
+        from datetime import timedelta
+
+        from .generation_cache import GenerationCache
+        from .models import GeneratedContent
+
+        cache = GenerationCache()
+        cache.get_or_generate('VIDEO', 'sorting', lambda: {'title': 'old'})
+        GeneratedContent.objects.update(refreshed_at=F('refreshed_at') - cache.ttl - timedelta(seconds=1))
+
+        with mock.patch('courses.generation_cache.background.submit') as submit:
+            self.assertEqual(cache.get_or_generate('VIDEO', 'sorting', lambda: {'title': 'new'}), {'title': 'old'})
+        fn, *args = submit.call_args.args
+        fn(*args)
+        self.assertEqual(cache.get('VIDEO', 'sorting'), {'title': 'new'})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .generation_cache import GenerationCache
+        from .models import GeneratedContent
+
+        cache = GenerationCache()
+        cache.max_entries = 2
+        for i, topic in enumerate(['a', 'b']):
+            cache.set('FLASHCARDS', topic, [{'front': topic, 'back': 'x'}])
+            GeneratedContent.objects.filter(query=topic).update(last_accessed_at=timezone.now() - timedelta(hours=2 - i))
+        cache.get('FLASHCARDS', 'a')  # now b is the least recently used
+        cache.set('FLASHCARDS', 'c', [{'front': 'c', 'back': 'x'}])
+        self.assertEqual(sorted(GeneratedContent.objects.values_list('query', flat=True)), ['a', 'c'])
+
+        cache.max_bytes = GeneratedContent.objects.get(query='c').size_bytes
+        cache.evict()
+        self.assertEqual(list(GeneratedContent.objects.values_list('query', flat=True)), ['c'])
+
+
+class MaterialDetailETagTests(TestCase):
+    def test_etag_changes_with_the_related_list(self):
+        from .models import CourseMaterial, RelatedMaterial
+
+        material, first, second = (CourseMaterial.objects.create(title=title) for title in ('A', 'B', 'C'))
+        RelatedMaterial.objects.create(material=material, related=first, score=0.9, rank=0)
+        url = f'/material-detail/{material.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        RelatedMaterial.objects.filter(material=material).update(related=second)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.client.get(url)['ETag']
+
+        second.title = 'C (revised)'
+        second.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'C (revised)')
+
+
+class TracingTests(TestCase):
+    def test_histogram_exposition(self):
+        from .tracing import Histogram
+
+        histogram = Histogram('test_seconds', 'Test.', buckets=(0.1, 1.0))
+        histogram.observe('rag.search', 0.05)
+        histogram.observe('rag.search', 0.5)
+        self.assertEqual(histogram.exposition().splitlines()[2:], [
+            'test_seconds_bucket{stage="rag.search",le="0.1"} 1',
+            'test_seconds_bucket{stage="rag.search",le="1.0"} 2',
+            'test_seconds_bucket{stage="rag.search",le="+Inf"} 2',
+            'test_seconds_sum{stage="rag.search"} 0.550000',
+            'test_seconds_count{stage="rag.search"} 2',
+        ])
+
+    def test_spans_are_recorded_only_for_sampled_traces(self):
+        from .tracing import end_trace, span, start_trace
+
+        for sampled in (True, False):
+            trace, token = start_trace(sampled)
+            try:
+                with span('outer'), span('inner'):
+                    pass
+                with span('inner'):
+                    pass
+            finally:
+                end_trace(token)
+            self.assertEqual([name for name, _ in trace.spans], ['inner', 'outer', 'inner'] if sampled else [])
+
+    def test_server_timing_sums_repeated_stages(self):
+        from .tracing import Trace
+
+        trace = Trace(sampled=True)
+        trace.spans.extend([('inner', 0.001), ('outer', 0.003), ('inner', 0.002)])
+        self.assertEqual(trace.server_timing(), 'inner;dur=3.0;desc="2 calls", outer;dur=3.0')
+
+    def test_server_timing_header_only_for_staff_debug_requests(self):
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+
+        with override_settings(TRACING_SAMPLE_RATE=0):
+            self.assertNotIn('Server-Timing', self.client.get('/healthz', HTTP_X_DEBUG_TIMING='1'))
+            self.client.force_login(get_user_model().objects.create(username='admin', is_staff=True))
+            self.assertIn('http.request;dur=', self.client.get('/healthz', HTTP_X_DEBUG_TIMING='1')['Server-Timing'])
+
+    def test_metrics_require_token_or_staff(self):
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.client.force_login(get_user_model().objects.create(username='student'))
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.client.force_login(get_user_model().objects.create(username='admin', is_staff=True))
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'courses_trace_sample_rate')
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class MaterialListingTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        from .models import CourseMaterial
+
+        self.client.force_login(get_user_model().objects.create(username='student'))
+        self.materials = [
+            CourseMaterial.objects.create(title=f"Note {i}", description='lecture', text_content='body ' * 50)
+            for i in range(30)
+        ]
+
+    def test_library_search_covers_every_page(self):
+        from django.urls import reverse
+
+        from .views import LibraryView
+
+        url = reverse('library', args=['theory'])
+        oldest = self.materials[0]
+        self.assertNotIn(oldest, self.client.get(url).context['materials'])
+        response = self.client.get(url, {'q': 'note 0'})
+        self.assertEqual(response.context['materials'], [oldest])
+
+        response = self.client.get(url, {'q': 'note'})
+        self.assertEqual(len(response.context['materials']), LibraryView.page_size)
+        cursor = response.context['next_cursor']
+        self.assertContains(response, f'?after={cursor}&q=note')
+        self.assertEqual(len(self.client.get(url, {'q': 'note', 'after': cursor}).context['materials']), 30 - LibraryView.page_size)
+
+    def test_api_cursor_pages_and_field_selection(self):
+        seen = []
+        url = '/api/materials/?page_size=12&fields=id,title'
+        while url:
+            data = self.client.get(url).json()
+            self.assertEqual({key for row in data['results'] for key in row}, {'id', 'title'})
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+        self.assertEqual(seen, sorted((m.id for m in self.materials), reverse=True))
+
+        row = self.client.get('/api/materials/').json()['results'][0]
+        self.assertNotIn('text_content', row)
+        row = self.client.get('/api/materials/?include=text').json()['results'][0]
+        self.assertEqual(row['text_content'], 'body ' * 50)
+
+
+class MaterialFacetTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        from .models import CourseMaterial, Topic
+
+        self.client.force_login(get_user_model().objects.create(username='student'))
+        self.graphs = Topic.objects.create(name='Graphs')
+        self.sorting = Topic.objects.create(name='Sorting')
+        self.bfs = CourseMaterial.objects.create(title='BFS', topic=self.graphs, week=3, file_type='CODE', tags='Graphs, BFS')
+        CourseMaterial.objects.create(title='DFS', topic=self.graphs, week=4, file_type='PDF', tags='graphs, #dfs')
+        CourseMaterial.objects.create(title='Heapsort', topic=self.sorting, week=4, file_type='CODE', tags='heap')
+
+    def counts(self, facets, facet):
+        return {row['label']: row['count'] for row in facets[facet]}
+
+    def test_counts_cover_only_the_filtered_set(self):
+        from .facets import filter_materials, material_facets
+
+        facets = material_facets(filter_materials({'tag': 'GRAPHS'}))
+        self.assertEqual(self.counts(facets, 'tag'), {'graphs': 2, 'bfs': 1, 'dfs': 1})
+        self.assertEqual(self.counts(facets, 'topic'), {'Graphs': 2})
+        self.assertEqual([row['value'] for row in facets['week']], [3, 4])
+        self.assertEqual(self.counts(facets, 'file_type'), {'Code File': 1, 'PDF Document': 1})
+
+        facets = material_facets(filter_materials({'week': '4', 'file_type': 'CODE'}))
+        self.assertEqual(self.counts(facets, 'topic'), {'Sorting': 1})
+
+    def test_malformed_selection_is_rejected(self):
+        response = self.client.get('/api/materials/facets/', {'week': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('week', response.json()['error'])
+        self.assertEqual(self.client.get('/api/materials/facets/', {'week': '3'}).status_code, 200)
+
+    def test_resaving_with_changed_tags_relinks(self):
+        from .rag_service import RAGService
+
+        self.bfs.tags = 'Shortest Paths, bfs'
+        self.bfs.save()
+        self.assertEqual(
+            set(self.bfs.normalized_tags.values_list('name', flat=True)),
+            {'shortest paths', 'bfs'},
+        )
+
+        rag = RAGService(use_vector_search=False)
+        self.assertEqual(rag.search('#Shortest Paths'), [self.bfs])
+        self.assertNotIn(self.bfs, rag.search('graphs'))
+
+
+class RenderingSanitizerTests(SimpleTestCase):
+    def render(self, text):
+        from .rendering import render_markdown
+
+        return render_markdown(text)
+
+    def test_scripts_and_active_content_are_dropped(self):
+        for text in (
+            '<script>alert(1)</script>x',
+            '<SCRIPT src="//evil/x.js"></SCRIPT>x',
+            '<style>body{display:none}</style>x',
+            '<iframe src="//evil"></iframe>x',
+            '<svg onload=alert(1)><script>alert(1)</script></svg>x',
+            '<!-- <script>alert(1)</script> -->x',
+        ):
+            self.assertEqual(self.render(text).strip(), '<p>x</p>', text)
+
+    def test_javascript_urls_are_removed(self):
+        rendered = self.render(
+            '[a](javascript:alert(1)) [b](JaVa&#x09;ScRiPt:alert(1)) <a href=" javascript:x">c</a> '
+            '![i](data:image/svg+xml;base64,PHN2Zz4=) [ok](https://example.com/x?y=1)'
+        )
+        self.assertNotIn('javascript', rendered.lower())
+        self.assertNotIn('data:', rendered)
+        self.assertIn('<a href="https://example.com/x?y=1" rel="nofollow noopener">ok</a>', rendered)
+
+    def test_event_handlers_and_unknown_attributes_are_stripped(self):
+        rendered = self.render('<img src="x.png" onerror="alert(1)" style="x"> <p onclick="alert(1)" class="c">t</p> <div class="note" onmouseover=alert(1)>d</div>')
+        self.assertNotRegex(rendered, r'\son\w+=|style=')
+        self.assertIn('<img src="x.png">', rendered)
+        self.assertIn('<div class="note">d</div>', rendered)
+
+    def test_mathml_escapes_are_sanitized(self):
+        rendered = self.render(
+            '<math><mtext><img src=x onerror=alert(1)></mtext>'
+            '<annotation-xml encoding="text/html"><script>alert(1)</script></annotation-xml>'
+            '<maction actiontype="statusline" xlink:href="javascript:alert(1)">m</maction></math>'
+        )
+        self.assertNotIn('onerror', rendered)
+        self.assertNotIn('script', rendered)
+        self.assertNotIn('javascript', rendered)
+        self.assertNotIn('maction', rendered)
+
+    def test_escaped_html_stays_text(self):
+        self.assertEqual(self.render('&lt;script&gt;alert(1)&lt;/script&gt;'), '<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>')
+
+    def test_math_placeholders_cannot_be_forged(self):
+        rendered = self.render('MATHBLOCK0END and $x$ MATH0000000000000000N0END')
+        self.assertIn('MATHBLOCK0END', rendered)
+        self.assertIn('MATH0000000000000000N0END', rendered)
+        self.assertEqual(rendered.count('<math'), 1)
+
+        with mock.patch('courses.rendering.secrets.token_hex', return_value='feed'):
+            # Even a guessed token with an index that was never issued is left alone
+            self.assertIn('MATHfeedN7END', self.render('$y$ MATHfeedN7END'))
+
+    def test_math_inside_code_is_not_converted(self):
+        rendered = self.render('`$a$` and\n\n```\n$$b$$\n```')
+        self.assertIn('<code>$a$</code>', rendered)
+        self.assertIn('$$b$$', rendered)
+        self.assertNotIn('<math', rendered)
+
+
+class ChatTurnIndexTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        self.user = get_user_model().objects.create(username='student')
+        rag = mock.Mock()
+        rag.provide_bangla_explanation.return_value = 'answer'
+        patcher = mock.patch('courses.rag_service.RAGService', return_value=rag)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_turn_taken_by_a_concurrent_request_moves_to_the_next_index(self):
+        from . import chat
+        from .models import ChatSession, ChatTurn
+
+        session = ChatSession.objects.create(user=self.user)
+
+        def concurrent_request(query, previous):
+            # Another request in the session stores turns 0 and 1 while this one is answered
+            for index in (0, 1):
+                ChatTurn.objects.create(session=session, index=index, query='other', search_query='other')
+            return query
+
+        with mock.patch('courses.chat.rewrite_query', side_effect=concurrent_request):
+            chat.answer(self.user, 'What is a heap?', session_id=session.pk, bangla=True)
+        self.assertEqual(
+            list(session.turns.values_list('index', 'query')),
+            [(0, 'other'), (1, 'other'), (2, 'What is a heap?')],
+        )
+
+    def test_retries_are_bounded(self):
+        from django.db import IntegrityError
+
+        from . import chat
+        from .models import ChatTurn
+
+        create = ChatTurn.objects.create
+        failures = [IntegrityError('unique_chat_turn')] * 2
+
+        def collide_twice(**fields):
+            if failures:
+                raise failures.pop()
+            return create(**fields)
+
+        with mock.patch.object(ChatTurn.objects, 'create', side_effect=collide_twice) as patched:
+            chat.answer(self.user, 'What is a heap?', bangla=True)
+        self.assertEqual(patched.call_count, 3)
+
+        with mock.patch.object(ChatTurn.objects, 'create', side_effect=IntegrityError('unique_chat_turn')) as patched:
+            with self.assertRaises(IntegrityError):
+                chat.answer(self.user, 'What is a heap?', bangla=True)
+        self.assertEqual(patched.call_count, chat.TURN_INSERT_ATTEMPTS)
+
+
+def synthetic_embeddings(n=400, dimension=48, rank=12, seed=7):
+    """Low-rank vectors plus noise, so PCA to ``rank`` dimensions keeps the neighbourhoods."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    basis = rng.normal(size=(rank, dimension))
+    return (rng.normal(size=(n, rank)) @ basis + 0.05 * rng.normal(size=(n, dimension))).astype(np.float32)
+
+
+class CompactIndexTests(SimpleTestCase):
+    def setUp(self):
+        import numpy as np
+
+        self.embeddings = synthetic_embeddings()
+        self.ids = np.arange(1, len(self.embeddings) + 1)
+        self.queries = range(0, len(self.embeddings), 20)
+
+    def test_compact_encodings_keep_recall(self):
+        from .vector_index import CompactIndex, recall_at_k
+
+        for dtype, dims in (('int8', None), ('int8', 16), ('float16', 16)):
+            index = CompactIndex.build(self.ids, self.embeddings, dtype=dtype, dims=dims)
+            with self.subTest(dtype=dtype, dims=dims):
+                self.assertGreaterEqual(recall_at_k(index, self.embeddings, self.queries, k=10, rescore_factor=0), 0.9)
+                self.assertGreaterEqual(recall_at_k(index, self.embeddings, self.queries, k=10, rescore_factor=4), 0.98)
+        index = CompactIndex.build(self.ids, self.embeddings, dtype='int8', dims=16)
+        self.assertLess(index.memory_bytes(), self.embeddings.nbytes / 2)
+
+    def test_added_and_removed_rows_are_searched(self):
+        import numpy as np
+
+        from .vector_index import CompactIndex
+
+        index = CompactIndex.build(self.ids, self.embeddings, dtype='int8', dims=16)
+        self.assertEqual(index.search(self.embeddings[0], k=1)[0][0], 1)
+
+        index.remove([1])
+        self.assertNotIn(1, [material_id for material_id, _ in index.search(self.embeddings[0], k=10)])
+        index.add([1000], self.embeddings[:1])
+        self.assertEqual(index.search(self.embeddings[0], k=1)[0][0], 1000)
+        # Replacing a row hides the stale vector
+        index.add([2], -self.embeddings[1:2])
+        self.assertNotIn(2, [material_id for material_id, _ in index.search(self.embeddings[1], k=10)])
+        self.assertEqual(index.search(-self.embeddings[1], k=1)[0][0], 2)
+        self.assertEqual(len(index), len(self.ids))
+
+        before = index.search(self.embeddings[5], k=10)
+        index.compact()
+        self.assertEqual(len(index.ids), len(self.ids))
+        after = index.search(self.embeddings[5], k=10)
+        self.assertEqual([i for i, _ in after], [i for i, _ in before])
+        np.testing.assert_allclose([score for _, score in after], [score for _, score in before], rtol=1e-5)
+
+    def test_save_and_load_give_identical_results(self):
+        import tempfile
+
+        from .vector_index import CompactIndex
+
+        for dtype, dims in (('int8', 16), ('float16', None)):
+            index = CompactIndex.build(self.ids, self.embeddings, dtype=dtype, dims=dims)
+            index.remove([3])
+            index.add([1000], self.embeddings[3:4])
+            with tempfile.TemporaryDirectory() as path, self.subTest(dtype=dtype, dims=dims):
+                index.save(path)
+                loaded = CompactIndex.load(path)
+                for position in self.queries:
+                    for rescore_factor in (0, 4):
+                        self.assertEqual(
+                            loaded.search(self.embeddings[position], k=10, rescore_factor=rescore_factor),
+                            index.search(self.embeddings[position], k=10, rescore_factor=rescore_factor),
+                        )
+                del loaded  # release the memory map before the directory is removed
+
+
+class IndexSnapshotTests(TestCase):
+    def setUp(self):
+        import tempfile
+
+        from .models import CourseMaterial
+
+        embeddings = synthetic_embeddings(n=60)
+        materials = [CourseMaterial.objects.create(title=f"Material {i}") for i in range(len(embeddings))]
+        self.store = FakeVectorStore({m.id: vector for m, vector in zip(materials, embeddings)})
+        self.ids = [m.id for m in materials]
+        self.embeddings = embeddings
+
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.snapshot = os.path.join(workdir.name, 'index.tar.gz')
+        self.path = os.path.join(workdir.name, 'vector_index')
+
+    def test_export_then_import_gives_identical_results(self):
+        from .index_snapshot import export_snapshot, import_snapshot
+        from .vector_index import CompactIndex
+
+        manifest = export_snapshot(self.snapshot, self.store, dtype='int8', dims=16)
+        self.assertEqual(manifest['count'], len(self.ids))
+        imported, metadata = import_snapshot(self.snapshot, FakeVectorStore, path=self.path)
+        self.assertEqual(imported['files'], manifest['files'])
+        self.assertEqual(metadata[str(self.ids[0])], {'title': f"Material {self.ids[0]}"})
+
+        loaded = CompactIndex.load(self.path)
+        built = CompactIndex.build(self.ids, self.embeddings, dtype='int8', dims=16)
+        self.assertEqual(loaded.manifest['watermark'], manifest['watermark'])
+        for position in range(0, len(self.ids), 6):
+            for rescore_factor in (0, 4):
+                self.assertEqual(
+                    loaded.search(self.embeddings[position], k=5, rescore_factor=rescore_factor),
+                    built.search(self.embeddings[position], k=5, rescore_factor=rescore_factor),
+                )
+
+    def test_corrupt_member_is_rejected(self):
+        import io
+        import tarfile
+
+        from .index_snapshot import SnapshotError, export_snapshot, import_snapshot
+
+        export_snapshot(self.snapshot, self.store, dtype='int8', dims=16)
+        tampered = self.snapshot.replace('.tar.gz', '-tampered.tar')
+        with tarfile.open(self.snapshot) as src, tarfile.open(tampered, 'w') as dst:
+            for member in src:
+                data = src.extractfile(member).read()
+                if member.name == 'metadata.jsonl':
+                    data = data.replace(b'"title"', b'"TITLE"')
+                dst.addfile(member, io.BytesIO(data))
+        with self.assertRaisesRegex(SnapshotError, 'Checksum mismatch'):
+            import_snapshot(tampered, FakeVectorStore, path=self.path)
+        self.assertFalse(os.path.exists(self.path))
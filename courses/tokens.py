@@ -0,0 +1,35 @@
+"""
+Rough token counting for prompt budgets.
+
+Gemini's tokenizer is not available locally; about four characters per
+token is close enough for prose and code to keep prompts under a budget
+without a network round trip.
+"""
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text or '') + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens, keep='start'):
+    """
+    Cut ``text`` to about ``max_tokens`` tokens at a word boundary.
+
+    ``keep='end'`` keeps the tail instead (used for running summaries, where
+    the most recent part matters most).
+    """
+    text = text or ''
+    limit = max(0, max_tokens) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    if limit == 0:
+        return ''
+    if keep == 'end':
+        cut = text[-limit:]
+        space = cut.find(' ')
+        return '…' + (cut[space + 1:] if 0 <= space < 40 else cut)
+    cut = text[:limit]
+    space = cut.rfind(' ')
+    return (cut[:space] if space > limit - 40 else cut) + '…'
@@ -0,0 +1,157 @@
+"""
+Lightweight per-stage tracing for the RAG pipeline and other AI services.
+
+Code marks its stages with ``span('stage.name')``. Only sampled requests pay
+for timing: TracingMiddleware samples TRACING_SAMPLE_RATE of requests (plus
+any request sending the debug header), and unsampled spans reduce to a
+context-variable lookup. Sampled durations are aggregated into in-process
+histograms exposed in Prometheus text format by ``metrics_view``; debug
+requests also get them back in a ``Server-Timing`` response header.
+
+Histograms are per process, so with several workers each one is scraped (or
+aggregated) separately, as with any multi-process Prometheus setup.
+"""
+
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DEBUG_HEADER = 'HTTP_X_DEBUG_TIMING'
+
+
+class Trace:
+    """Spans recorded for one request."""
+
+    __slots__ = ('sampled', 'spans')
+
+    def __init__(self, sampled):
+        self.sampled = sampled
+        self.spans = []
+
+    def server_timing(self):
+        """Spans as a Server-Timing header value, durations summed per stage."""
+        totals = {}
+        for name, seconds in self.spans:
+            total, count = totals.get(name, (0.0, 0))
+            totals[name] = (total + seconds, count + 1)
+        parts = []
+        for name, (total, count) in totals.items():
+            part = f"{name};dur={total * 1000:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        return ', '.join(parts)
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with one series per stage label."""
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            series = self._series.get(stage)
+            if series is None:
+                series = self._series[stage] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {stage: (list(s[0]), s[1], s[2]) for stage, s in self._series.items()}
+        for stage in sorted(snapshot):
+            counts, total, count = snapshot[stage]
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{stage="{stage}"}} {count}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+STAGE_DURATION = Histogram(
+    'courses_stage_duration_seconds',
+    'Duration of sampled pipeline stages (RAG, vector store, Gemini, digitization, video).',
+)
+
+_current_trace = contextvars.ContextVar('courses_trace', default=None)
+
+
+def tracing_enabled():
+    return getattr(settings, 'TRACING_ENABLED', True)
+
+
+def sample_rate():
+    return getattr(settings, 'TRACING_SAMPLE_RATE', 0.1)
+
+
+def should_sample():
+    rate = sample_rate()
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+@contextmanager
+def span(name):
+    """
+    Time the enclosed stage if the current request (or, outside a request,
+    this call) is sampled. Spans nest freely; each is recorded on its own.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        sampled = trace.sampled
+    else:
+        # Background tasks and streamed responses run outside the request context
+        sampled = tracing_enabled() and should_sample()
+
+    if not sampled:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_DURATION.observe(name, seconds)
+        if trace is not None:
+            trace.spans.append((name, seconds))
+
+
+def start_trace(sampled):
+    """Install a new Trace for the current context. Returns (trace, reset_token)."""
+    trace = Trace(sampled)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def render_metrics():
+    """All metrics in Prometheus text exposition format (version 0.0.4)."""
+    return '\n'.join([
+        '# HELP courses_trace_sample_rate Fraction of requests whose stages are timed.',
+        '# TYPE courses_trace_sample_rate gauge',
+        f'courses_trace_sample_rate {sample_rate()}',
+        STAGE_DURATION.exposition(),
+    ]) + '\n'
@@ -3,7 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     TopicViewSet, CourseMaterialViewSet, ChatView,
     GenerateMaterialView, DigitizeNoteView, VideoGeneratorView,
-    QuizGeneratorView, FlashcardGeneratorAPI
+    DigitizationJobCreateView, DigitizationJobStatusView,
+    QuizGeneratorView, QuizStreamView, FlashcardGeneratorAPI, FlashcardStreamAPI,
+    KnowledgeGraphAPI, SuggestView
 )
 
 router = DefaultRouter()
@@ -12,10 +14,16 @@ router.register(r'materials', CourseMaterialViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('suggest/', SuggestView.as_view(), name='api_suggest'),
     path('chat/', ChatView.as_view(), name='api_chat'),
     path('generate/', GenerateMaterialView.as_view(), name='api_generate_material'),
     path('digitize/', DigitizeNoteView.as_view(), name='api_digitize'),
+    path('digitize/jobs/', DigitizationJobCreateView.as_view(), name='api_digitize_jobs'),
+    path('digitize/jobs/<uuid:batch_id>/', DigitizationJobStatusView.as_view(), name='api_digitize_job_status'),
     path('video-script/', VideoGeneratorView.as_view(), name='api_video_script'),
     path('quiz/generate/', QuizGeneratorView.as_view(), name='api_quiz_generate'),
+    path('quiz/stream/', QuizStreamView.as_view(), name='api_quiz_stream'),
     path('flashcards/generate/', FlashcardGeneratorAPI.as_view(), name='api_flashcards_generate'),
+    path('flashcards/stream/', FlashcardStreamAPI.as_view(), name='api_flashcards_stream'),
+    path('graph/', KnowledgeGraphAPI.as_view(), name='api_graph'),
 ]
@@ -1,6 +1,78 @@
+"""
+Checks on generated content: code syntax and grounding in the sources.
+
+Grounding splits the generated text into sentences and scores each one
+against the source passages (cut into windows of a few sentences). Sentences
+and windows are embedded in a single batch and compared with one similarity
+matrix product. Without an embedding model, word containment is used
+instead. If GROUNDING_NLI_MODEL names a cross-encoder, sentences whose score
+falls within GROUNDING_BORDERLINE_MARGIN of the threshold are rescored as
+entailment probabilities against their best window.
+"""
+
 import ast
+import importlib.util
+import logging
+import re
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+_CODE_BLOCK_RE = re.compile(r'```.*?```', re.DOTALL)
+_MARKUP_RE = re.compile(r'^\s*(?:#+|[-*+>]|\d+[.)])\s*|[*_`]+')
+_WORD_RE = re.compile(r'\w+')
+_STOP_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'of', 'in', 'on', 'for', 'to', 'from', 'with', 'by', 'at', 'as',
+    'is', 'are', 'was', 'were', 'be', 'been', 'it', 'its', 'this', 'that', 'these', 'those', 'which', 'can',
+    'you', 'we', 'they', 'not', 'also', 'such', 'has', 'have', 'than', 'then', 'so', 'if', 'each', 'into',
+}
+MIN_CLAIM_WORDS = 4  # shorter lines (headings, labels) are not checked
+WINDOW_SENTENCES = 3
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+
+def split_sentences(text):
+    """Sentences of ``text`` worth checking, with code blocks and Markdown markup removed."""
+    text = _CODE_BLOCK_RE.sub(' ', text or '')
+    sentences = []
+    for part in _SENTENCE_RE.split(text):
+        sentence = " ".join(_MARKUP_RE.sub('', part).split())
+        if len(sentence.split()) >= MIN_CLAIM_WORDS:
+            sentences.append(sentence)
+    return sentences
+
+
+def passage_windows(passages, size=WINDOW_SENTENCES):
+    """Cut (source, text) passages into windows of ``size`` sentences: (source, window) pairs."""
+    windows = []
+    for source, text in passages:
+        sentences = [s for s in (" ".join(p.split()) for p in _SENTENCE_RE.split(text or '')) if s]
+        for start in range(0, len(sentences), size):
+            windows.append((source, " ".join(sentences[start:start + size])))
+    return windows
+
+
+def _get_cross_encoder(name):
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+
+                _cross_encoder = CrossEncoder(name)
+    return _cross_encoder
+
 
 class ContentValidator:
+    def __init__(self, embedder=None):
+        # A SentenceTransformer (e.g. VectorStoreService.embedding_model); None selects the lexical check
+        self.embedder = embedder
+
     def validate_code(self, code_content, language="python"):
         """
         Validates syntax of generated code.
@@ -11,13 +83,130 @@ class ContentValidator:
                 return {"valid": True, "errors": []}
             except SyntaxError as e:
                 return {"valid": False, "errors": [f"Line {e.lineno}: {e.msg}"]}
-        
+
         # Determine strictness for other languages later
         return {"valid": True, "errors": []}
 
-    def check_grounding(self, content, source_ids):
+    def check_grounding(self, content, source_ids=None, passages=None):
         """
-        Checks if content is grounded in sources.
+        Checks how well each sentence of ``content`` is supported by the sources.
+
+        Args:
+            content: Generated answer or notes
+            source_ids: CourseMaterial ids whose text is used as sources
+            passages: (source, text) pairs used as sources, e.g. the exact
+                excerpts put into the prompt; takes precedence over source_ids
+
+        Returns:
+            Dict with 'grounded', 'score' (fraction of supported sentences),
+            'method' and 'sentences': [{'text', 'score', 'supported', 'source'}]
         """
-        # Placeholder for RAG verification
-        return {"grounded": True, "score": 0.9}
+        import numpy as np
+
+        if passages is None:
+            passages = self._material_passages(source_ids or [])
+        sentences = split_sentences(content)
+        windows = passage_windows(passages)[:getattr(settings, 'GROUNDING_MAX_WINDOWS', 64)]
+
+        if not sentences:
+            return {"grounded": True, "score": 1.0, "method": None, "sentences": []}
+        if not windows:
+            return {
+                "grounded": False, "score": 0.0, "method": None,
+                "sentences": [{"text": s, "score": 0.0, "supported": False, "source": None} for s in sentences],
+            }
+
+        method = 'embedding'
+        threshold = getattr(settings, 'GROUNDING_SUPPORT_THRESHOLD', 0.55)
+        similarity = None
+        if self.embedder is not None:
+            try:
+                similarity = self._embedding_similarity(sentences, [text for _, text in windows])
+            except Exception as e:
+                logger.warning(f"Embedding grounding check failed, using lexical check: {e}")
+        if similarity is None:
+            method = 'lexical'
+            threshold = getattr(settings, 'GROUNDING_LEXICAL_THRESHOLD', 0.5)
+            similarity = self._lexical_similarity(sentences, [text for _, text in windows])
+
+        best = similarity.argmax(axis=1)
+        scores = similarity[np.arange(len(sentences)), best].astype(float)
+
+        supported = scores >= threshold
+        nli_model = getattr(settings, 'GROUNDING_NLI_MODEL', '')
+        if nli_model and importlib.util.find_spec('sentence_transformers') is not None:
+            margin = getattr(settings, 'GROUNDING_BORDERLINE_MARGIN', 0.1)
+            borderline = np.flatnonzero(np.abs(scores - threshold) < margin)
+            if len(borderline):
+                try:
+                    entailment = self._entailment(
+                        nli_model, [(windows[best[i]][1], sentences[i]) for i in borderline]
+                    )
+                    # Borderline sentences are decided by the entailment probability instead
+                    scores[borderline] = entailment
+                    supported[borderline] = entailment >= 0.5
+                    method = f'{method}+nli'
+                except Exception as e:
+                    logger.warning(f"NLI grounding check failed, keeping similarity scores: {e}")
+
+        fraction = float(supported.mean())
+        return {
+            "grounded": fraction >= getattr(settings, 'GROUNDING_MIN_SUPPORTED', 0.7),
+            "score": round(fraction, 3),
+            "method": method,
+            "sentences": [
+                {
+                    "text": sentence,
+                    "score": round(float(scores[i]), 3),
+                    "supported": bool(supported[i]),
+                    "source": windows[best[i]][0],
+                }
+                for i, sentence in enumerate(sentences)
+            ],
+        }
+
+    def _material_passages(self, source_ids):
+        from .models import CourseMaterial
+
+        materials = CourseMaterial.objects.filter(id__in=source_ids).only('id', 'description', 'text_content')
+        return [(material.id, material.text_content or material.description or '') for material in materials]
+
+    def _embedding_similarity(self, sentences, windows):
+        """Cosine similarity matrix (sentences x windows) from one batched encode."""
+        import numpy as np
+
+        from .circuit_breaker import get_breaker
+
+        with get_breaker('embedder'):
+            vectors = self.embedder.encode(sentences + windows, convert_to_numpy=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return vectors[:len(sentences)] @ vectors[len(sentences):].T
+
+    def _lexical_similarity(self, sentences, windows):
+        """Share of each sentence's content words found in each window (sentences x windows)."""
+        import numpy as np
+
+        def terms(text):
+            return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOP_WORDS and len(w) > 1}
+
+        sentence_terms = [terms(s) for s in sentences]
+        window_terms = [terms(w) for w in windows]
+        vocabulary = {term: i for i, term in enumerate(set().union(*sentence_terms))}
+        s = np.zeros((len(sentences), len(vocabulary)), dtype=np.float32)
+        w = np.zeros((len(windows), len(vocabulary)), dtype=np.float32)
+        for i, found in enumerate(sentence_terms):
+            s[i, [vocabulary[t] for t in found]] = 1
+        for i, found in enumerate(window_terms):
+            w[i, [vocabulary[t] for t in found if t in vocabulary]] = 1
+        return (s @ w.T) / np.maximum(s.sum(axis=1, keepdims=True), 1)
+
+    def _entailment(self, model_name, pairs):
+        """Entailment probability of each (premise, hypothesis) pair."""
+        import numpy as np
+
+        logits = np.asarray(_get_cross_encoder(model_name).predict(pairs), dtype=np.float32)
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+        return probabilities[:, getattr(settings, 'GROUNDING_NLI_ENTAILMENT_INDEX', 1)]
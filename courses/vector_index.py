@@ -0,0 +1,398 @@
+"""
+Compact in-memory vector index.
+
+The embeddings are stored in reduced precision so each worker holds a fraction
+of the float32 matrix:
+
+- ``float16``: half precision, 2 bytes per dimension.
+- ``int8``: scalar quantization with a per-dimension scale and offset, 1 byte
+  per dimension.
+
+Optionally the vectors are reduced to fewer dimensions first, either with a
+PCA projection learned from the corpus or by Matryoshka-style truncation
+(keeping the leading dimensions, only meaningful for models trained that
+way). Candidates found in the compact space are rescored against the
+full-precision vectors, which are memory-mapped from disk so only the rows
+that are actually rescored get paged in.
+
+The index is built by ``manage.py build_vector_index`` and stored as .npy
+files plus a manifest in ``VECTOR_INDEX_PATH``. Rows added or removed after
+the build are kept in a small full-precision delta that is searched exactly.
+
+numpy is imported inside the functions so that importing this module stays
+cheap.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+DTYPES = ('float32', 'float16', 'int8')
+REDUCTIONS = ('none', 'pca', 'truncate')
+
+
+def _normalize(vectors):
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        return vectors / max(float(np.linalg.norm(vectors)), 1e-12)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def learn_pca(vectors, dims, sample_size=20000, seed=0):
+    """
+    Learn a PCA projection to ``dims`` dimensions from (a sample of) the vectors.
+
+    Returns:
+        (components, mean): float32 arrays of shape (dims, d) and (d,)
+    """
+    import numpy as np
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) > sample_size:
+        rows = np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)
+        vectors = vectors[np.sort(rows)]
+    mean = vectors.mean(axis=0)
+    _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+    return vt[:dims].astype(np.float32), mean.astype(np.float32)
+
+
+class CompactIndex:
+    """
+    Reduced-precision, optionally reduced-dimension, cosine-similarity index.
+
+    Attributes:
+        ids: int64 array of material ids, one per row
+        codes: compact vectors (float32/float16/int8), shape (n, dims)
+        full: normalized float32 vectors (usually a read-only memmap), or None
+    """
+
+    def __init__(self, ids, codes, dtype='int8', scale=None, offset=None,
+                 components=None, mean=None, reduction='none', truncate_dims=None,
+                 full=None, manifest=None):
+        import numpy as np
+
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.codes = codes
+        self.dtype = dtype
+        self.scale = scale
+        self.offset = offset
+        self.components = components
+        self.mean = mean
+        self.reduction = reduction
+        self.truncate_dims = truncate_dims
+        self.full = full
+        self.manifest = manifest or {}
+
+        self._row_of = {int(material_id): row for row, material_id in enumerate(self.ids.tolist())}
+        self._deleted = np.zeros(len(self.ids), dtype=bool)
+        self._delta = {}  # material id -> normalized float32 vector
+        self._lock = threading.Lock()
+
+    # ----- building -----
+
+    @classmethod
+    def build(cls, ids, embeddings, dtype='int8', dims=None, reduction='pca', keep_full=True):
+        """
+        Build an index from float embeddings.
+
+        Args:
+            ids: Material ids, one per row
+            embeddings: Array of shape (n, d)
+            dtype: 'float32', 'float16' or 'int8'
+            dims: Target dimensionality; None keeps all dimensions
+            reduction: 'pca' or 'truncate' (only used when dims < d)
+            keep_full: Keep full-precision vectors for rescoring
+        """
+        import numpy as np
+
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype {dtype!r}; expected one of {DTYPES}")
+        full = _normalize(embeddings)
+        components = mean = None
+        if not dims or dims >= full.shape[1]:
+            reduction = 'none'
+        elif reduction == 'pca':
+            components, mean = learn_pca(full, dims)
+        elif reduction != 'truncate':
+            raise ValueError(f"Unknown reduction {reduction!r}; expected one of {REDUCTIONS}")
+
+        index = cls(ids, None, dtype=dtype, components=components, mean=mean,
+                    reduction=reduction, truncate_dims=dims if reduction == 'truncate' else None,
+                    full=full if keep_full else None)
+        reduced = index._project(full, center=True)
+
+        if dtype == 'int8':
+            low = reduced.min(axis=0)
+            high = reduced.max(axis=0)
+            index.scale = np.maximum((high - low) / 255.0, 1e-12).astype(np.float32)
+            index.offset = low.astype(np.float32)
+            index.codes = index._quantize(reduced)
+        else:
+            index.codes = reduced.astype(dtype)
+        return index
+
+    def _project(self, vectors, center):
+        """Map normalized vectors into the compact space."""
+        if self.reduction == 'pca':
+            if center:
+                vectors = vectors - self.mean
+            return vectors @ self.components.T
+        if self.reduction == 'truncate':
+            return vectors[..., :self.truncate_dims]
+        return vectors
+
+    def _quantize(self, reduced):
+        import numpy as np
+
+        codes = np.rint((reduced - self.offset) / self.scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    # ----- persistence -----
+
+    def save(self, path):
+        """Write the index as .npy files plus a manifest into ``path``."""
+        import numpy as np
+
+        self.compact()
+        os.makedirs(path, exist_ok=True)
+        arrays = {'ids': self.ids, 'codes': self.codes}
+        if self.dtype == 'int8':
+            arrays.update(scale=self.scale, offset=self.offset)
+        if self.reduction == 'pca':
+            arrays.update(components=self.components, mean=self.mean)
+        if self.full is not None:
+            arrays['full'] = np.asarray(self.full, dtype=np.float32)
+        for name, array in arrays.items():
+            # Write then rename: other processes may have the old file memory-mapped
+            target = os.path.join(path, f'{name}.npy')
+            with open(f'{target}.tmp', 'wb') as fh:
+                np.save(fh, array)
+            os.replace(f'{target}.tmp', target)
+
+        manifest = dict(self.manifest)
+        manifest.update({
+            'format_version': FORMAT_VERSION,
+            'count': int(len(self.ids)),
+            'dimension': int(self.full.shape[1]) if self.full is not None else None,
+            'dims': int(self.codes.shape[1]) if len(self.codes.shape) == 2 else 0,
+            'dtype': self.dtype,
+            'reduction': self.reduction,
+            'truncate_dims': self.truncate_dims,
+            'files': sorted(f'{name}.npy' for name in arrays),
+        })
+        target = os.path.join(path, MANIFEST_NAME)
+        with open(f'{target}.tmp', 'w') as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+        os.replace(f'{target}.tmp', target)
+        self.manifest = manifest
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load an index saved with :meth:`save`.
+
+        With ``mmap`` the full-precision vectors are memory-mapped read-only;
+        the compact codes are always loaded into memory.
+        """
+        import numpy as np
+
+        with open(os.path.join(path, MANIFEST_NAME)) as fh:
+            manifest = json.load(fh)
+        if manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index format {manifest.get('format_version')!r}")
+
+        def array(name, mmap_mode=None):
+            file = os.path.join(path, f'{name}.npy')
+            return np.load(file, mmap_mode=mmap_mode) if os.path.exists(file) else None
+
+        return cls(
+            array('ids'), array('codes'), dtype=manifest['dtype'],
+            scale=array('scale'), offset=array('offset'),
+            components=array('components'), mean=array('mean'),
+            reduction=manifest['reduction'], truncate_dims=manifest.get('truncate_dims'),
+            full=array('full', 'r' if mmap else None), manifest=manifest,
+        )
+
+    # ----- incremental updates -----
+
+    def add(self, ids, embeddings):
+        """Add or replace rows; they are kept in full precision until the next build."""
+        vectors = _normalize(embeddings).reshape(len(ids), -1)
+        with self._lock:
+            for material_id, vector in zip(ids, vectors):
+                material_id = int(material_id)
+                row = self._row_of.get(material_id)
+                if row is not None:
+                    self._deleted[row] = True
+                self._delta[material_id] = vector
+
+    def remove(self, ids):
+        with self._lock:
+            for material_id in ids:
+                material_id = int(material_id)
+                self._delta.pop(material_id, None)
+                row = self._row_of.get(material_id)
+                if row is not None:
+                    self._deleted[row] = True
+
+    def compact(self):
+        """Fold the delta into the main arrays (re-encoding only the new rows)."""
+        import numpy as np
+
+        with self._lock:
+            if not self._delta and not self._deleted.any():
+                return
+            keep = ~self._deleted
+            self.ids = self.ids[keep]
+            self.codes = self.codes[keep]
+            if self.full is not None:
+                self.full = np.asarray(self.full[keep])
+            if self._delta:
+                delta_ids = np.fromiter(self._delta.keys(), dtype=np.int64, count=len(self._delta))
+                delta_full = np.stack(list(self._delta.values()))
+                reduced = self._project(delta_full, center=True)
+                delta_codes = self._quantize(reduced) if self.dtype == 'int8' else reduced.astype(self.dtype)
+                self.ids = np.concatenate([self.ids, delta_ids])
+                self.codes = np.concatenate([self.codes, delta_codes])
+                if self.full is not None:
+                    self.full = np.concatenate([self.full, delta_full])
+            self._row_of = {int(material_id): row for row, material_id in enumerate(self.ids.tolist())}
+            self._deleted = np.zeros(len(self.ids), dtype=bool)
+            self._delta = {}
+
+    def __len__(self):
+        return int(len(self.ids) - self._deleted.sum() + len(self._delta))
+
+    # ----- search -----
+
+    def approximate_scores(self, query, block_size=65536):
+        """Approximate cosine similarity (up to a per-query constant) of every row."""
+        import numpy as np
+
+        q = self._project(query, center=False).astype(np.float32)
+        if self.dtype == 'int8':
+            # q . (offset + scale * (code + 128)) = const + (q * scale) . code
+            weights = q * self.scale
+            const = float(q @ self.offset) + 128.0 * float(weights.sum())
+        else:
+            weights, const = q, 0.0
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), block_size):
+            block = self.codes[start:start + block_size].astype(np.float32)
+            scores[start:start + block_size] = block @ weights + const
+        return scores
+
+    def search(self, query, k=10, rescore_factor=None):
+        """
+        Top-k rows by cosine similarity.
+
+        Args:
+            query: Query embedding of the original dimensionality
+            k: Number of results
+            rescore_factor: Candidates per result rescored against the full
+                vectors (0 disables rescoring)
+
+        Returns:
+            List of (material_id, score) tuples, best first
+        """
+        import numpy as np
+
+        if rescore_factor is None:
+            rescore_factor = getattr(settings, 'VECTOR_INDEX_RESCORE_FACTOR', 4)
+        query = _normalize(query)
+        with self._lock:
+            deleted = self._deleted.copy()
+            delta = dict(self._delta)
+
+        results = []
+        if len(self.ids):
+            scores = self.approximate_scores(query)
+            scores[deleted] = -np.inf
+            live = int(len(scores) - deleted.sum())
+            n_candidates = min(live, k * max(rescore_factor, 1))
+            if n_candidates:
+                candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+                if rescore_factor and self.full is not None:
+                    candidates.sort()  # sequential reads from the memmap
+                    exact = np.asarray(self.full[candidates], dtype=np.float32) @ query
+                else:
+                    exact = scores[candidates]
+                results = list(zip(self.ids[candidates].tolist(), exact.tolist()))
+
+        # Rows added since the build are few and scored exactly
+        if delta:
+            delta_ids = list(delta.keys())
+            delta_scores = np.asarray(list(delta.values()), dtype=np.float32) @ query
+            results.extend(zip(delta_ids, delta_scores.tolist()))
+
+        results.sort(key=lambda item: -item[1])
+        return results[:k]
+
+    def memory_bytes(self):
+        """Bytes held in RAM by the compact arrays (excludes the memory-mapped full vectors)."""
+        total = self.ids.nbytes + self.codes.nbytes
+        for array in (self.scale, self.offset, self.mean):
+            if array is not None:
+                total += array.nbytes
+        if self.reduction == 'pca':
+            total += self.components.nbytes
+        return int(total)
+
+
+def recall_at_k(index, embeddings, queries, k=10, rescore_factor=None):
+    """
+    Recall@k of ``index`` against exact float32 search over ``embeddings``.
+
+    ``queries`` are row positions in ``embeddings`` used as query vectors.
+    """
+    import numpy as np
+
+    full = _normalize(embeddings)
+    hits = 0
+    for position in queries:
+        exact = full @ full[position]
+        truth = set(index.ids[np.argpartition(-exact, k - 1)[:k]].tolist())
+        found = {material_id for material_id, _ in index.search(full[position], k, rescore_factor)}
+        hits += len(truth & found)
+    return hits / (k * len(queries)) if len(queries) else 1.0
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide CompactIndex, or None if none has been built."""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                path = str(getattr(settings, 'VECTOR_INDEX_PATH', ''))
+                if getattr(settings, 'VECTOR_INDEX_ENABLED', True) and path \
+                        and os.path.exists(os.path.join(path, MANIFEST_NAME)):
+                    try:
+                        _index = CompactIndex.load(path)
+                        logger.info(f"Loaded compact vector index ({len(_index)} vectors) from {path}")
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.error(f"Failed to load compact vector index: {e}")
+                _index_loaded = True
+    return _index
+
+
+def reset_index():
+    """Forget the loaded index so the next get_index() reloads it from disk."""
+    global _index, _index_loaded
+    with _index_lock:
+        _index = None
+        _index_loaded = False
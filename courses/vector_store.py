@@ -2,43 +2,102 @@ import os
 # Disable ChromaDB telemetry before it's even imported
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import importlib.util
+import threading
 from django.conf import settings
-import os
 from typing import List, Dict, Any
 import logging
 
-# Suppress noisy ChromaDB telemetry loggers
-logging.getLogger('chromadb.telemetry').setLevel(logging.CRITICAL)
-logging.getLogger('chromadb.telemetry.product.posthog').setLevel(logging.CRITICAL)
+from .circuit_breaker import CircuitOpenError, get_breaker
+from .tracing import span
+from .vector_index import get_index as get_compact_index
 
 logger = logging.getLogger(__name__)
 
+# chromadb and sentence_transformers (which pulls in torch) are imported on
+# first use so that Django startup, migrations and views that never search
+# don't pay for them.
+AVAILABLE = all(
+    importlib.util.find_spec(name) is not None for name in ('chromadb', 'sentence_transformers')
+)
+
+# Metadata keys kept when the collection does not store document text;
+# everything else is resolved from the primary database.
+COMPACT_METADATA_KEYS = ('file_type', 'topic_id', 'start', 'end')
+
+_clients = {}
+_embedding_models = {}
+_shared_lock = threading.Lock()
+
+
+def _get_client(path):
+    """One persistent Chroma client per directory and process."""
+    client = _clients.get(path)
+    if client is None:
+        with _shared_lock:
+            client = _clients.get(path)
+            if client is None:
+                import chromadb
+
+                # Suppress noisy ChromaDB telemetry loggers
+                logging.getLogger('chromadb.telemetry').setLevel(logging.CRITICAL)
+                logging.getLogger('chromadb.telemetry.product.posthog').setLevel(logging.CRITICAL)
+
+                # Disable anonymized telemetry to stop the capture() argument errors
+                client = _clients[path] = chromadb.PersistentClient(
+                    path=path,
+                    settings=chromadb.Settings(anonymized_telemetry=False)
+                )
+    return client
+
+
+def _get_embedding_model(name):
+    """Load a SentenceTransformer once per process and share it between services."""
+    model = _embedding_models.get(name)
+    if model is None:
+        with _shared_lock:
+            model = _embedding_models.get(name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+
+                model = _embedding_models[name] = SentenceTransformer(name)
+    return model
+
 
 class VectorStoreService:
     """
     Manages vector embeddings and semantic search using ChromaDB.
     """
     
-    def __init__(self):
+    # Using all-MiniLM-L6-v2: 384 dimensions, good balance of speed and quality
+    MODEL_NAME = 'all-MiniLM-L6-v2'
+    EMBEDDING_DIMENSION = 384
+    
+    # Collection name -> creation metadata
+    COLLECTIONS = {
+        'course_materials': {"description": "BUET course materials with semantic embeddings"},
+        'community_posts': {"description": "Community questions", "hnsw:space": "cosine"},
+    }
+    
+    def __init__(self, collection_name='course_materials'):
         """Initialize ChromaDB client and embedding model."""
+        self.collection_name = collection_name
         # Set up ChromaDB persistent directory
         self.chroma_dir = os.path.join(settings.BASE_DIR, 'chroma_db')
         os.makedirs(self.chroma_dir, exist_ok=True)
         
+        # When False, only ids, chunk offsets and compact metadata are stored;
+        # passage text is read back from CourseMaterial (see resolve_passages)
+        self.store_documents = getattr(settings, 'VECTOR_STORE_DOCUMENTS', False)
+        
         # Initialize ChromaDB client with persistent storage
-        # Disable anonymized telemetry to stop the capture() argument errors
-        self.client = chromadb.PersistentClient(
-            path=self.chroma_dir,
-            settings=chromadb.Settings(anonymized_telemetry=False)
-        )
+        with span('vector_store.open_client'):
+            self.client = _get_client(self.chroma_dir)
         
         # Initialize embedding model (lightweight and fast)
-        # Using all-MiniLM-L6-v2: 384 dimensions, good balance of speed and quality
         try:
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            with span('vector_store.load_model'):
+                self.embedding_model = _get_embedding_model(self.MODEL_NAME)
             logger.info("Embedding model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
@@ -47,14 +106,68 @@ class VectorStoreService:
         # Get or create collection for course materials
         try:
             self.collection = self.client.get_or_create_collection(
-                name="course_materials",
-                metadata={"description": "BUET course materials with semantic embeddings"}
+                name=self.collection_name,
+                metadata=self.COLLECTIONS[self.collection_name]
             )
             logger.info(f"Collection initialized with {self.collection.count()} documents")
         except Exception as e:
             logger.error(f"Failed to initialize collection: {e}")
             self.collection = None
     
+    @staticmethod
+    def document_for_material(material) -> Dict[str, Any]:
+        """
+        Build the indexed document for a CourseMaterial.
+        
+        Returns:
+            Dict with keys 'id', 'text', 'metadata', or None if the material
+            has no meaningful content
+        """
+        # Combine title, description, and content for better search
+        text_content = f"{material.title}\n\n"
+        
+        if material.description:
+            text_content += f"{material.description}\n\n"
+        
+        if material.text_content:
+            text_content += material.text_content
+        
+        if len(text_content.strip()) < 10:
+            return None
+        
+        return {
+            'id': material.id,
+            'text': text_content,
+            'metadata': {
+                'title': material.title,
+                'file_type': material.file_type,
+                'topic_name': material.topic.name if material.topic else 'N/A',
+                'topic_id': material.topic_id or 0,
+                'tags': material.tags or '',
+                'start': 0,
+                'end': len(text_content),
+            },
+        }
+    
+    def _compact_index(self):
+        """The compact index mirrors the course materials collection only."""
+        if self.collection_name != 'course_materials':
+            return None
+        return get_compact_index()
+    
+    def _collection_payload(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Documents and metadata as they are written to the collection."""
+        if self.store_documents:
+            return {'documents': texts, 'metadatas': metadatas}
+        if self.collection_name != 'course_materials':
+            return {'metadatas': metadatas}
+        return {
+            'metadatas': [
+                {key: metadata[key] for key in COMPACT_METADATA_KEYS if key in metadata}
+                for metadata in metadatas
+            ],
+        }
+    
     def generate_embedding(self, text: str) -> List[float]:
         """
         Generate embedding vector for a given text.
@@ -69,8 +182,11 @@ class VectorStoreService:
             raise ValueError("Embedding model not initialized")
         
         try:
-            embedding = self.embedding_model.encode(text, convert_to_numpy=True)
+            with span('vector_store.embed'), get_breaker('embedder'):
+                embedding = self.embedding_model.encode(text, convert_to_numpy=True)
             return embedding.tolist()
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error generating embedding: {e}")
             raise
@@ -95,9 +211,11 @@ class VectorStoreService:
             self.collection.add(
                 ids=[str(doc_id)],
                 embeddings=[embedding],
-                documents=[text],
-                metadatas=[metadata or {}]
+                **self._collection_payload([text], [metadata or {}])
             )
+            compact_index = self._compact_index()
+            if compact_index is not None:
+                compact_index.add([doc_id], [embedding])
             logger.debug(f"Added document {doc_id} to vector store")
         except Exception as e:
             logger.error(f"Error adding document {doc_id}: {e}")
@@ -119,22 +237,27 @@ class VectorStoreService:
             metadatas = [doc.get('metadata', {}) for doc in documents]
             
             # Generate embeddings in batch (more efficient)
-            embeddings = self.embedding_model.encode(texts, convert_to_numpy=True)
+            with span('vector_store.embed_batch'):
+                embeddings = self.embedding_model.encode(texts, convert_to_numpy=True)
             embeddings_list = [emb.tolist() for emb in embeddings]
             
             # Add to collection
-            self.collection.add(
-                ids=ids,
-                embeddings=embeddings_list,
-                documents=texts,
-                metadatas=metadatas
-            )
+            with span('vector_store.add'):
+                self.collection.add(
+                    ids=ids,
+                    embeddings=embeddings_list,
+                    **self._collection_payload(texts, metadatas)
+                )
+            compact_index = self._compact_index()
+            if compact_index is not None:
+                compact_index.add(ids, embeddings)
             logger.info(f"Added {len(documents)} documents to vector store")
         except Exception as e:
             logger.error(f"Error adding documents batch: {e}")
             raise
     
-    def search(self, query: str, n_results: int = 10, filter_metadata: Dict = None) -> List[Dict[str, Any]]:
+    def search(self, query: str, n_results: int = 10, filter_metadata: Dict = None,
+               include_text: bool = True) -> List[Dict[str, Any]]:
         """
         Perform semantic similarity search.
         
@@ -142,6 +265,7 @@ class VectorStoreService:
             query: Search query text
             n_results: Number of results to return
             filter_metadata: Optional metadata filters
+            include_text: Return passage text; pass False when only ids are needed
             
         Returns:
             List of dictionaries with keys: 'id', 'text', 'metadata', 'distance'
@@ -150,8 +274,15 @@ class VectorStoreService:
             raise ValueError("Collection not initialized")
         
         try:
+            # Serve unfiltered queries from the compact in-memory index when one is built
+            compact_index = None if filter_metadata else self._compact_index()
+            
             # Check actual document count to avoid warnings
-            total_docs = self.collection.count()
+            if compact_index is not None:
+                total_docs = len(compact_index)
+            else:
+                with get_breaker('chroma'):
+                    total_docs = self.collection.count()
             if total_docs == 0:
                 return []
             
@@ -160,31 +291,200 @@ class VectorStoreService:
             # Generate query embedding
             query_embedding = self.generate_embedding(query)
             
+            if compact_index is not None:
+                with span('vector_store.compact_query'):
+                    hits = compact_index.search(query_embedding, k=actual_n)
+                formatted_results = [
+                    {'id': str(doc_id), 'text': None, 'metadata': {}, 'distance': 1.0 - score}
+                    for doc_id, score in hits
+                ]
+                if include_text:
+                    self.resolve_passages(formatted_results)
+                return formatted_results
+            
             # Perform similarity search
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=actual_n,
-                where=filter_metadata
-            )
+            # Only ship stored text back when it exists and is wanted
+            include = ['metadatas', 'distances']
+            if include_text and self.store_documents:
+                include.append('documents')
+            with span('vector_store.query'), get_breaker('chroma'):
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=actual_n,
+                    where=filter_metadata,
+                    include=include
+                )
             
             # Format results
             formatted_results = []
             if results['ids'] and len(results['ids'][0]) > 0:
+                documents = results.get('documents')
                 for i in range(len(results['ids'][0])):
                     formatted_results.append({
                         'id': results['ids'][0][i],
-                        'text': results['documents'][0][i],
+                        'text': documents[0][i] if documents else None,
                         'metadata': results['metadatas'][0][i],
-                        'distance': results['distances'][0][i] if 'distances' in results else None
+                        'distance': results['distances'][0][i] if results.get('distances') else None
                     })
             
+            if include_text:
+                # Fills in only results without stored text
+                self.resolve_passages(formatted_results)
+            
             logger.debug(f"Found {len(formatted_results)} results for query: {query[:50]}...")
             return formatted_results
             
+        except CircuitOpenError as e:
+            logger.debug(f"Skipping vector search: {e}")
+            return []
         except Exception as e:
             logger.error(f"Error searching: {e}")
             return []
     
+    @classmethod
+    def resolve_passages(cls, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Fill in 'text' for search results from the primary database.
+        
+        All materials are fetched in one query; each passage is the slice
+        [start, end) of the material's indexed text. Results whose material
+        no longer exists keep text None.
+        """
+        from .models import CourseMaterial
+        
+        missing = [result for result in results if result.get('text') is None]
+        if not missing:
+            return results
+        
+        with span('vector_store.resolve_passages'):
+            materials = CourseMaterial.objects.select_related('topic').in_bulk(
+                {int(result['id']) for result in missing}
+            )
+        for result in missing:
+            material = materials.get(int(result['id']))
+            document = cls.document_for_material(material) if material else None
+            if document is None:
+                continue
+            metadata = result.get('metadata') or {}
+            start = metadata.get('start', 0)
+            end = metadata.get('end', len(document['text']))
+            result['text'] = document['text'][start:end]
+        return results
+    
+    def get_all_embeddings(self):
+        """
+        Fetch every stored embedding.
+        
+        Returns:
+            Tuple of (list of document ids, float32 numpy array of shape (n, dim))
+        """
+        if not self.collection:
+            raise ValueError("Collection not initialized")
+        
+        import numpy as np
+        
+        data = self.collection.get(include=['embeddings'])
+        ids = data['ids']
+        if not ids:
+            return [], np.zeros((0, self.EMBEDDING_DIMENSION), dtype=np.float32)
+        return ids, np.asarray(data['embeddings'], dtype=np.float32)
+    
+    def get_embeddings(self, doc_ids):
+        """
+        Stored embeddings of the given documents (missing ones are skipped).
+
+        Returns:
+            Tuple of (list of document ids, float32 numpy array of shape (n, dim))
+        """
+        if not self.collection:
+            raise ValueError("Collection not initialized")
+
+        import numpy as np
+
+        if not doc_ids:
+            return [], np.zeros((0, self.EMBEDDING_DIMENSION), dtype=np.float32)
+        with get_breaker('chroma'):
+            data = self.collection.get(ids=[str(doc_id) for doc_id in doc_ids], include=['embeddings'])
+        if not data['ids']:
+            return [], np.zeros((0, self.EMBEDDING_DIMENSION), dtype=np.float32)
+        return data['ids'], np.asarray(data['embeddings'], dtype=np.float32)
+
+    def nearest(self, query_embeddings, n_results):
+        """
+        The ``n_results`` stored documents nearest to each query embedding, in
+        one collection query. Embeddings are unit length, so the collection's
+        L2 order is the cosine order.
+
+        Returns:
+            One (list of document ids, float32 embeddings array) pair per query, nearest first
+        """
+        if not self.collection:
+            raise ValueError("Collection not initialized")
+
+        import numpy as np
+
+        with get_breaker('chroma'):
+            total = self.collection.count()
+        if not total or not len(query_embeddings):
+            return [([], np.zeros((0, self.EMBEDDING_DIMENSION), dtype=np.float32)) for _ in query_embeddings]
+        with span('vector_store.query'), get_breaker('chroma'):
+            results = self.collection.query(
+                query_embeddings=[list(map(float, embedding)) for embedding in query_embeddings],
+                n_results=min(n_results, total),
+                include=['embeddings'],
+            )
+        return [
+            (ids, np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+            for ids, embeddings in zip(results['ids'], results['embeddings'])
+        ]
+
+    def get_all_metadatas(self) -> Dict[str, Dict[str, Any]]:
+        """Stored metadata of every document, keyed by document id."""
+        if not self.collection:
+            raise ValueError("Collection not initialized")
+        
+        data = self.collection.get(include=['metadatas'])
+        return dict(zip(data['ids'], data['metadatas'] or []))
+    
+    def add_embeddings_batch(self, ids: List[str], embeddings, metadatas: List[Dict[str, Any]]):
+        """
+        Write precomputed embeddings to the collection (no embedding model needed).
+        
+        Used when loading an index snapshot; existing ids are overwritten.
+        """
+        if not self.collection or not len(ids):
+            return
+        
+        with span('vector_store.add'):
+            self.collection.upsert(
+                ids=[str(doc_id) for doc_id in ids],
+                embeddings=[list(map(float, embedding)) for embedding in embeddings],
+                metadatas=self._collection_payload([], metadatas)['metadatas']
+            )
+    
+    def has_document(self, doc_id) -> bool:
+        if not self.collection:
+            return False
+        return bool(self.collection.get(ids=[str(doc_id)], include=[])['ids'])
+    
+    def get_embedding(self, doc_id):
+        """Stored embedding of one document, or None if it is not indexed."""
+        if not self.collection:
+            return None
+        data = self.collection.get(ids=[str(doc_id)], include=['embeddings'])
+        if not data['ids']:
+            return None
+        return list(data['embeddings'][0])
+    
+    def update_metadata(self, doc_id, metadata: Dict[str, Any]):
+        """Replace a document's metadata without re-embedding it."""
+        if not self.collection:
+            raise ValueError("Collection not initialized")
+        self.collection.update(
+            ids=[str(doc_id)],
+            metadatas=self._collection_payload([], [metadata])['metadatas']
+        )
+    
     def update_document(self, doc_id: str, text: str, metadata: Dict[str, Any] = None):
         """
         Update an existing document in the vector store.
@@ -220,6 +520,9 @@ class VectorStoreService:
         
         try:
             self.collection.delete(ids=[str(doc_id)])
+            compact_index = self._compact_index()
+            if compact_index is not None:
+                compact_index.remove([doc_id])
             logger.debug(f"Deleted document {doc_id}")
         except Exception as e:
             logger.error(f"Error deleting document {doc_id}: {e}")
@@ -232,10 +535,10 @@ class VectorStoreService:
         
         try:
             # Delete the collection and recreate it
-            self.client.delete_collection(name="course_materials")
+            self.client.delete_collection(name=self.collection_name)
             self.collection = self.client.create_collection(
-                name="course_materials",
-                metadata={"description": "BUET course materials with semantic embeddings"}
+                name=self.collection_name,
+                metadata=self.COLLECTIONS[self.collection_name]
             )
             logger.info("Collection cleared")
         except Exception as e:
@@ -256,9 +559,10 @@ class VectorStoreService:
             count = self.collection.count()
             return {
                 "total_documents": count,
-                "collection_name": "course_materials",
-                "embedding_dimension": 384,  # all-MiniLM-L6-v2
-                "model": "all-MiniLM-L6-v2"
+                "collection_name": self.collection_name,
+                "embedding_dimension": self.EMBEDDING_DIMENSION,
+                "model": self.MODEL_NAME,
+                "stores_documents": self.store_documents,
             }
         except Exception as e:
             logger.error(f"Error getting stats: {e}")
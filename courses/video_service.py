@@ -1,21 +1,28 @@
-import google.generativeai as genai
 from django.conf import settings
-import json
-import re
+from .generation_cache import GenerationCache
+from .gemini import get_model
+from .metering import track_llm_call
+from .tracing import span
+from .structured_output import VIDEO_SCENE_SCHEMA, parse_json_object
 
 class VideoService:
+    # Bump when the prompt changes so cached scripts are invalidated
+    PROMPT_VERSION = 1
+
     def __init__(self):
         self.api_key = getattr(settings, "GEMINI_API_KEY", None)
-        if self.api_key:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
-        else:
-            self.model = None
+        self.model = get_model()
 
     def generate_video_script(self, topic):
         """
-        Uses Gemini to generate a video summary storyboard.
+        Uses Gemini to generate a video summary storyboard (cached).
         """
+        return GenerationCache().get_or_generate(
+            'VIDEO', topic, lambda: self._generate_video_script(topic),
+            prompt_version=self.PROMPT_VERSION,
+        )
+
+    def _generate_video_script(self, topic):
         prompt = f"""
         Generate a video summary script and storyboard for a university student on the topic: '{topic}'.
         Return the result ONLY as a valid JSON object with the following structure:
@@ -34,16 +41,15 @@ class VideoService:
             return {"error": "Gemini API Key missing"}
 
         try:
-            response = self.model.generate_content(prompt)
-            raw_text = response.text.strip()
-            
-            # Clean up potential markdown wrapper
-            if "```json" in raw_text:
-                raw_text = raw_text.split("```json")[-1].split("```")[0].strip()
-            elif "```" in raw_text:
-                raw_text = raw_text.split("```")[-1].split("```")[0].strip()
-                
-            return json.loads(raw_text)
+            with track_llm_call('video.script') as call:
+                call.response = self.model.generate_content(prompt)
+            with span('video.parse'):
+                script = parse_json_object(call.response.text)
+                scenes = [VIDEO_SCENE_SCHEMA.validate(scene) for scene in script.get('scenes') or []]
+                script['scenes'] = [scene for scene in scenes if scene]
+            if not script['scenes']:
+                raise ValueError("Model output contained no valid scenes")
+            return script
         except Exception as e:
             error_msg = str(e)
             if "429" in error_msg:
@@ -1,12 +1,38 @@
-from django.urls import reverse_lazy
+import hashlib
+import json
+import uuid
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Prefetch, Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .models import CourseMaterial, Topic
+from .models import CourseMaterial, MaterialTag, Tag, Topic, PregeneratedContent, DigitizationJob, RelatedMaterial
 from .forms import CourseMaterialForm
-from .serializers import CourseMaterialSerializer, TopicSerializer
+from .serializers import CourseMaterialSerializer, CourseMaterialListSerializer, TopicSerializer
+from .pagination import MaterialCursorPagination
 from .rag_service import RAGService
 from .video_service import VideoService
+from .dashboard import get_dashboard_stats, get_recent_materials
+from .dedup import find_near_duplicates, material_text
+from .facets import InvalidFilter, filter_materials, material_facets
+from .graph_service import get_graph_payload
+from .rendering import RENDERER_VERSION, get_rendered_html
+from .suggest import record_query, suggest
+from .tagging import normalize_tag
+from .tracing import render_metrics
+from .circuit_breaker import OPEN, health
+from .metering import record_cache_hit
+from .tokens import estimate_tokens
+from . import background, chat
 from rest_framework import viewsets, filters, permissions
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
@@ -33,6 +59,14 @@ class MaterialCreateView(InstructorRequiredMixin, CreateView):
     template_name = "courses/manage_material_form.html"
     success_url = reverse_lazy('manage-materials')
 
+    def form_valid(self, form):
+        # Warn about near-duplicates once; resubmitting with confirm_duplicate publishes anyway
+        if not self.request.POST.get('confirm_duplicate'):
+            duplicates = find_near_duplicates(material_text(form.instance))
+            if duplicates:
+                return self.render_to_response(self.get_context_data(form=form, near_duplicates=duplicates))
+        return super().form_valid(form)
+
 class MaterialUpdateView(InstructorRequiredMixin, UpdateView):
     model = CourseMaterial
     form_class = CourseMaterialForm
@@ -49,10 +83,74 @@ class TopicViewSet(viewsets.ModelViewSet):
     serializer_class = TopicSerializer
 
 class CourseMaterialViewSet(viewsets.ModelViewSet):
+    """
+    Listing is cursor-paginated and omits ``text_content`` unless ``?include=text``
+    is passed; ``?fields=`` restricts both the columns loaded and the response.
+    """
     queryset = CourseMaterial.objects.all()
     serializer_class = CourseMaterialSerializer
+    pagination_class = MaterialCursorPagination
     filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'description', 'tags', 'topic__name', 'text_content']
+    search_fields = ['title', 'description', '=normalized_tags__name', 'topic__name', 'text_content']
+
+    def include_text(self):
+        return 'text' in self.request.query_params.get('include', '').split(',')
+
+    def get_serializer_class(self):
+        if self.action == 'list' and not self.include_text():
+            return CourseMaterialListSerializer
+        return CourseMaterialSerializer
+
+    def get_queryset(self):
+        # normalized_tags is serialized as a list of ids: one query for the page, not one per row
+        tags = Prefetch('normalized_tags', queryset=Tag.objects.only('id'))
+        queryset = CourseMaterial.objects.select_related('topic')
+        if self.action != 'list':
+            return queryset.prefetch_related(tags)
+
+        requested = self.request.query_params.get('fields')
+        if requested:
+            names = {name.strip() for name in requested.split(',')}
+            model_fields = {f.name for f in CourseMaterial._meta.concrete_fields}
+            columns = {'id'} | (names & model_fields)
+            if not self.include_text():
+                columns.discard('text_content')
+            if 'topic_name' in names:
+                columns.add('topic__name')
+            else:
+                queryset = CourseMaterial.objects.all()
+            if 'normalized_tags' in names:
+                queryset = queryset.prefetch_related(tags)
+            return queryset.only(*columns)
+
+        queryset = queryset.prefetch_related(tags)
+
+        if not self.include_text():
+            queryset = queryset.defer('text_content')
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Counts per tag, topic, week and file type for materials matching ``?q=``,
+        narrowed by any of ``?tag=&topic=&week=&file_type=&category=``.
+        """
+        try:
+            materials = filter_materials(request.query_params)
+        except InvalidFilter as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"facets": material_facets(materials)})
+
+class SuggestView(APIView):
+    """Autocomplete for ``?q=`` from the in-memory suggestion index (no database access)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 8)), 20)
+        except ValueError:
+            limit = 8
+        return Response({"suggestions": suggest(request.query_params.get('q', ''), limit)})
 
 class ChatView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -63,15 +161,15 @@ class ChatView(APIView):
         if not query:
             return Response({"error": "Query required"}, status=400)
         
-        rag = RAGService()
+        if estimate_tokens(query) > settings.CHAT_QUERY_MAX_TOKENS:
+            return Response({"error": "Query is too long"}, status=400)
         
-        if bangla_mode:
-            # Multi-mode: Explain in Bangla
-            answer = rag.provide_bangla_explanation(query)
-            return Response({"answer": answer})
-        else:
-            response = rag.generate_answer(query)
-            return Response(response)
+        record_query(query)
+        # Turns are stored per session; an unknown session_id starts a new one
+        response = chat.answer(
+            request.user, query, session_id=request.data.get('session_id'), bangla=bool(bangla_mode)
+        )
+        return Response(response)
 
 class GenerateMaterialView(APIView):
     permission_classes = [IsInstructor]
@@ -87,15 +185,10 @@ class IndexView(LoginRequiredMixin, TemplateView):
     template_name = "courses/index.html"
     
     def get_context_data(self, **kwargs):
-        from community.models import Post
         context = super().get_context_data(**kwargs)
-        context['stats'] = {
-            'topics': Topic.objects.count(),
-            'materials': CourseMaterial.objects.count(),
-            'posts': Post.objects.count(),
-            'ai_usage': 128 # Mocked cumulative AI interactions
-        }
-        context['recent_materials'] = CourseMaterial.objects.all().order_by('-id')[:6]
+        # Cached counters; see courses.dashboard
+        context['stats'] = get_dashboard_stats()
+        context['recent_materials'] = get_recent_materials()
         return context
 
 class ChatUIView(StudentRequiredMixin, TemplateView):
@@ -112,55 +205,134 @@ class QuizUIView(StudentRequiredMixin, TemplateView):
 
 class LibraryView(LoginRequiredMixin, TemplateView):
     template_name = "courses/library.html"
+    page_size = 24
 
     def get_context_data(self, **kwargs):
         category = self.kwargs.get('category', 'theory')
         context = super().get_context_data(**kwargs)
         
+        materials = CourseMaterial.objects.select_related('topic').only(
+            'id', 'title', 'description', 'file_type', 'created_at', 'topic__name'
+        ).order_by('-id')
         if category == 'lab':
             # Lab category filters for CODE files
-            materials = CourseMaterial.objects.filter(file_type='CODE')
+            materials = materials.filter(file_type='CODE')
             context['title'] = "Lab Repository (Code)"
         else:
             # Theory category filters for anything NOT CODE
-            materials = CourseMaterial.objects.exclude(file_type='CODE')
+            materials = materials.exclude(file_type='CODE')
             context['title'] = "Theory & Lecture Notes"
-            
-        context['materials'] = materials
+
+        # Search runs over the whole category, not just the page on screen
+        query = " ".join(self.request.GET.get('q', '').split())
+        if query:
+            materials = materials.filter(
+                Q(title__icontains=query) | Q(description__icontains=query)
+                | Q(id__in=MaterialTag.objects.filter(tag__name=normalize_tag(query)).values('material_id'))
+            )
+
+        # Keyset pagination: ?after=<id> continues below the last id shown
+        after = self.request.GET.get('after')
+        if after and after.isdigit():
+            materials = materials.filter(id__lt=int(after))
+
+        page = list(materials[:self.page_size + 1])
+        context['materials'] = page[:self.page_size]
+        context['next_cursor'] = page[self.page_size - 1].id if len(page) > self.page_size else None
+        context['is_first_page'] = not after
         context['category'] = category
+        context['query'] = query
         return context
 
+def related_materials(material_id, topic_id):
+    """Up to three neighbours of a material, for the detail page."""
+    # Precomputed semantic neighbours: one query on the (material, rank) index
+    related = [
+        link.related for link in RelatedMaterial.objects.filter(
+            material_id=material_id, rank__lt=3
+        ).select_related('related').only(
+            'related__id', 'related__title', 'related__file_type', 'related__updated_at'
+        ).order_by('rank')
+    ]
+    if not related:
+        # Not indexed yet: fall back to materials in the same topic
+        related = list(CourseMaterial.objects.filter(
+            topic_id=topic_id
+        ).exclude(pk=material_id).only('id', 'title', 'file_type', 'updated_at')[:3])
+    return related
+
+def material_page_state(request, pk):
+    """
+    (updated_at, related materials, fingerprint) of a material detail page, or
+    None if the material does not exist. Computed once per request and shared
+    by the conditional-request checks and the view.
+    """
+    state = getattr(request, '_material_page_state', None)
+    if state is None or state[0] != pk:
+        row = CourseMaterial.objects.filter(pk=pk).values_list('updated_at', 'topic_id').first()
+        page = None
+        if row is not None:
+            updated_at, topic_id = row
+            related = related_materials(pk, topic_id)
+            # The related list changes when neighbours are recomputed or retitled
+            fingerprint = ",".join(f"{m.id}:{int(m.updated_at.timestamp() * 1000)}" for m in related)
+            page = (max([updated_at, *(m.updated_at for m in related)]), related, fingerprint)
+        state = (pk, page)
+        request._material_page_state = state
+    return state[1]
+
+def material_etag(request, pk):
+    page = material_page_state(request, pk)
+    if page is None:
+        return None
+    updated_at, _, fingerprint = page
+    user_key = request.user.pk if request.user.is_authenticated else 0
+    related_key = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:12]
+    return f'"{pk}-{int(updated_at.timestamp() * 1000)}-{related_key}-{RENDERER_VERSION}-{user_key}"'
+
+def material_last_modified(request, pk):
+    page = material_page_state(request, pk)
+    return page[0] if page else None
+
+@method_decorator(condition(etag_func=material_etag, last_modified_func=material_last_modified), name='get')
 class MaterialDetailUIView(TemplateView):
     template_name = "courses/material_detail.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         material_id = self.kwargs.get('pk')
-        material = CourseMaterial.objects.get(pk=material_id)
+        material = get_object_or_404(CourseMaterial.objects.select_related('topic'), pk=material_id)
         context['material'] = material
-        # Fetch up to 3 related materials in the same topic, excluding the current one
-        context['related_materials'] = CourseMaterial.objects.filter(
-            topic=material.topic
-        ).exclude(pk=material_id)[:3]
+        # Markdown + math rendered server-side, stored by content hash
+        context['rendered_html'] = get_rendered_html(material.text_content)
+        page = material_page_state(self.request, material_id)
+        context['related_materials'] = page[1] if page else related_materials(material.pk, material.topic_id)
         return context
 
 class KnowledgeGraphView(StudentRequiredMixin, TemplateView):
+    """Graph data is loaded client-side from KnowledgeGraphAPI."""
     template_name = "courses/graph.html"
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        topics = Topic.objects.all()
-        nodes = []
-        links = []
-        for t in topics:
-            nodes.append({"id": t.id, "label": t.name, "type": "topic"})
-            materials = t.materials.all()
-            for m in materials:
-                nodes.append({"id": f"m{m.id}", "label": m.title, "type": "material"})
-                links.append({"source": t.id, "target": f"m{m.id}"})
-        
-        context['graph_data'] = {"nodes": nodes, "links": links}
-        return context
+class KnowledgeGraphAPI(APIView):
+    """
+    Serves the cached knowledge graph JSON, gzip'd when the client accepts it,
+    with an ETag so unchanged graphs cost a 304 and no database access.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        payload = get_graph_payload()
+        if request.headers.get('If-None-Match') == payload['etag']:
+            response = HttpResponse(status=304)
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(payload['gzip'], content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(payload['json'], content_type='application/json')
+        response['ETag'] = payload['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
 
 class FlashcardView(StudentRequiredMixin, TemplateView):
     template_name = "courses/flashcards.html"
@@ -175,14 +347,36 @@ class FlashcardGeneratorAPI(APIView):
     def post(self, request):
         topic_id = request.data.get('topic_id')
         topic = Topic.objects.get(id=topic_id)
+
+        # Serve a nightly pre-generated deck when available
+        cards = PregeneratedContent.pick_random(topic, 'FLASHCARDS', RAGService.FLASHCARDS_PROMPT_VERSION)
+        if cards:
+            record_cache_hit('pregenerated.flashcards')
+            return Response({"cards": cards})
+
         rag = RAGService()
         cards = rag.generate_flashcards(topic.name)
         return Response({"cards": cards})
 
+class FlashcardStreamAPI(APIView):
+    """Streams flashcards as NDJSON so the first card can be shown while the rest generate."""
+    permission_classes = [permissions.IsAuthenticated]
+    def post(self, request):
+        topic_id = request.data.get('topic_id')
+        topic = Topic.objects.get(id=topic_id)
+
+        cards = PregeneratedContent.pick_random(topic, 'FLASHCARDS', RAGService.FLASHCARDS_PROMPT_VERSION)
+        if cards:
+            record_cache_hit('pregenerated.flashcards')
+            return ndjson_response(cards)
+
+        rag = RAGService()
+        return ndjson_response(rag.stream_flashcards(topic.name))
+
 class DigitizerUIView(StudentRequiredMixin, TemplateView):
     template_name = "courses/digitizer.html"
 
-from .digitization import DigitizationService
+from .digitization import DigitizationService, is_stale, sweep_stale_jobs
 from rest_framework.parsers import MultiPartParser, FormParser
 
 class DigitizeNoteView(APIView):
@@ -198,6 +392,86 @@ class DigitizeNoteView(APIView):
         result = service.digitize(file_obj)
         return Response({"content": result})
 
+class DigitizationJobCreateView(APIView):
+    """
+    Accepts one or more page images and queues them for background digitization.
+    Returns a batch id to poll instead of blocking on Gemini.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request):
+        files = request.FILES.getlist('files') or request.FILES.getlist('file')
+        if not files:
+            return Response({"error": "No file provided"}, status=400)
+
+        max_pages = getattr(settings, 'DIGITIZATION_MAX_PAGES', 20)
+        if len(files) > max_pages:
+            return Response({"error": f"At most {max_pages} pages per batch"}, status=400)
+
+        batch_id = uuid.uuid4()
+        jobs = []
+        to_process = []
+        for page, file_obj in enumerate(files, start=1):
+            image_hash = DigitizationService.hash_file(file_obj)
+            job = DigitizationJob(batch_id=batch_id, page=page, user=request.user, image_hash=image_hash)
+
+            previous = DigitizationJob.objects.filter(
+                image_hash=image_hash, status='DONE'
+            ).only('content').first()
+            if previous:
+                # Identical image was already digitized: reuse the Markdown
+                job.status = 'DONE'
+                job.content = previous.content
+                job.save()
+            else:
+                job.image = file_obj
+                job.save()
+                to_process.append(job.pk)
+            jobs.append(job)
+
+        service = DigitizationService()
+        for job_id in to_process:
+            background.submit(service.process_job, job_id, key=f"digitize:{job_id}")
+
+        return Response({
+            "batch_id": str(batch_id),
+            "status_url": reverse('api_digitize_job_status', args=[batch_id]),
+            "jobs": [{"page": job.page, "status": job.status} for job in jobs],
+        }, status=202)
+
+class DigitizationJobStatusView(APIView):
+    """Polling endpoint for a digitization batch."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, batch_id):
+        batch = DigitizationJob.objects.filter(batch_id=batch_id, user=request.user).only(
+            'page', 'status', 'content', 'error', 'updated_at'
+        )
+        jobs = list(batch)
+        if not jobs:
+            return Response({"error": "Batch not found"}, status=404)
+        if any(is_stale(job) for job in jobs):
+            # Orphaned by a restart: requeue or fail them, then report the new statuses
+            sweep_stale_jobs(batch)
+            jobs = list(batch.all())
+
+        statuses = {job.status for job in jobs}
+        if statuses <= {'DONE', 'FAILED'}:
+            overall = 'FAILED' if statuses == {'FAILED'} else 'DONE'
+        else:
+            overall = 'PROCESSING'
+
+        return Response({
+            "batch_id": str(batch_id),
+            "status": overall,
+            "pages": [
+                {"page": job.page, "status": job.status, "content": job.content, "error": job.error}
+                for job in jobs
+            ],
+            "content": "\n\n---\n\n".join(job.content for job in jobs if job.status == 'DONE'),
+        })
+
 class VideoGeneratorView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request):
@@ -209,13 +483,132 @@ class VideoGeneratorView(APIView):
         result = service.generate_video_script(topic)
         return Response(result)
 
+def find_quiz_topic(topic, topic_id):
+    """
+    Match a quiz request to a known Topic (by id or exact name), if any.
+    Raises ValueError if ``topic_id`` is not an integer.
+    """
+    if topic_id not in (None, ''):
+        if isinstance(topic_id, bool):
+            raise ValueError("topic_id must be an integer")
+        try:
+            topic_id = int(topic_id)
+        except (TypeError, ValueError):
+            raise ValueError("topic_id must be an integer")
+        return Topic.objects.filter(id=topic_id).first()
+    return Topic.objects.filter(name__iexact=topic.strip()).first()
+
+def ndjson_response(items):
+    """Stream generated items as newline-delimited JSON, one object per line."""
+    def lines():
+        count = 0
+        for item in items:
+            count += 1
+            yield json.dumps({"item": item}) + "\n"
+        yield json.dumps({"done": True, "count": count}) + "\n"
+
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 class QuizGeneratorView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def post(self, request):
         topic = request.data.get('topic')
-        if not topic:
+        topic_id = request.data.get('topic_id')
+        if not topic and not topic_id:
             return Response({"error": "Topic required"}, status=400)
-        
+        if topic and not isinstance(topic, str):
+            return Response({"error": "topic must be a string"}, status=400)
+
+        # Known topics are served from the nightly pre-generated variants;
+        # free-text topics and misses fall through to on-demand generation.
+        try:
+            topic_obj = find_quiz_topic(topic, topic_id)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if not topic_obj and not topic:
+            return Response({"error": "Topic not found"}, status=404)
+        if topic_obj:
+            quiz = PregeneratedContent.pick_random(topic_obj, 'QUIZ', RAGService.QUIZ_PROMPT_VERSION)
+            if quiz:
+                record_cache_hit('pregenerated.quiz')
+                return Response(quiz)
+            topic = topic or topic_obj.name
+
         rag = RAGService()
         quiz = rag.generate_quiz(topic)
         return Response(quiz)
+
+class QuizStreamView(APIView):
+    """Same as QuizGeneratorView, but streams questions as NDJSON while they are generated."""
+    permission_classes = [permissions.IsAuthenticated]
+    def post(self, request):
+        topic = request.data.get('topic')
+        topic_id = request.data.get('topic_id')
+        if not topic and not topic_id:
+            return Response({"error": "Topic required"}, status=400)
+        if topic and not isinstance(topic, str):
+            return Response({"error": "topic must be a string"}, status=400)
+
+        try:
+            topic_obj = find_quiz_topic(topic, topic_id)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if not topic_obj and not topic:
+            return Response({"error": "Topic not found"}, status=404)
+        if topic_obj:
+            quiz = PregeneratedContent.pick_random(topic_obj, 'QUIZ', RAGService.QUIZ_PROMPT_VERSION)
+            if quiz:
+                record_cache_hit('pregenerated.quiz')
+                return ndjson_response(quiz)
+            topic = topic or topic_obj.name
+
+        rag = RAGService()
+        return ndjson_response(rag.stream_quiz(topic))
+
+def metrics_view(request):
+    """
+    Stage latency histograms in Prometheus text format.
+
+    Requires ``Authorization: Bearer <METRICS_TOKEN>`` when a token is
+    configured; without one, only staff users (or anyone when DEBUG is on).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f"Bearer {token}"):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return HttpResponse(status=401)
+        if not user.is_staff:
+            return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def healthz_view(request):
+    """
+    Liveness and dependency state for load balancers and dashboards.
+
+    503 only when the database is unreachable; open circuit breakers mean
+    degraded service (fallbacks are used), reported as status "degraded".
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        database = 'ok'
+    except DatabaseError:
+        database = 'unavailable'
+    dependencies = health()
+    if database != 'ok':
+        status = 'unavailable'
+    elif any(dependency['state'] == OPEN for dependency in dependencies.values()):
+        status = 'degraded'
+    else:
+        status = 'ok'
+    return JsonResponse(
+        {'status': status, 'database': database, 'dependencies': dependencies},
+        status=503 if status == 'unavailable' else 200,
+    )
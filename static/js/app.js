@@ -10,6 +10,52 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // Search-as-you-type suggestions for inputs marked with data-suggest
+    document.querySelectorAll('input[data-suggest]').forEach(attachSuggestions);
+
+    function attachSuggestions(input) {
+        const list = document.createElement('datalist');
+        list.id = `${input.id}-suggestions`;
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+        input.after(list);
+
+        let timer = null;
+        let controller = null;
+        let current = [];
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const term = input.value.trim();
+            const picked = current.find(s => s.text === input.value && s.url);
+            if (picked) {
+                window.location.href = picked.url;
+                return;
+            }
+            if (term.length < 2) return;
+            timer = setTimeout(async () => {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                try {
+                    const response = await fetch(`/api/suggest/?q=${encodeURIComponent(term)}`, { signal: controller.signal });
+                    if (!response.ok) return;
+                    current = (await response.json()).suggestions;
+                    list.replaceChildren(...current.map(s => {
+                        const option = document.createElement('option');
+                        option.value = s.text;
+                        option.label = s.type;
+                        return option;
+                    }));
+                } catch (error) {
+                    if (error.name !== 'AbortError') console.error('Suggest error:', error);
+                }
+            }, 120);
+        });
+    }
+
+    // Chat session: the server keeps the conversation history for follow-ups
+    let chatSessionId = null;
+
     async function sendMessage() {
         const query = chatInput.value.trim();
         if (!query) return;
@@ -35,13 +81,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 },
                 body: JSON.stringify({
                     query: query,
-                    bangla_mode: banglaMode
+                    bangla_mode: banglaMode,
+                    session_id: chatSessionId
                 })
             });
 
             const data = await response.json();
 
             chatMessages.removeChild(loadingDiv);
+            if (data.session_id) chatSessionId = data.session_id;
 
             if (data.answer) {
                 let answerHTML = `<div>${data.answer}</div>`;